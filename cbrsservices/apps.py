@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CbrsservicesConfig(AppConfig):
     name = 'cbrsservices'
+
+    def ready(self):
+        # connect the custom signal receivers (case references, case count rollups, file cleanup, etc)
+        from cbrsservices import receivers
@@ -1,4 +1,9 @@
+import secrets
+import threading
+import time
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
+from django.core import signing
 from rest_framework import authentication
 from rest_framework import exceptions
 from rest_framework import status
@@ -31,3 +36,102 @@ class AuthenticationFailed(exceptions.APIException):
     status_code = status.HTTP_403_FORBIDDEN
     default_detail = _('Incorrect authentication credentials.')
     default_code = 'authentication_failed'
+
+
+######
+#
+#  API Tokens
+#
+######
+
+
+# the salt of the API token signatures, so that no other value signed with the SECRET_KEY is a valid token
+API_TOKEN_SALT = 'cbrsservices.authentication.api_token'
+# the user fields whose change revokes the user's API tokens (the flags the tokens hold, and the password)
+API_TOKEN_USER_FIELDS = ('is_active', 'is_staff', 'is_superuser', 'password')
+
+
+def issue_token(user):
+    """
+    Returns a new signed API token for the user, and its lifetime in seconds (the API_TOKEN_MAX_AGE setting).
+    The token holds the user fields the permissions need, so that verifying it needs no query.
+    """
+    payload = {
+        'user': user.pk, 'username': user.get_username(), 'active': user.is_active, 'staff': user.is_staff,
+        'superuser': user.is_superuser, 'token': secrets.token_hex(16), 'issued': time.time(),
+    }
+    return {'token': signing.dumps(payload, salt=API_TOKEN_SALT),
+            'expires_in': getattr(settings, 'API_TOKEN_MAX_AGE', 60 * 60 * 8)}
+
+
+class TokenRevocationList(object):
+    """
+    This class will keep the revoked API tokens of this server process in memory, reading them again from the
+    database at most once per API_TOKEN_REVOCATION_REFRESH seconds, so that checking a token needs no query
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token_ids = set()
+        # the latest date (as a timestamp) each user's tokens were all revoked
+        self.users = {}
+        self.loaded = None
+
+    def refresh(self):
+        # imported here since the authentication classes are loaded with the settings, before the models are ready
+        from cbrsservices.models import RevokedToken
+        token_ids, users = set(), {}
+        for token_id, user_id, revoked_date in RevokedToken.objects.values_list('token_id', 'user', 'revoked_date'):
+            if token_id:
+                token_ids.add(token_id)
+            else:
+                revoked = revoked_date.timestamp()
+                users[user_id] = max(users.get(user_id, revoked), revoked)
+        with self.lock:
+            self.token_ids, self.users, self.loaded = token_ids, users, time.monotonic()
+
+    def clear(self):
+        """Makes the next check read the revoked tokens again (after a revocation by this process)"""
+        with self.lock:
+            self.loaded = None
+
+    def is_revoked(self, payload):
+        refresh = getattr(settings, 'API_TOKEN_REVOCATION_REFRESH', 30)
+        if self.loaded is None or time.monotonic() - self.loaded > refresh:
+            self.refresh()
+        if payload['token'] in self.token_ids:
+            return True
+        # the issued time has the same (sub-second) precision as the revoked date, so a token issued right after
+        # its user's tokens were revoked (e.g. by logging in again with a new password) stays valid
+        return payload['user'] in self.users and payload['issued'] < self.users[payload['user']]
+
+
+token_revocations = TokenRevocationList()
+
+
+class TokenAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates requests with an "Authorization: Token <token>" header holding a signed API token from the
+    authenticate endpoint, which is verified by its signature alone, instead of hashing a password every request.
+    The user is built from the token (with only its id, username, and flags), so no query is needed.
+    """
+
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header.'))
+        try:
+            # the signature is compared in constant time, and tokens older than the max age are rejected
+            payload = signing.loads(auth[1].decode(), salt=API_TOKEN_SALT,
+                                    max_age=getattr(settings, 'API_TOKEN_MAX_AGE', 60 * 60 * 8))
+        except (signing.BadSignature, UnicodeError):
+            raise AuthenticationFailed(_('Invalid or expired token.'))
+        if not payload['active'] or token_revocations.is_revoked(payload):
+            raise AuthenticationFailed(_('Token revoked or user inactive.'))
+        user = get_user_model()(pk=payload['user'], username=payload['username'], is_active=payload['active'],
+                                is_staff=payload['staff'], is_superuser=payload['superuser'])
+        return (user, payload)
@@ -122,6 +122,44 @@ fieldoffice = ModelFieldDescriptions({
     'state': 'An alphanumeric value of the state in which the field office is located'
 })
 
+casecountrollup = ModelFieldDescriptions({
+    'status': 'An alphanumeric value of the status of the counted cases (e.g. "Final", "Awaiting QC", etc)',
+    'cbrs_unit': 'A foreign key integer value identifying the cbrs unit of the counted cases',
+    'fiscal_year': 'A numeric value of the fiscal year in which the counted cases were requested',
+    'count': 'A numeric value of the number of cases with this status, cbrs unit, and fiscal year',
+    'key': 'An alphanumeric value of the status, cbrs unit, and fiscal year of the counted cases, unique even when '
+           'the cbrs unit or fiscal year is null'
+})
+
+casesearchdocument = ModelFieldDescriptions({
+    'case': 'A foreign key integer value identifying the case this search document describes',
+    'reference': 'The lowercase case reference of the case',
+    'unit_name': 'The lowercase name of the cbrs unit of the case',
+    'address': 'The lowercase street, unit, and city of the property of the case',
+    'policy_number': 'The lowercase policy number of the property of the case',
+    'analyst': 'The lowercase username, first name, and last name of the analyst of the case',
+    'document': 'All of the searchable values of the case, lowercase and separated by newlines'
+})
+
+finalemail = ModelFieldDescriptions({
+    'case': 'A foreign key integer value identifying the case whose final email this is',
+    'status': 'An alphanumeric value of the delivery status of the final email ("Queued", "Sending", "Sent", or "Failed")',
+    'attempts': 'A numeric value of the number of times sending the final email has been attempted',
+    'next_attempt_date': 'The date and time after which the final email will be sent (or sent again)',
+    'last_attempt_date': 'The date and time sending the final email was last attempted',
+    'sent_date': 'The date and time the final email was sent',
+    'last_error': 'An alphanumeric value of the error of the last failed attempt to send the final email',
+    'created_date': 'The date and time the final email was queued',
+    'created_by': 'A foreign key integer value identifying the user who queued the final email'
+})
+
+revokedtoken = ModelFieldDescriptions({
+    'token_id': 'An alphanumeric value identifying the revoked API token (blank to revoke every token of the user)',
+    'user': 'A foreign key integer value identifying the user whose API token (or tokens) are revoked',
+    'revoked_date': 'The date and time the API token (or tokens) were revoked',
+    'expires_date': 'The date and time after which the revoked API token (or tokens) would have expired anyway'
+})
+
 history = ModelFieldDescriptions({
     'created_date': 'The date this object was created in "YYYY-MM-DD" format',
     'created_by': 'A foreign key integer value identifying the user who created the object',
@@ -139,8 +177,12 @@ user = ModelFieldDescriptions({
 })
 
 queryparams = ModelFieldDescriptions({
-    'format': 'An alphanumeric value of the desired format of the document (e.g. "docx" or "csv")',
+    'format': 'An alphanumeric value of the desired format of the document (e.g. "docx", "pdf", or "csv")',
     'view': 'An alphanumeric value of the view (e.g. "workbench", "report" or "caseid")',
+    'stream': 'A boolean value (true) indicating whether to stream a CSV export of all matching records instead of one page',
+    'pagination': 'An alphanumeric value of the pagination to use ("keyset" to page by cursor instead of page number)',
+    'cursor': 'An opaque alphanumeric value of the page to return with keyset pagination, taken from the next or previous link',
+    'ordering': 'An alphanumeric value of the order of records with keyset pagination ("id", "-id", "request_date", or "-request_date")',
     'request_date_after': 'A date string in "YYYY-MM-DD" format of the date after which you want all returned requests to have been created',
     'request_date_before': 'A date string in "YYYY-MM-DD" format of the date before which you want all returned requests to have been created',
     'distance_from': 'A numeric value of the minimum distance you want the request to be from a system unit',
@@ -150,6 +192,14 @@ queryparams = ModelFieldDescriptions({
     'case': 'A foreign key integer value identifying a case',
     'report': 'An alphanumeric value of the report to be produced (e.g. "casesbyunit", "daystoresolution", etc.)',
     'user': "An alphanumeric value of the username to filter for",
-    'used_users': 'A boolean value (True) identifying whether to return only formerly and currently active users'
+    'used_users': 'A boolean value (True) identifying whether to return only formerly and currently active users',
+    'group_by': 'An alphanumeric value of the field to break down the case counts or days summaries by ("cbrs_unit", "analyst", or "fiscal_year")',
+    'date_field': 'An alphanumeric value of the date field of the case to filter by with from_date and to_date (e.g. "close_date")',
+    'from_date': 'A date string in "YYYY-MM-DD" format of the date after which the date_field of the returned cases must be',
+    'to_date': 'A date string in "YYYY-MM-DD" format of the date before which the date_field of the returned cases must be',
+    'days_field': 'An alphanumeric value of the days to a stage to filter by ("analyst_days", "qc_reviewer_days", "final_letter_days", or "close_days")',
+    'min_days': 'A numeric value of the minimum days to the stage named by days_field',
+    'max_days': 'A numeric value of the maximum days to the stage named by days_field',
+    'sort_by': 'An alphanumeric value of the days to a stage to sort by (e.g. "close_days", or "-close_days" for descending)'
 })
 
@@ -1,58 +1,162 @@
+from datetime import date
+from django.core.exceptions import FieldDoesNotExist
+from django.core.validators import RegexValidator
+from django.db.models import Q
+from django.db.models.fields import DateField
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, NumberFilter, CharFilter, BooleanFilter, ModelMultipleChoiceFilter
+from django_filters.rest_framework import BaseInFilter, ChoiceFilter, DateFilter
 from cbrsservices.models import *
 from cbrsservices.field_descriptions import *
 
 
 # TODO: edit field descriptions of items that allow multiple inputs via comma separated lists (e.g. case_number), can't have spaces
-# Also, if Aaron gives the go-ahead, we can remove a lot of the filtering done in the get_queryset method, because we're doing that here by
-# specifying what the lookup_exr and field_names are, e.g. BooleanFilter(field_name='priority', lookup_expr='exact') does the same as
-# queryset.filter(priority__exact=priority) and we can also create methods for more complex filters or those that aren't model fields
-class CaseFilter(FilterSet):
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    """
+    Filter by a comma separated list of numbers (e.g. "1,2,3")
+    """
+    pass
+
+
+class CharInFilter(BaseInFilter, CharFilter):
+    """
+    Filter by a comma separated list of values (e.g. "a,b,c")
+    """
+    pass
+
+
+# the filter method result that matches no records
+NO_RECORDS = Q(pk__in=[])
+
+
+class QueryFilterSet(FilterSet):
+    """
+    This class will validate the types of all of the URL arguments up front (an invalid value is a 400 response),
+    and then compile them into a single Q object, which is applied with a single filter call, so that the joins
+    needed by several arguments are made only once, and distinct is applied only when one of those joins is to a
+    multi-valued relation (which could repeat records).
+    Filters with a field_name and lookup_expr become lookups of the Q object, and filter methods return either a Q
+    object to add to it, or (for arguments that are not filters, like an ordering) the queryset itself.
+    """
+
+    def nonModelValue(self, queryset, value, *args):
+        return queryset
+
+    def filter_queryset(self, queryset):
+        query = Q()
+        for name, value in self.form.cleaned_data.items():
+            if value in EMPTY_VALUES:
+                continue
+            filter_ = self.filters[name]
+            if filter_.method is not None:
+                result = filter_.filter(queryset, value)
+                if isinstance(result, Q):
+                    query &= result
+                else:
+                    queryset = result
+            else:
+                lookup = Q(**{'%s__%s' % (filter_.field_name, filter_.lookup_expr): value})
+                query &= ~lookup if filter_.exclude else lookup
+        if query:
+            queryset = queryset.filter(query)
+            if self.is_multi_valued(queryset.model, query):
+                queryset = queryset.distinct()
+        return queryset
+
+    @classmethod
+    def is_multi_valued(cls, model, query):
+        """Returns True if any lookup of the Q object joins a many-to-many or reverse foreign key relation"""
+        for child in query.children:
+            if isinstance(child, Q):
+                if cls.is_multi_valued(model, child):
+                    return True
+                continue
+            related_model = model
+            for part in child[0].split('__'):
+                try:
+                    field = related_model._meta.get_field(part)
+                except FieldDoesNotExist:
+                    # an annotation, transform, or lookup ends the relation path
+                    break
+                if not field.is_relation:
+                    break
+                if field.many_to_many or field.one_to_many:
+                    return True
+                related_model = field.related_model
+        return False
+
+
+# the date fields of cases that reports can be filtered by
+CASE_DATE_FIELDS = [(field.name, field.name) for field in Case._meta.get_fields() if isinstance(field, DateField)]
+
+
+class CaseFilter(QueryFilterSet):
     format = CharFilter(method='nonModelValue', label=queryparams.format)
     view = CharFilter(method='nonModelValue', label=queryparams.view)
-    case_reference = CharFilter(method='nonModelValue', label=case.case_reference)
-    property = CharFilter(method='nonModelValue', label=case.property)
-    requester = CharFilter(method='nonModelValue', label=case.requester)
-    status = CharFilter(method='nonModelValue', label=case.status)
-    case_number = CharFilter(method='nonModelValue', label=case.case_number)
-    request_date_after = CharFilter(method='nonModelValue', label=queryparams.request_date_after)
-    request_date_before = CharFilter(method='nonModelValue', label=queryparams.request_date_before)
-    distance_from = NumberFilter(method='nonModelValue', label=queryparams.distance_from)
-    distance_to = NumberFilter(method='nonModelValue', label=queryparams.distance_to)
-    analyst = CharFilter(field_name='analyst', lookup_expr='exact', label=case.analyst)
-    qc_reviewer = CharFilter(field_name='qc_reviewer', lookup_expr='exact', label=case.qc_reviewer)
-    cbrs_unit = CharFilter(field_name='cbrs_unit', lookup_expr='exact', label=case.cbrs_unit)
-    street = CharFilter(method='nonModelValue', label=address.street)
-    city = CharFilter(method='nonModelValue', label=address.city)
-    policy_number = CharFilter(field_name='policy_number', lookup_expr='in', label=address.policy_number)
-    tags = CharFilter(field_name='tags', lookup_expr='exact', label=case.tags)
+    stream = CharFilter(method='nonModelValue', label=queryparams.stream)
+    pagination = CharFilter(method='nonModelValue', label=queryparams.pagination)
+    cursor = CharFilter(method='nonModelValue', label=queryparams.cursor)
+    ordering = CharFilter(method='nonModelValue', label=queryparams.ordering)
+    case_reference = CharInFilter(field_name='case_reference', lookup_expr='in', label=case.case_reference)
+    property = NumberFilter(field_name='property', lookup_expr='exact', label=case.property)
+    requester = NumberFilter(field_name='requester', lookup_expr='exact', label=case.requester)
+    status = ChoiceFilter(method='filter_status', choices=[(status, status) for status in CASE_STATUS_FILTERS],
+                          label=case.status)
+    case_number = NumberInFilter(field_name='id', lookup_expr='in', label=case.case_number)
+    # the date and distance ranges are exclusive
+    request_date_after = DateFilter(field_name='request_date', lookup_expr='gt', label=queryparams.request_date_after)
+    request_date_before = DateFilter(field_name='request_date', lookup_expr='lt', label=queryparams.request_date_before)
+    distance_from = NumberFilter(field_name='distance', lookup_expr='gt', label=queryparams.distance_from)
+    distance_to = NumberFilter(field_name='distance', lookup_expr='lt', label=queryparams.distance_to)
+    analyst = NumberInFilter(field_name='analyst', lookup_expr='in', label=case.analyst)
+    qc_reviewer = NumberInFilter(field_name='qc_reviewer', lookup_expr='in', label=case.qc_reviewer)
+    cbrs_unit = NumberInFilter(field_name='cbrs_unit', lookup_expr='in', label=case.cbrs_unit)
+    street = CharFilter(field_name='property__street', lookup_expr='icontains', label=address.street)
+    city = CharFilter(field_name='property__city', lookup_expr='icontains', label=address.city)
+    policy_number = CharInFilter(field_name='property__policy_number', lookup_expr='in', label=address.policy_number)
+    tags = NumberInFilter(field_name='tags', lookup_expr='in', label=case.tags)
     priority = BooleanFilter(field_name='priority', lookup_expr='exact', label=case.priority)
     on_hold = BooleanFilter(field_name='on_hold', lookup_expr='exact', label=case.on_hold)
     invalid = BooleanFilter(field_name='invalid', lookup_expr='exact', label=case.invalid)
     hard_copy_map_reviewed = BooleanFilter(field_name='hard_copy_map_reviewed', lookup_expr='exact', label=case.hard_copy_map_reviewed)
-    duplicate = CharFilter(field_name='duplicate', lookup_expr='exact', label=case.duplicate)
-    fiscal_year = CharFilter(method='nonModelValue', label=queryparams.fiscal_year)
-    freetext = CharFilter(method='nonModelValue', label=queryparams.freetext)
+    duplicate = CharFilter(method='filter_duplicate', label=case.duplicate,
+                           validators=[RegexValidator(r'^(\d+|none)$', 'Enter a case ID or "none".')])
+    fiscal_year = NumberFilter(method='filter_fiscal_year', label=queryparams.fiscal_year)
+    freetext = CharFilter(method='filter_freetext', label=queryparams.freetext)
 
+    def filter_status(self, queryset, name, value):
+        return CASE_STATUS_FILTERS[value]
 
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+    # also include the original case, per cooperator request
+    def filter_duplicate(self, queryset, name, value):
+        if value == 'none':
+            return Q(duplicate__isnull=True)
+        return Q(id__exact=value) | Q(duplicate__exact=value)
+
+    def filter_fiscal_year(self, queryset, name, value):
+        return Q(request_date__gte=date(int(value) - 1, 10, 1), request_date__lte=date(int(value), 9, 30))
+
+    # case-insensitive contain, best matches first
+    def filter_freetext(self, queryset, name, value):
+        return queryset.search(value).order_by('-search_rank', 'id')
 
     class Meta:
         model = Case
-        fields = ['format', 'view', 'case_reference', 'property', 'requester', 'status', 'case_number', 'request_date_after', 'request_date_before',
+        fields = ['format', 'view', 'stream', 'pagination', 'cursor', 'ordering', 'case_reference', 'property', 'requester', 'status', 'case_number', 'request_date_after', 'request_date_before',
             'distance_from', 'distance_to', 'analyst', 'qc_reviewer', 'cbrs_unit', 'street', 'city', 'policy_number', 'tags',
             'priority', 'on_hold', 'invalid', 'hard_copy_map_reviewed', 'duplicate', 'fiscal_year', 'freetext']
 
-class CaseFileFilter(FilterSet):
+class CaseFileFilter(QueryFilterSet):
     case = NumberFilter(field_name='case', lookup_expr='exact', label=casefile.case)
 
     class Meta:
         model = CaseFile
         fields = ['case']
 
-class PropertyFilter(FilterSet):
-    case = NumberFilter(method='nonModelValue', label=queryparams.case)
+class PropertyFilter(QueryFilterSet):
+    case = NumberFilter(field_name='cases', lookup_expr='exact', label=queryparams.case)
     street = CharFilter(field_name='street', lookup_expr='exact', label=address.street)
     unit = CharFilter(field_name='unit', lookup_expr='exact', label=address.unit)
     city = CharFilter(field_name='city', lookup_expr='exact', label=address.city)
@@ -60,16 +164,13 @@ class PropertyFilter(FilterSet):
     zipcode = CharFilter(field_name='zipcode', lookup_expr='exact', label=address.zipcode)
     legal_description = CharFilter(field_name='legal_description', lookup_expr='exact', label=address.legal_description)
 
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
-
     class Meta:
         model = Property
         fields = ['case', 'street', 'unit', 'city', 'state', 'zipcode', 'legal_description']
 
 
-class RequesterFilter(FilterSet):
-    case = NumberFilter(method='nonModelValue', label=queryparams.case)
+class RequesterFilter(QueryFilterSet):
+    case = NumberFilter(field_name='cases', lookup_expr='exact', label=queryparams.case)
     salutation = CharFilter(field_name='salutation', lookup_expr='exact', label=requester.salutation)
     first_name = CharFilter(field_name='first_name', lookup_expr='exact', label=requester.first_name)
     last_name = CharFilter(field_name='last_name', lookup_expr='exact', label=requester.last_name)
@@ -81,33 +182,27 @@ class RequesterFilter(FilterSet):
     state = CharFilter(field_name='state', lookup_expr='exact', label=address.state)
     zipcode = CharFilter(field_name='zipcode', lookup_expr='exact', label=address.zipcode)
 
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
-
     class Meta:
         model = Requester
         fields = ['case', 'salutation', 'first_name', 'last_name', 'organization', 'email', 'street', 'unit', 'city', 'state', 'zipcode']
 
 
-class CaseTagFilter(FilterSet):
+class CaseTagFilter(QueryFilterSet):
     case = NumberFilter(field_name='case', lookup_expr='exact', label=queryparams.case)
 
     class Meta:
         model = CaseTag
         fields = ['case']
 
-class TagFilter(FilterSet):
+class TagFilter(QueryFilterSet):
     name = CharFilter(field_name='name', lookup_expr='exact', label=casetag.name)
 
     class Meta:
         model = Tag
         fields = ['name']
 
-class CommentFilter(FilterSet):
-    case = NumberFilter(method='nonModelValue', label=queryparams.case)
-
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+class CommentFilter(QueryFilterSet):
+    case = NumberFilter(field_name='acase', lookup_expr='exact', label=queryparams.case)
 
     class Meta:
         model = Comment
@@ -119,81 +214,183 @@ class DeterminationFilter(FilterSet):
         model = Determination
         fields = []
 
-class SystemUnitFilter(FilterSet):
-    freetext = CharFilter(method='nonModelValue', label=queryparams.freetext)
+class SystemUnitFilter(QueryFilterSet):
+    freetext = CharFilter(method='filter_freetext', label=queryparams.freetext)
 
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+    # case-insensitive contain
+    def filter_freetext(self, queryset, name, value):
+        return (Q(system_unit_number__icontains=value) |
+                Q(system_unit_name__icontains=value) |
+                Q(field_office__field_office_number__icontains=value) |
+                Q(system_unit_type__unit_type__icontains=value) |
+                Q(field_office__field_office_name__icontains=value))
 
     class Meta:
         model = SystemUnit
         fields = ['freetext']
 
-class SystemUnitProhibitionDateFilter(FilterSet):
-    unit = NumberFilter(method='nonModelValue', label=prohibitiondate.system_unit)
-    freetext = CharFilter(method='nonModelValue', label=queryparams.freetext)
-
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+class SystemUnitProhibitionDateFilter(QueryFilterSet):
+    unit = NumberFilter(field_name='system_unit', lookup_expr='exact', label=prohibitiondate.system_unit)
+    freetext = CharFilter(method='filter_freetext', label=queryparams.freetext)
+
+    # a value with a slash is compared to the month, day, and year of the prohibition date ("11/", "11/16", "11/16/90"),
+    # and anything else to the system unit number (case-insensitive contain)
+    def filter_freetext(self, queryset, name, value):
+        if '/' not in value:
+            return Q(system_unit__system_unit_number__icontains=value)
+        # only perform date comparisons if all date parts are integers
+        date_parts = value.strip('/').split('/')
+        if not all(date_part.isdecimal() for date_part in date_parts):
+            return NO_RECORDS
+        # month
+        if len(date_parts) == 1:
+            if len(date_parts[0]) > 2:
+                return NO_RECORDS
+            return Q(prohibition_date__month=int(date_parts[0]))
+        # day
+        elif len(date_parts) == 2:
+            if len(date_parts[1]) > 2:
+                return NO_RECORDS
+            return Q(prohibition_date__month=int(date_parts[0]), prohibition_date__day=int(date_parts[1]))
+        # year
+        elif len(date_parts) == 3:
+            year_places = len(date_parts[2])
+            year_int = int(date_parts[2])
+            year_part = None
+            if year_places == 1:
+                year_part = 2000 + year_int
+            elif year_places == 2:
+                year_part = 1900 + year_int if 99 >= year_int >= 83 else 2000 + year_int
+            elif year_places == 4:
+                year_part = year_int
+            # cannot filter on a three digit year
+            if not year_part:
+                return NO_RECORDS
+            return Q(prohibition_date__month=int(date_parts[0]), prohibition_date__day=int(date_parts[1]),
+                     prohibition_date__year=year_part)
+        return NO_RECORDS
 
     class Meta:
         model = SystemUnitProhibitionDate
         fields = ['unit', 'freetext']
 
-class SystemUnitMapFilter(FilterSet):
-    unit = NumberFilter(method='nonModelValue', label=systemunitmap.system_unit)
-    map = NumberFilter(method='nonModelValue', label=systemunitmap.system_map)
-
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+class SystemUnitMapFilter(QueryFilterSet):
+    unit = NumberFilter(field_name='system_unit', lookup_expr='exact', label=systemunitmap.system_unit)
+    map = NumberFilter(field_name='system_map', lookup_expr='exact', label=systemunitmap.system_map)
 
     class Meta:
         model = SystemUnitMap
         fields = ['unit', 'map']
 
-class SystemMapFilter(FilterSet):
-    unit = NumberFilter(method='nonModelValue', label=systemunitmap.system_unit)
-    freetext = CharFilter(method='nonModelValue', label=queryparams.freetext)
+class SystemMapFilter(QueryFilterSet):
+    unit = NumberFilter(field_name='system_units', lookup_expr='exact', label=systemunitmap.system_unit)
+    freetext = CharFilter(method='filter_freetext', label=queryparams.freetext)
 
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+    # case-insensitive contain
+    def filter_freetext(self, queryset, name, value):
+        return (Q(system_units__system_unit_number__icontains=value) |
+                Q(map_number__icontains=value) |
+                Q(map_title__icontains=value) |
+                Q(effective__icontains=value) |
+                Q(map_date__icontains=value))
 
     class Meta:
         model = SystemMap
         fields = ['unit', 'freetext']
 
 
-class ReportCaseFilter(FilterSet):
+class ReportCaseFilter(QueryFilterSet):
     format = CharFilter(method='nonModelValue', label=queryparams.format)
-    report = CharFilter(field_name='report', lookup_expr='exact', label=queryparams.report)
-    cbrs_unit = NumberFilter(field_name='cbrs_unit', lookup_expr='exact', label=case.cbrs_unit)
-    user = CharFilter(field_name='user', lookup_expr='exact', label=queryparams.user)
+    report = CharFilter(method='nonModelValue', label=queryparams.report)
+    stream = CharFilter(method='nonModelValue', label=queryparams.stream)
+    pagination = CharFilter(method='nonModelValue', label=queryparams.pagination)
+    cursor = CharFilter(method='nonModelValue', label=queryparams.cursor)
+    ordering = CharFilter(method='nonModelValue', label=queryparams.ordering)
+    cbrs_unit = NumberInFilter(field_name='cbrs_unit', lookup_expr='in', label=case.cbrs_unit)
+    user = CharFilter(method='filter_user', label=queryparams.user)
+    date_field = ChoiceFilter(method='nonModelValue', choices=CASE_DATE_FIELDS, label=queryparams.date_field)
+    from_date = DateFilter(method='filter_date_range', label=queryparams.from_date)
+    to_date = DateFilter(method='filter_date_range', label=queryparams.to_date)
+    days_field = ChoiceFilter(method='nonModelValue', choices=[(name, name) for name, field in CASE_DAYS],
+                              label=queryparams.days_field)
+    min_days = NumberFilter(method='filter_days_range', label=queryparams.min_days)
+    max_days = NumberFilter(method='filter_days_range', label=queryparams.max_days)
+    sort_by = CharFilter(method='nonModelValue', label=queryparams.sort_by)
+
+    def filter_user(self, queryset, name, value):
+        return Q(analyst__username__iexact=value) | Q(qc_reviewer__username__iexact=value)
+
+    # the date range (from_date only, to_date only, or both) of the date_field of the daystoeachstatus report, exclusive
+    def filter_date_range(self, queryset, name, value):
+        date_field = self.form.cleaned_data.get('date_field', None)
+        if date_field in EMPTY_VALUES or self.form.cleaned_data.get('report', None) != 'daystoeachstatus':
+            return Q()
+        return Q(**{date_field + ('__gt' if name == 'from_date' else '__lt'): value})
+
+    # the range (min_days only, max_days only, or both) of the days to the stage named by days_field, inclusive
+    def filter_days_range(self, queryset, name, value):
+        days_field = self.form.cleaned_data.get('days_field', None)
+        if days_field in EMPTY_VALUES:
+            return Q()
+        return Q(**{days_field + ('__gte' if name == 'min_days' else '__lte'): int(value)})
+
+    class Meta:
+        model = ReportCase
+        fields = ['format', 'report', 'stream', 'pagination', 'cursor', 'ordering', 'cbrs_unit', 'user', 'date_field',
+                  'from_date', 'to_date', 'days_field', 'min_days', 'max_days', 'sort_by']
+
+class ReportCaseCountFilter(FilterSet):
+    format = CharFilter(method='nonModelValue', label=queryparams.format)
+    group_by = CharFilter(method='nonModelValue', label=queryparams.group_by)
 
     def nonModelValue(self, queryset, value, *args):
         return queryset
 
     class Meta:
         model = ReportCase
-        fields = ['format', 'report', 'cbrs_unit', 'user']
+        fields = ['format', 'group_by']
 
-class ReportCaseCountFilter(FilterSet):
+class ReportCaseDaysFilter(FilterSet):
     format = CharFilter(method='nonModelValue', label=queryparams.format)
+    group_by = CharFilter(method='nonModelValue', label=queryparams.group_by)
 
     def nonModelValue(self, queryset, value, *args):
         return queryset
 
     class Meta:
         model = ReportCase
-        fields = ['format']
+        fields = ['format', 'group_by']
+
+class FinalEmailFilter(FilterSet):
+    case = NumberFilter(field_name='case', lookup_expr='exact', label=queryparams.case)
+    status = CharFilter(field_name='status', lookup_expr='exact', label=finalemail.status)
+
+    class Meta:
+        model = FinalEmail
+        fields = ['case', 'status']
 
-class UserFilter(FilterSet):
+class UserFilter(QueryFilterSet):
     username = CharFilter(field_name='username', lookup_expr='exact', label=user.username)
     is_active = BooleanFilter(field_name='is_active', lookup_expr='exact', label=user.is_active)
-    used_users = CharFilter(method='nonModelValue', label=queryparams.used_users)
-    freetext = CharFilter(method='nonModelValue', label=queryparams.freetext)
-
-    def nonModelValue(self, queryset, value, *args):
-        return queryset
+    used_users = CharFilter(method='filter_used_users', label=queryparams.used_users)
+    freetext = CharFilter(method='filter_freetext', label=queryparams.freetext)
+
+    # the current active users and the users that were ever an analyst or reviewer of a case, whether active or not
+    def filter_used_users(self, queryset, name, value):
+        return (Q(is_active__exact=True) |
+                Q(id__in=Case.objects.values('analyst')) |
+                Q(id__in=Case.objects.values('qc_reviewer')) |
+                Q(id__in=Case.objects.values('fws_reviewer')))
+
+    # case-insensitive contain
+    def filter_freetext(self, queryset, name, value):
+        return (Q(first_name__icontains=value) |
+                Q(last_name__icontains=value) |
+                Q(email__icontains=value) |
+                Q(is_active__icontains=value) |
+                Q(is_superuser__icontains=value) |
+                Q(is_staff__icontains=value) |
+                Q(username__icontains=value))
 
     class Meta:
         model = User
@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from django.db import transaction
+from django.db.models import Q
+from django.contrib.auth.models import User
+from rest_framework import serializers
+from cbrsservices.models import *
+from cbrsservices.serializers import CaseSerializer, PropertySerializer, RequesterSerializer
+
+
+########################################################################################################################
+#
+#  Bulk imports read many records from an uploaded file and write them with a few bulk queries,
+#  instead of one request (and one set of signal receivers and history inserts) per record.
+#
+########################################################################################################################
+
+
+######
+#
+#  Cases
+#
+######
+
+
+class CaseImport(object):
+    """
+    This class will create many cases at once from CSV or JSON lines rows, validating each row with the same field
+    and date/user rules as the case serializer, reusing existing requesters and properties (matched on their unique
+    fields) or creating new ones, and writing the cases, their history records, and their search documents
+    with bulk inserts.
+    Rows that fail validation are not imported, and are reported by row number with their errors.
+    """
+
+    # the related records a case row may refer to by id, and the model each id must exist in
+    related_models = {'duplicate': Case, 'cbrs_unit': SystemUnit, 'map_number': SystemMap,
+                      'determination': Determination, 'analyst': User, 'qc_reviewer': User, 'fws_reviewer': User}
+    # the address records a case row may refer to by id, or describe with prefixed columns (e.g. property_street)
+    address_serializers = {'property': PropertySerializer, 'requester': RequesterSerializer}
+    batch_size = 500
+
+    def __init__(self, user=None):
+        self.user = user
+        self.errors = []
+        self.cases = []
+        self.case_fields = {name: field for name, field in CaseSerializer().fields.items()
+                            if not field.read_only and not isinstance(field, serializers.RelatedField)
+                            and name != 'case_reference'}
+        self.address_fields = {prefix: {name: field for name, field in serializer().fields.items()
+                                        if not field.read_only and name != 'id'}
+                               for prefix, serializer in self.address_serializers.items()}
+
+    def read(self, content, content_format='jsonl'):
+        """Returns a list of (row number, row) pairs read from CSV (with a header line) or JSON lines text"""
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        if content_format == 'csv':
+            return list(enumerate(csv.DictReader(io.StringIO(content)), start=1))
+        rows = []
+        for number, line in enumerate(content.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                self.errors.append({'row': number, 'errors': {'non_field_errors': ['Invalid JSON: ' + str(e)]}})
+                continue
+            if not isinstance(row, dict):
+                self.errors.append({'row': number, 'errors': {'non_field_errors': ['Expected a JSON object.']}})
+                continue
+            rows.append((number, row))
+        return rows
+
+    @staticmethod
+    def _is_blank(value):
+        return value is None or value == ''
+
+    def _to_pk(self, value, errors, name):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            message = serializers.PrimaryKeyRelatedField.default_error_messages['incorrect_type']
+            errors[name] = [message.format(data_type=type(value).__name__)]
+
+    def clean(self, row):
+        """Returns the validated case values, address values, and errors of a row"""
+        values = {}
+        addresses = {}
+        errors = {}
+
+        for name, field in self.case_fields.items():
+            if not self._is_blank(row.get(name)):
+                try:
+                    values[name] = field.run_validation(row[name])
+                except serializers.ValidationError as e:
+                    errors[name] = e.detail
+
+        for name in self.related_models:
+            if not self._is_blank(row.get(name)):
+                values[name] = self._to_pk(row[name], errors, name)
+
+        for prefix, fields in self.address_fields.items():
+            value = row.get(prefix)
+            if isinstance(value, dict):
+                row = dict(row, **{prefix + '_' + name: field_value for name, field_value in value.items()})
+            elif not self._is_blank(value):
+                values[prefix] = self._to_pk(value, errors, prefix)
+                continue
+            if not any(not self._is_blank(row.get(prefix + '_' + name)) for name in fields):
+                errors[prefix] = [serializers.Field.default_error_messages['required']]
+                continue
+            address = {}
+            for name, field in fields.items():
+                field_value = row.get(prefix + '_' + name)
+                if self._is_blank(field_value):
+                    # use the same empty value the model stores, so the unique fields match existing records
+                    address[name] = None if field.allow_null else ''
+                    continue
+                try:
+                    address[name] = field.run_validation(field_value)
+                except serializers.ValidationError as e:
+                    errors[prefix + '_' + name] = e.detail
+            addresses[prefix] = address
+
+        if not errors:
+            try:
+                CaseSerializer.validate_case_rules(values)
+            except serializers.ValidationError as e:
+                errors['non_field_errors'] = e.detail
+        return values, addresses, errors
+
+    def check_related(self, cleaned):
+        """Adds an error to each cleaned row that refers to a record that does not exist, using one query per model"""
+        models_ids = {}
+        for number, values, addresses, errors in cleaned:
+            for name, model in dict(self.related_models, property=Property, requester=Requester).items():
+                if values.get(name) is not None:
+                    models_ids.setdefault(model, set()).add(values[name])
+        existing = {}
+        for model, ids in models_ids.items():
+            ids = list(ids)
+            existing[model] = set()
+            for start in range(0, len(ids), self.batch_size):
+                existing[model].update(model.objects.filter(
+                    pk__in=ids[start:start + self.batch_size]).values_list('pk', flat=True))
+        message = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        for number, values, addresses, errors in cleaned:
+            for name, model in dict(self.related_models, property=Property, requester=Requester).items():
+                if values.get(name) is not None and values[name] not in existing[model]:
+                    errors[name] = [message.format(pk_value=values[name])]
+
+    def find_addresses(self, model, keys):
+        """Returns a dict of the ids of the existing records of the model that match the given unique field values"""
+        fields = model._meta.unique_together[0]
+        # look up by the unique field with the most distinct values, then match the rest of the fields in python
+        index = max(range(len(fields)), key=lambda i: len({key[i] for key in keys}))
+        values = list({key[index] for key in keys})
+        found = {}
+        for start in range(0, len(values), self.batch_size):
+            chunk = values[start:start + self.batch_size]
+            query = Q(**{fields[index] + '__in': [value for value in chunk if value is not None]})
+            if None in chunk:
+                query |= Q(**{fields[index] + '__isnull': True})
+            for record in model.objects.filter(query).order_by('id').values_list('id', *fields):
+                if record[1:] in keys:
+                    found.setdefault(record[1:], record[0])
+        return found
+
+    def create_history(self, model, ids):
+        """Creates the history records of newly created records of the model"""
+        ids = list(ids)
+        for start in range(0, len(ids), self.batch_size):
+            records = list(model.objects.filter(id__in=ids[start:start + self.batch_size]))
+            for record in records:
+                record._history_user = self.user
+            model.history.bulk_history_create(records, batch_size=self.batch_size)
+
+    def get_address_ids(self, model, addresses):
+        """Returns a dict of record ids keyed by unique field values, creating the records that do not exist yet"""
+        fields = model._meta.unique_together[0]
+        addresses = {tuple(address[field] for field in fields): address for address in addresses}
+        ids = self.find_addresses(model, set(addresses))
+        missing = [key for key in addresses if key not in ids]
+        if missing:
+            model.objects.bulk_create([model(created_by=self.user, modified_by=self.user, **addresses[key])
+                                       for key in missing], batch_size=self.batch_size)
+            created = self.find_addresses(model, set(missing))
+            self.create_history(model, created.values())
+            ids.update(created)
+        return ids
+
+    def run(self, rows, dry_run=False):
+        """Validates and (unless dry_run is true) creates the cases of the given (row number, row) pairs"""
+        cleaned = []
+        for number, row in rows:
+            values, addresses, errors = self.clean(row)
+            cleaned.append((number, values, addresses, errors))
+        self.check_related(cleaned)
+        valid = [(number, values, addresses) for number, values, addresses, errors in cleaned if not errors]
+        self.errors.extend({'row': number, 'errors': errors} for number, values, addresses, errors in cleaned if errors)
+        self.errors.sort(key=lambda error: error['row'])
+        if dry_run or not valid:
+            return self.get_result(len(valid))
+
+        with transaction.atomic():
+            address_ids = {}
+            for prefix, serializer in self.address_serializers.items():
+                model = serializer.Meta.model
+                address_ids[prefix] = (model._meta.unique_together[0], self.get_address_ids(
+                    model, [addresses[prefix] for number, values, addresses in valid if prefix in addresses]))
+
+            case_references = get_new_case_references(Case.objects.all(), len(valid))
+            cases = []
+            for (number, values, addresses), case_reference in zip(valid, case_references):
+                case = Case(case_reference=case_reference, created_by=self.user, modified_by=self.user)
+                for name, value in values.items():
+                    setattr(case, name + '_id' if name in self.related_models or name in address_ids else name, value)
+                for prefix, address in addresses.items():
+                    fields, ids = address_ids[prefix]
+                    setattr(case, prefix + '_id', ids[tuple(address[field] for field in fields)])
+                cases.append(case)
+            Case.objects.bulk_create(cases, batch_size=self.batch_size)
+
+            # find the ids of the new cases by their (new and distinct) case references
+            case_ids = {}
+            for start in range(0, len(case_references), self.batch_size):
+                case_ids.update(Case.objects.filter(
+                    case_reference__in=case_references[start:start + self.batch_size]).values_list('case_reference', 'id'))
+            self.create_history(Case, case_ids.values())
+            ids = list(case_ids.values())
+            for start in range(0, len(ids), self.batch_size):
+                CaseCountRollup.objects.add_cases(ids[start:start + self.batch_size])
+            CaseSearchDocument.objects.refresh(ids)
+
+        self.cases = [{'row': number, 'id': case_ids[case_reference], 'case_reference': case_reference}
+                      for (number, values, addresses), case_reference in zip(valid, case_references)]
+        return self.get_result(len(self.cases))
+
+    def get_result(self, count):
+        return {'count': count, 'cases': self.cases, 'errors': self.errors}
@@ -0,0 +1,159 @@
+import io
+import json
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from datetime import date, datetime as dt
+import django
+from django.core.files.base import ContentFile
+from django.db import transaction
+from cbrsservices.models import *
+from cbrsservices.renderers import FinalLetterTemplateDOCXRenderer, FinalLetterPDFRenderer
+from cbrsservices.serializers import LetterSerializer
+
+
+########################################################################################################################
+#
+#  Batch final letters render the final letters of many cases at once (in a process pool, when run by a command),
+#  instead of one request (and one serializer, renderer, and query set) per letter,
+#  and then zip them or attach them to their cases.
+#
+########################################################################################################################
+
+
+# the renderer of each final letter format
+FINAL_LETTER_RENDERERS = {'docx': FinalLetterTemplateDOCXRenderer, 'pdf': FinalLetterPDFRenderer}
+
+
+def get_final_letter_filename(case_reference, letter_format='docx'):
+    """Returns the file name of the final letter of a case, dated today"""
+    return 'final_letter_case_' + case_reference + '_' + dt.now().strftime('%Y-%m-%d') + '.' + letter_format
+
+
+def render_final_letter(letter, letter_format='docx'):
+    """
+    Returns the bytes of the final letter of one LetterSerializer row and None, or None and the error that stopped it
+    (e.g. a case without a map date), so that one incomplete case does not fail every letter of its batch
+    (run in the process pool workers)
+    """
+    try:
+        return FINAL_LETTER_RENDERERS[letter_format]().render([letter]).getvalue(), None
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+class FinalLetterBatch(object):
+    """
+    This class will render the final letters of many cases, reading all of their letter fields in one query
+    and rendering the documents in this process (or, when given more than one process, in a pool of worker processes),
+    and can then zip the letters, attach them to their cases as final letter case files,
+    and queue the final emails of the cases for the outbox worker.
+    Web requests render in their own process, since forking a pool from a web server worker is not safe.
+    """
+
+    # the related records read by the letter serializer
+    select_related = ('cbrs_unit__system_unit_type', 'map_number', 'property', 'determination', 'requester')
+    # batches smaller than this are rendered in this process, where starting the pool would cost more than it saves
+    # (filling the compiled letter template takes well under a millisecond per letter)
+    min_pool_size = 2000
+    batch_size = 500
+
+    def __init__(self, user=None, processes=1, letter_format='docx'):
+        self.user = user
+        self.processes = processes
+        self.letter_format = letter_format
+        self.letters = []
+        self.failures = []
+        self.seconds = 0.0
+
+    def get_letter_data(self, queryset):
+        """Returns the LetterSerializer rows of the cases in the queryset, in case id order"""
+        queryset = queryset.select_related(*self.select_related).order_by('id')
+        return [dict(row) for row in LetterSerializer(queryset, many=True).data]
+
+    def render(self, letters):
+        """
+        Returns the (bytes, None) or (None, error) of each of the letter rows, in the same order,
+        rendered in a pool of the given number of processes (None for one per CPU) unless that is 1
+        """
+        render_letter = partial(render_final_letter, letter_format=self.letter_format)
+        if len(letters) < self.min_pool_size or self.processes == 1:
+            return [render_letter(letter) for letter in letters]
+        # the workers set up Django themselves in case they are spawned instead of forked
+        with ProcessPoolExecutor(self.processes, initializer=django.setup) as pool:
+            return list(pool.map(render_letter, letters, chunksize=max(len(letters) // 50, 1)))
+
+    def run(self, queryset):
+        """
+        Renders the final letters of the cases in the queryset, and returns the number of letters,
+        keeping the cases whose letter could not be rendered (and why) in the failures
+        """
+        start = time.perf_counter()
+        letters = self.get_letter_data(queryset)
+        self.letters, self.failures = [], []
+        for letter, (document, error) in zip(letters, self.render(letters)):
+            if error is not None:
+                self.failures.append({'case': letter['id'], 'case_reference': letter['case_reference'],
+                                      'error': error})
+                continue
+            self.letters.append({'case': letter['id'], 'case_reference': letter['case_reference'],
+                                 'filename': get_final_letter_filename(letter['case_reference'], self.letter_format),
+                                 'document': document})
+        self.seconds = time.perf_counter() - start
+        return len(self.letters)
+
+    def zip(self):
+        """Returns the bytes of a zip file of the rendered letters (and of the failures, when there are any)"""
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for letter in self.letters:
+                zip_file.writestr(letter['filename'], letter['document'])
+            if self.failures:
+                zip_file.writestr('failed_letters.json', json.dumps(self.failures, indent=2))
+        return zip_buffer.getvalue()
+
+    def attach(self):
+        """
+        Saves each rendered letter as a final letter case file of its case, replacing the case's earlier final letter
+        (which stays attached to the case, as an ordinary case file), and returns the ids of the new case files
+        """
+        casefile_ids = []
+        with transaction.atomic():
+            # record the replaced final letters in the case file history too, like the imports do (see imports.py)
+            replaced = list(CaseFile.objects.filter(case__in=[letter['case'] for letter in self.letters],
+                                                    final_letter=True))
+            for casefile in replaced:
+                casefile.final_letter = False
+                casefile.modified_by = self.user
+                casefile.modified_date = date.today()
+                casefile._history_user = self.user
+            CaseFile.objects.bulk_update(replaced, ['final_letter', 'modified_by', 'modified_date'],
+                                         batch_size=self.batch_size)
+            CaseFile.history.bulk_history_create(replaced, batch_size=self.batch_size)
+            for letter in self.letters:
+                casefile = CaseFile(case_id=letter['case'], final_letter=True, uploader=self.user,
+                                    created_by=self.user, modified_by=self.user)
+                casefile.file.save(letter['filename'], ContentFile(letter['document']), save=False)
+                casefile.save()
+                casefile_ids.append(casefile.id)
+        return casefile_ids
+
+    def queue_emails(self):
+        """
+        Queues the final emails of the cases with a final letter date for the outbox worker,
+        and returns the queued final emails
+        """
+        cases = Case.objects.filter(id__in=[letter['case'] for letter in self.letters],
+                                    final_letter_date__isnull=False).order_by('id')
+        return [FinalEmail.objects.queue(case, self.user) for case in cases]
+
+    def get_result(self):
+        return {
+            'count': len(self.letters),
+            'seconds': round(self.seconds, 3),
+            'letters_per_second': round(len(self.letters) / self.seconds, 1) if self.seconds else None,
+            'cases': [{'case': letter['case'], 'case_reference': letter['case_reference'],
+                       'filename': letter['filename']} for letter in self.letters],
+            'failed': self.failures,
+        }
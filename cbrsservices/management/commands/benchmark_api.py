@@ -0,0 +1,186 @@
+import json
+import time
+from datetime import datetime as dt
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from cbrsservices.letters import FinalLetterBatch
+from cbrsservices.models import *
+from cbrsservices.renderers import FinalLetterTemplateDOCXRenderer
+from cbrsservices.synthetic import create_synthetic_cases, create_synthetic_casefiles
+from cbrsservices.urls import router
+from cbrsservices.views import increment_response_cache_version
+
+
+# the variants of the cases and reports endpoints, as query strings (each also requested as CSV)
+CASE_VARIANTS = ('', 'view=workbench', 'view=report', 'view=caseid', 'pagination=keyset', 'status=Open',
+                 'freetext=synthetic')
+REPORT_VARIANTS = {
+    'reportcases': ('', 'report=casesbyunit', 'report=daystoresolution', 'report=daystoeachstatus',
+                    'report=allcasesforuser&user=synthetic-0'),
+    'reportcasecounts': ('', 'group_by=cbrs_unit', 'group_by=analyst', 'group_by=fiscal_year'),
+    'reportcasedays': ('', 'group_by=cbrs_unit', 'group_by=analyst', 'group_by=fiscal_year'),
+}
+# the models of every cached response, whose cached responses are dropped before each timed request
+CACHE_MODELS = {model for prefix, viewset, basename in router.registry
+                for model in getattr(viewset, 'cache_models', ())}
+
+
+class Command(BaseCommand):
+    help = ('Times every router endpoint (list and detail), each view, format, and report variant of the cases and '
+            'reports endpoints, and the DOCX final letter renderer, at several numbers of synthetic cases '
+            '(which are rolled back afterwards), without the response and final letter caches, and writes the '
+            'results to a JSON file, which can be compared to the results of an earlier run to catch regressions')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,5000',
+                            help='The comma separated numbers of synthetic cases to time the endpoints at')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic cases')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='The number of timed runs, each without cached responses (the best is reported)')
+        parser.add_argument('--letters', type=int, default=100,
+                            help='The most final letters to render at each size')
+        parser.add_argument('--output', default='benchmark_api.json', help='The path of the JSON file to write')
+        parser.add_argument('--compare', metavar='JSON', help='The JSON file of an earlier run to compare to')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='The fraction slower than the earlier run that counts as a regression')
+        parser.add_argument('--min-ms', type=float, default=1.0,
+                            help='The fewest milliseconds slower than the earlier run that counts as a regression')
+
+    def time_request(self, client, url, repeat):
+        """
+        Returns the status, size, and query count of the response to the first request of the url, and the time of the
+        first request and of the best of all of the requests, where no request is answered from a cached response
+        """
+        times = []
+        for i in range(repeat):
+            # a cached response would time the cache instead of the view (rendered letters are not cached, see handle)
+            for model in CACHE_MODELS:
+                increment_response_cache_version(model)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                # streamed responses do their work as they are read
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                times.append(time.perf_counter() - start)
+            if i == 0:
+                result = {'status': response.status_code, 'bytes': len(content), 'queries': len(queries)}
+        result['first_ms'] = round(times[0] * 1000, 2)
+        result['best_ms'] = round(min(times) * 1000, 2)
+        return result
+
+    def get_urls(self, client):
+        """
+        Returns the (name, url) pairs of the list and detail (of the first listed record) of every router endpoint,
+        and of the variants, where the names stay the same from run to run (unlike the ids of the detail urls)
+        """
+        urls = []
+        for prefix, viewset, basename in router.registry:
+            url = '/cbrsservices/%s/' % prefix
+            urls.append(url)
+            response = client.get(url, {'format': 'json'})
+            items = response.data.get('results', []) if isinstance(response.data, dict) else response.data
+            if response.status_code == 200 and items:
+                urls.append((url + '<id>/', '%s%s/' % (url, items[0]['id'])))
+        for variant in CASE_VARIANTS:
+            for frmt in ('json', 'csv'):
+                urls.append('/cbrsservices/cases/?%sformat=%s' % (variant + '&' if variant else '', frmt))
+        for endpoint, variants in REPORT_VARIANTS.items():
+            for variant in variants:
+                for frmt in ('json', 'csv'):
+                    urls.append('/cbrsservices/%s/?%sformat=%s' % (endpoint, variant + '&' if variant else '', frmt))
+        case = Case.objects.order_by('id').first()
+        if case is not None:
+            for frmt in ('docx', 'pdf'):
+                urls.append(('/cbrsservices/cases/?case_number=<id>&format=' + frmt,
+                             '/cbrsservices/cases/?case_number=%d&format=%s' % (case.id, frmt)))
+        return [url if isinstance(url, tuple) else (url, url) for url in urls]
+
+    def time_letters(self, count, repeat):
+        """Returns the time of reading the letter data of up to count cases and building their DOCX final letters"""
+        batch = FinalLetterBatch(letter_format='docx')
+        case_ids = list(Case.objects.order_by('id').values_list('id', flat=True)[:count])
+        times = []
+        letters = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            letters = batch.get_letter_data(Case.objects.filter(id__in=case_ids))
+            for letter in letters:
+                # build each document, bypassing the cache of rendered letters
+                renderer = FinalLetterTemplateDOCXRenderer()
+                renderer.build_document(renderer.get_paragraphs(letter))
+            times.append(time.perf_counter() - start)
+        return {'letters': len(letters), 'first_ms': round(times[0] * 1000, 2), 'best_ms': round(min(times) * 1000, 2)}
+
+    def compare(self, results, earlier, threshold, min_ms):
+        """Writes the timings that are slower than in the earlier results, and returns the number of regressions"""
+        regressions = 0
+        for name, sizes in results['results'].items():
+            for size, result in sizes.items():
+                before = earlier.get('results', {}).get(name, {}).get(size)
+                if before is None or 'best_ms' not in before:
+                    continue
+                if result['best_ms'] > before['best_ms'] * (1 + threshold) and \
+                        result['best_ms'] - before['best_ms'] >= min_ms:
+                    regressions += 1
+                    self.stdout.write(self.style.WARNING('Regression: %s at %s cases, %.1fms (was %.1fms)' % (
+                        name, size, result['best_ms'], before['best_ms'])))
+        return regressions
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of numbers')
+        earlier = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                earlier = json.load(f)
+
+        results = {
+            'date': dt.now().isoformat(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'sizes': sizes,
+            'results': {},
+        }
+        with transaction.atomic():
+            user = User.objects.create(username='synthetic-benchmark', is_staff=True)
+            client = APIClient()
+            client.force_authenticate(user)
+            created = 0
+            for step, size in enumerate(sizes):
+                if size > created:
+                    # each step adds its own cases (a different seed), on top of the cases of the earlier steps
+                    case_ids = create_synthetic_cases(size - created, options['seed'] + step, user)
+                    create_synthetic_casefiles(case_ids, options['seed'] + step, user)
+                    created = size
+
+                start = time.perf_counter()
+                # render every final letter, instead of timing the cache of rendered letters after the first run
+                with override_settings(FINAL_LETTER_CACHE=None):
+                    for name, url in self.get_urls(client):
+                        results['results'].setdefault('GET ' + name, {})[str(size)] = self.time_request(
+                            client, url, options['repeat'])
+                results['results'].setdefault('final letters (docx)', {})[str(size)] = self.time_letters(
+                    options['letters'], options['repeat'])
+                self.stdout.write('Timed %d endpoints at %d cases in %.1fs' % (
+                    len(results['results']), size, time.perf_counter() - start))
+            transaction.set_rollback(True)
+
+        for name, timings in results['results'].items():
+            self.stdout.write('%-90s %s' % (name, '  '.join(
+                '%s: %.1fms' % (size, result['best_ms']) for size, result in timings.items())))
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS('Wrote the results to %s' % options['output']))
+
+        if earlier is not None:
+            regressions = self.compare(results, earlier, options['threshold'], options['min_ms'])
+            if regressions:
+                raise CommandError('%d timings regressed since %s' % (regressions, options['compare']))
+            self.stdout.write(self.style.SUCCESS('No regressions since %s' % options['compare']))
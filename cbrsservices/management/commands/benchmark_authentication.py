@@ -0,0 +1,48 @@
+import base64
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = ('Compares the request throughput of Basic authentication (which hashes the password every request) '
+            'and API tokens from the authenticate endpoint, as a temporary user that is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='The number of timed requests of each kind')
+        parser.add_argument('--url', default='/cbrsservices/requesters/?page_size=1',
+                            help='The endpoint to request')
+
+    def time_requests(self, client, url, count):
+        start = time.perf_counter()
+        for i in range(count):
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError('The request failed (%d)' % response.status_code)
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        count, url = options['requests'], options['url']
+        with transaction.atomic():
+            username, password = 'benchmark_authentication', 'benchmark-password'
+            user = User.objects.create(username=username, is_active=True)
+            user.set_password(password)
+            user.save()
+            basic = 'Basic ' + base64.b64encode((username + ':' + password).encode()).decode()
+
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=basic)
+            response = client.post('/cbrsservices/auth/')
+            basic_time = self.time_requests(client, url, count)
+
+            client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+            token_time = self.time_requests(client, url, count)
+
+            self.stdout.write('Basic auth: %d requests in %.2fs (%.1f requests/s, %.1fms per request)' % (
+                count, basic_time, count / basic_time, basic_time * 1000 / count))
+            self.stdout.write('API token: %d requests in %.2fs (%.1f requests/s, %.1fms per request)' % (
+                count, token_time, count / token_time, token_time * 1000 / count))
+            self.stdout.write('API tokens are %.1fx faster' % (basic_time / token_time))
+            transaction.set_rollback(True)
@@ -0,0 +1,55 @@
+import time
+import zipfile
+from io import BytesIO
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cbrsservices.letters import FinalLetterBatch
+from cbrsservices.models import Case
+from cbrsservices.renderers import FinalLetterDOCXRenderer, FinalLetterTemplateDOCXRenderer, FinalLetterPDFRenderer
+from cbrsservices.synthetic import create_synthetic_cases
+
+
+class Command(BaseCommand):
+    help = ('Compares the letters per second of the document-building and the template-filling DOCX final letter '
+            'renderers (and the PDF renderer) on synthetic cases, which are rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--letters', type=int, default=1000, help='The number of letters to render')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic cases')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of timed runs (the best is reported)')
+
+    def time_letters(self, renderer_class, letters, repeat):
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            for letter in letters:
+                # build each document, bypassing the cache of rendered letters
+                renderer = renderer_class()
+                renderer.build_document(renderer.get_paragraphs(letter))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            case_ids = create_synthetic_cases(options['letters'], options['seed'])
+            letters = FinalLetterBatch().get_letter_data(Case.objects.filter(id__in=case_ids))
+
+            # both renderers must build the same document for every letter
+            for letter in letters:
+                documents = [zipfile.ZipFile(BytesIO(renderer_class().get_document(letter))).read('word/document.xml')
+                             for renderer_class in (FinalLetterDOCXRenderer, FinalLetterTemplateDOCXRenderer)]
+                if documents[0] != documents[1]:
+                    raise CommandError('The renderers built different letters for case %d' % letter['id'])
+
+            times = {}
+            for renderer_class in (FinalLetterDOCXRenderer, FinalLetterTemplateDOCXRenderer, FinalLetterPDFRenderer):
+                times[renderer_class] = self.time_letters(renderer_class, letters, options['repeat'])
+                size = sum(len(renderer_class().get_document(letter)) for letter in letters) / len(letters)
+                self.stdout.write('%s: %d letters, %.0f letters/s, %.2fms per letter, %.1fKB per letter' % (
+                    renderer_class.__name__, len(letters), len(letters) / times[renderer_class],
+                    times[renderer_class] * 1000 / len(letters), size / 1024))
+            self.stdout.write('Template DOCX speedup: %.1fx' % (
+                times[FinalLetterDOCXRenderer] / times[FinalLetterTemplateDOCXRenderer]))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cbrsservices.models import Case, ReportCase
+from cbrsservices.serializers import VALUES_SERIALIZERS
+from cbrsservices.synthetic import create_synthetic_cases
+from cbrsservices.views import CaseViewSet, ReportCaseView
+
+
+class Command(BaseCommand):
+    help = ('Compares the rows per second of the list serializers and their values serializers '
+            'on synthetic cases, which are rolled back afterwards unless --keep is given')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=50000, help='The number of synthetic cases to create')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic cases')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of timed runs (the best is reported)')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic cases instead of rolling back')
+
+    def time_rows(self, build_rows, repeat):
+        best = None
+        rows = 0
+        for i in range(repeat):
+            start = time.perf_counter()
+            rows = len(build_rows())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return rows, best
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            create_synthetic_cases(options['cases'], options['seed'])
+            self.stdout.write('Created %d synthetic cases in %.1fs' % (options['cases'], time.perf_counter() - start))
+
+            for serializer_class, values_serializer_class in VALUES_SERIALIZERS.items():
+                model = serializer_class.Meta.model
+                queryset = model.objects.with_status().order_by('id')
+                # the model serializers get the same fetch plans as the views that use them
+                view = ReportCaseView if model is ReportCase else CaseViewSet
+                plan = view.fetch_plans.get(serializer_class, {})
+                planned = queryset.select_related(*plan.get('select_related', ()))
+                planned = planned.prefetch_related(*plan.get('prefetch_related', ()))
+
+                rows, model_time = self.time_rows(
+                    lambda: serializer_class(planned.all(), many=True).data, options['repeat'])
+                values_serializer = values_serializer_class()
+                rows, values_time = self.time_rows(
+                    lambda: values_serializer.to_representation(values_serializer.get_values(queryset.all())),
+                    options['repeat'])
+                self.stdout.write('%s: %d rows, model serializer %.0f rows/s, values serializer %.0f rows/s (%.1fx)' % (
+                    serializer_class.__name__, rows, rows / model_time, rows / values_time, model_time / values_time))
+
+            if not options['keep']:
+                transaction.set_rollback(True)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from cbrsservices.models import CaseCountRollup
+
+
+class Command(BaseCommand):
+    help = 'Compares the case count rollup table against a live recount of all cases and lists any differences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the rollup table if any differences are found')
+
+    def handle(self, *args, **options):
+        differences = CaseCountRollup.objects.compare()
+        if not differences:
+            self.stdout.write(self.style.SUCCESS('Case count rollups match the live case counts'))
+            return
+        for status, cbrs_unit, fiscal_year, rollup_count, live_count in differences:
+            self.stdout.write('status: %s, cbrs_unit: %s, fiscal_year: %s, rollup count: %d, live count: %d' % (
+                status, cbrs_unit, fiscal_year, rollup_count, live_count))
+        if options['rebuild']:
+            CaseCountRollup.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS('Rebuilt the case count rollups'))
+        else:
+            raise CommandError('%d case count rollups do not match the live case counts' % len(differences))
@@ -0,0 +1,125 @@
+import re
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from cbrsservices.filters import CaseFilter, ReportCaseFilter
+from cbrsservices.models import Case, ReportCase
+from cbrsservices.synthetic import create_synthetic_cases, get_synthetic_lookups
+
+
+# the workbench (cases) and report filter combinations to explain, where {analyst} is the id of a synthetic analyst
+CASE_FILTER_COMBINATIONS = (
+    ('cases', {'status': 'Received'}),
+    ('cases', {'status': 'Awaiting QC'}),
+    ('cases', {'status': 'Awaiting Final Letter'}),
+    ('cases', {'status': 'Final'}),
+    ('cases', {'status': 'Closed with no Final Letter'}),
+    ('cases', {'status': 'Open'}),
+    ('cases', {'status': 'Open', 'analyst': '{analyst}'}),
+    ('cases', {'status': 'Open', 'priority': 'true'}),
+    ('cases', {'priority': 'true'}),
+    ('cases', {'on_hold': 'true'}),
+    ('cases', {'request_date_after': '2017-01-01', 'request_date_before': '2017-03-01'}),
+    ('cases', {'status': 'Received', 'request_date_after': '2017-01-01', 'request_date_before': '2017-03-01'}),
+    ('cases', {'fiscal_year': '2018'}),
+    ('cases', {'fiscal_year': '2018', 'status': 'Final'}),
+    ('reports', {'report': 'daystoeachstatus', 'date_field': 'request_date', 'from_date': '2017-01-01',
+                 'to_date': '2017-03-01'}),
+    ('reports', {'report': 'daystoeachstatus', 'date_field': 'analyst_signoff_date', 'from_date': '2017-01-01',
+                 'to_date': '2017-03-01'}),
+    ('reports', {'report': 'daystoeachstatus', 'date_field': 'qc_reviewer_signoff_date', 'from_date': '2017-01-01',
+                 'to_date': '2017-03-01'}),
+    ('reports', {'report': 'daystoeachstatus', 'date_field': 'final_letter_date', 'from_date': '2017-01-01',
+                 'to_date': '2017-03-01'}),
+    ('reports', {'report': 'daystoeachstatus', 'date_field': 'close_date', 'from_date': '2017-01-01',
+                 'to_date': '2017-03-01'}),
+    ('reports', {'report': 'daystoeachstatus', 'user': 'synthetic-0'}),
+)
+
+
+class Command(BaseCommand):
+    help = ('Runs EXPLAIN on the queries of common workbench and report filter combinations on synthetic cases '
+            '(which are rolled back afterwards unless --keep is given), and reports the slowest combinations '
+            'and how many of the combinations use each index of the case table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=50000,
+                            help='The number of synthetic cases to create (0 to explain the existing cases only)')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic cases')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of timed runs (the best is reported)')
+        parser.add_argument('--page-size', type=int, default=100, help='The page size of the timed list queries')
+        parser.add_argument('--plans', action='store_true', help='Also print the query plan of each combination')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic cases instead of rolling back')
+
+    def get_queryset(self, view, params):
+        """Returns the filtered queryset of a combination, built from the same query set and filters as its view"""
+        if view == 'reports':
+            filterset = ReportCaseFilter(params, queryset=ReportCase.objects.with_status().with_days().order_by('id'))
+        else:
+            filterset = CaseFilter(params, queryset=Case.objects.with_status().order_by('id'))
+        if not filterset.is_valid():
+            raise CommandError('Invalid %s filters %s: %s' % (view, params, dict(filterset.errors)))
+        return filterset.qs
+
+    def time_queries(self, queryset, page_size, repeat):
+        """Returns the best time of the queries of a paginated list request (the count and the first page)"""
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            queryset.count()
+            list(queryset[:page_size])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def get_index_names(self):
+        """Returns the names of the indexes of the case table (including those of its foreign keys)"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Case._meta.db_table)
+        return sorted(name for name, constraint in constraints.items()
+                      if constraint['index'] and not constraint['primary_key'])
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['cases']:
+                start = time.perf_counter()
+                create_synthetic_cases(options['cases'], options['seed'])
+                self.stdout.write('Created %d synthetic cases in %.1fs' % (
+                    options['cases'], time.perf_counter() - start))
+            # refresh the statistics the query planner chooses indexes by
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            analyst = get_synthetic_lookups()['users'][0].id
+
+            index_names = self.get_index_names()
+            index_usage = {name: [] for name in index_names}
+            results = []
+            for view, params in CASE_FILTER_COMBINATIONS:
+                params = {key: value.format(analyst=analyst) for key, value in params.items()}
+                queryset = self.get_queryset(view, params)
+                plans = [queryset.explain(), queryset[:options['page_size']].explain()]
+                label = '%s?%s' % (view, '&'.join('%s=%s' % item for item in params.items()))
+                used = [name for name in index_names if any(re.search(r'\b%s\b' % name, plan) for plan in plans)]
+                for name in used:
+                    index_usage[name].append(label)
+                seconds = self.time_queries(queryset, options['page_size'], options['repeat'])
+                results.append((seconds, label, used, plans))
+
+            self.stdout.write('Filter combinations, slowest first:')
+            for seconds, label, used, plans in sorted(results, key=lambda result: result[0], reverse=True):
+                self.stdout.write('  %8.1fms  %s  (%s)' % (seconds * 1000, label, ', '.join(used) or 'no index'))
+                if options['plans']:
+                    for plan in plans:
+                        self.stdout.write('\n'.join('              ' + line for line in plan.splitlines()))
+
+            self.stdout.write('Case table indexes:')
+            for name in index_names:
+                self.stdout.write('  %-40s used by %d of %d combinations' % (
+                    name, len(index_usage[name]), len(results)))
+            # only the filter indexes are expected to be used here (the foreign key indexes serve joins and lookups)
+            unused = [index.name for index in Case._meta.indexes if not index_usage.get(index.name)]
+            if unused:
+                self.stdout.write(self.style.WARNING('Unused filter indexes: %s' % ', '.join(unused)))
+
+            if not options['keep']:
+                transaction.set_rollback(True)
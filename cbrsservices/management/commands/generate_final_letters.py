@@ -0,0 +1,75 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+from cbrsservices.letters import FinalLetterBatch
+from cbrsservices.models import Case
+
+
+class Command(BaseCommand):
+    help = ('Renders the final letters of many cases in a process pool, and writes them to a zip file, '
+            'or attaches them to their cases (and optionally queues their final emails)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('cases', nargs='*', type=int, help='The ids of the cases (by default, every case with a '
+                                                               'final letter date and no final letter case file)')
+        parser.add_argument('--zip', help='The path of the zip file to write the letters to')
+        parser.add_argument('--attach', action='store_true', help='Attach the letters to their cases as final letters')
+        parser.add_argument('--email', action='store_true', help='Attach the letters and queue the final emails')
+        parser.add_argument('--format', choices=('docx', 'pdf'), default='docx', help='The format of the letters')
+        parser.add_argument('--processes', type=int, help='The number of worker processes (by default, one per CPU)')
+        parser.add_argument('--user', help='The username to record as the uploader of the attached letters')
+        parser.add_argument('--compare', type=int, default=0, metavar='N',
+                            help='Also time N letters requested one at a time (with ?format=), for comparison')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError('User "%s" does not exist' % options['user'])
+        if not (options['zip'] or options['attach'] or options['email'] or options['compare']):
+            raise CommandError('Give --zip, --attach, --email, or --compare')
+        if options['cases']:
+            queryset = Case.objects.filter(id__in=options['cases'])
+        else:
+            queryset = Case.objects.filter(final_letter_date__isnull=False).exclude(casefiles__final_letter=True)
+
+        batch = FinalLetterBatch(user, options['processes'], options['format'])
+        count = batch.run(queryset)
+        result = batch.get_result()
+        self.stdout.write('Rendered %d final letters in %.2fs (%.1f letters/s, %.1fms per letter)' % (
+            count, batch.seconds, result['letters_per_second'] or 0, batch.seconds * 1000 / max(count, 1)))
+        for failure in batch.failures:
+            self.stdout.write(self.style.WARNING('The final letter of case %d (%s) failed: %s' % (
+                failure['case'], failure['case_reference'], failure['error'])))
+
+        if options['zip']:
+            with open(options['zip'], 'wb') as f:
+                f.write(batch.zip())
+            self.stdout.write(self.style.SUCCESS('Wrote %d final letters to %s' % (count, options['zip'])))
+        if options['attach'] or options['email']:
+            batch.attach()
+            self.stdout.write(self.style.SUCCESS('Attached %d final letters to their cases' % count))
+        if options['email']:
+            final_emails = batch.queue_emails()
+            self.stdout.write(self.style.SUCCESS('Queued %d final emails' % len(final_emails)))
+
+        if options['compare'] and count:
+            self.compare(batch, options['compare'], user)
+
+    def compare(self, batch, count, user):
+        """Times the single-request path (one ?format=docx or pdf list request per case) for the first count letters"""
+        client = APIClient()
+        client.force_authenticate(user or User.objects.filter(is_active=True, is_staff=True).first())
+        letters = batch.letters[:count]
+        start = time.perf_counter()
+        for letter in letters:
+            response = client.get('/cbrsservices/cases/', {'case_number': letter['case'], 'format': batch.letter_format})
+            if response.status_code != 200:
+                raise CommandError('The letter request of case %d failed (%d)' % (letter['case'], response.status_code))
+        seconds = time.perf_counter() - start
+        single = seconds * 1000 / len(letters)
+        batched = batch.seconds * 1000 / len(batch.letters)
+        self.stdout.write('Single requests: %d letters in %.2fs (%.1fms per letter), batch: %.1fms per letter '
+                          '(%.1fx)' % (len(letters), seconds, single, batched, single / batched))
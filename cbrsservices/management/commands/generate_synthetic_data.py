@@ -0,0 +1,47 @@
+import time
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cbrsservices.models import *
+from cbrsservices.synthetic import create_synthetic_cases, create_synthetic_casefiles
+from cbrsservices.views import increment_response_cache_version
+
+
+class Command(BaseCommand):
+    help = ('Generates synthetic cases (with their requesters, properties, tags, comments, and case files) and the '
+            'system units, maps, and other lookups they use, where the same seed always produces the same data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=1000, help='The number of synthetic cases to create')
+        parser.add_argument('--seed', type=int, default=0, help='The seed of the synthetic cases')
+        parser.add_argument('--units', type=int, default=20, help='The number of synthetic system units (and maps)')
+        parser.add_argument('--casefiles', type=int, default=2, help='The most synthetic case files of each case')
+        parser.add_argument('--user', help='The username to record as the creator of the synthetic records')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError('User "%s" does not exist' % options['user'])
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            case_ids = create_synthetic_cases(options['cases'], options['seed'], user, options['units'])
+            casefiles = create_synthetic_casefiles(case_ids, options['seed'], user, options['casefiles'])
+        # the synthetic records are created in bulk, so drop the cached lookup table responses built without them,
+        # which only reaches the servers when they share the default cache with this command (e.g. memcached or redis)
+        for model in (SystemUnit, SystemUnitType, SystemUnitMap, SystemUnitProhibitionDate, SystemMap, Determination,
+                      FieldOffice):
+            increment_response_cache_version(model)
+        self.stdout.write(self.style.SUCCESS('Created %d synthetic cases and %d case files in %.1fs' % (
+            len(case_ids), casefiles, time.perf_counter() - start)))
+        if isinstance(caches['default'], LocMemCache):
+            timeout = getattr(settings, 'REST_FRAMEWORK_EXTENSIONS', {}).get('DEFAULT_CACHE_RESPONSE_TIMEOUT', 600)
+            self.stdout.write(self.style.WARNING(
+                'The default cache is local to each process, so running servers may keep answering with lookup table '
+                'responses cached before the synthetic records were created for up to %d seconds (or until they '
+                'are restarted)' % timeout))
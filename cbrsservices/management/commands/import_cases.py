@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from cbrsservices.imports import CaseImport
+
+
+class Command(BaseCommand):
+    help = 'Creates cases in bulk from a CSV or JSON lines file, and lists any rows that could not be imported'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The CSV (with a header line) or JSON lines file of cases')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='The format of the file (by default, csv if the file name ends with .csv, else jsonl)')
+        parser.add_argument('--user', help='The username to record as the creator of the imported records')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the rows, without creating anything')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError('User "%s" does not exist' % options['user'])
+        content_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'jsonl')
+        with open(options['path'], 'rb') as f:
+            content = f.read()
+
+        case_import = CaseImport(user)
+        result = case_import.run(case_import.read(content, content_format), dry_run=options['dry_run'])
+        for error in result['errors']:
+            self.stdout.write('row %d: %s' % (error['row'], error['errors']))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('%d cases are valid' % result['count']))
+        else:
+            self.stdout.write(self.style.SUCCESS('Imported %d cases' % result['count']))
+        if result['errors']:
+            raise CommandError('%d rows could not be imported' % len(result['errors']))
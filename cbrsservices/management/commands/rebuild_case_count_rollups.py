@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from cbrsservices.models import CaseCountRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the case count rollup table from a live recount of all cases'
+
+    def handle(self, *args, **options):
+        CaseCountRollup.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d case count rollups' % CaseCountRollup.objects.count()))
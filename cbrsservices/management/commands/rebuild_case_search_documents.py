@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from cbrsservices.models import CaseSearchDocument
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search documents used by the case freetext filter from the current values of all cases'
+
+    def handle(self, *args, **options):
+        CaseSearchDocument.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d case search documents' % CaseSearchDocument.objects.count()))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from cbrsservices.models import FinalEmail
+
+
+class Command(BaseCommand):
+    help = ('Sends the final emails waiting in the outbox, retrying failed emails with backoff, '
+            'once or (with --loop) continuously as a background worker')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='The most emails to send over each email connection')
+        parser.add_argument('--loop', action='store_true', help='Keep sending until stopped, instead of exiting')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='The seconds to wait for new emails when the outbox is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = FinalEmail.objects.send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write('Sent %d final emails, %d failed' % (sent, failed))
+            if not options['loop']:
+                break
+            # only wait when the outbox is drained, so a backlog is sent batch after batch
+            if not sent and not failed:
+                time.sleep(options['interval'])
@@ -0,0 +1,201 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics(object):
+    """
+    This class will keep in-process totals and latency histograms of the requests to each endpoint,
+    so that the most expensive endpoints (in time or in SQL queries) can be found under real load
+    """
+
+    # the upper bounds (in milliseconds) of the latency histogram buckets, the last bucket has no upper bound
+    buckets = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    timings = ('sql', 'serialize', 'app', 'render', 'stream', 'total')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, queries, timings):
+        """Adds the SQL query count and timings (in milliseconds) of one request to the endpoint's totals"""
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0,
+                    'time': {name: 0.0 for name in self.timings}, 'max_time': {name: 0.0 for name in self.timings},
+                    'histogram': [0] * (len(self.buckets) + 1)}
+            stats['requests'] += 1
+            stats['queries'] += queries
+            stats['max_queries'] = max(stats['max_queries'], queries)
+            for name in self.timings:
+                stats['time'][name] += timings[name]
+                stats['max_time'][name] = max(stats['max_time'][name], timings[name])
+            stats['histogram'][bisect.bisect_left(self.buckets, timings['total'])] += 1
+
+    def snapshot(self):
+        """Returns the totals, averages, and latency histogram of each endpoint, slowest average first"""
+        with self.lock:
+            endpoints = [(endpoint, dict(stats, time=dict(stats['time']), max_time=dict(stats['max_time']),
+                                         histogram=list(stats['histogram'])))
+                         for endpoint, stats in self.endpoints.items()]
+        snapshot = []
+        for endpoint, stats in endpoints:
+            requests = stats['requests']
+            labels = ['<=%dms' % bound for bound in self.buckets] + ['>%dms' % self.buckets[-1]]
+            snapshot.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'queries': stats['queries'],
+                'avg_queries': round(stats['queries'] / requests, 1),
+                'max_queries': stats['max_queries'],
+                'avg_ms': {name: round(stats['time'][name] / requests, 2) for name in self.timings},
+                'max_ms': {name: round(stats['max_time'][name], 2) for name in self.timings},
+                'histogram': dict(zip(labels, stats['histogram'])),
+            })
+        return sorted(snapshot, key=lambda stats: stats['avg_ms']['total'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def dump(self):
+        """Writes the snapshot of each endpoint to the log, and returns the snapshot"""
+        snapshot = self.snapshot()
+        for stats in snapshot:
+            logger.info('request metrics | %s | requests: %d | avg queries: %s | max queries: %d | avg ms: %s | '
+                        'max ms: %s | histogram: %s', stats['endpoint'], stats['requests'], stats['avg_queries'],
+                        stats['max_queries'], stats['avg_ms'], stats['max_ms'], stats['histogram'])
+        return snapshot
+
+
+request_metrics = RequestMetrics()
+
+
+@contextmanager
+def measure_serialize(request):
+    """
+    Adds the time spent in the block outside of SQL to the serialization time of the request (when its metrics are
+    being measured), and the SQL queries run in the block to its serialization queries, which include any lazy loads
+    (N+1 queries) the fetch plans missed
+    """
+    metrics = getattr(request, '_metrics', None)
+    if metrics is None:
+        yield
+        return
+    start, sql, queries = time.perf_counter(), metrics['sql'], metrics['queries']
+    try:
+        yield
+    finally:
+        metrics['serialize'] += max((time.perf_counter() - start) * 1000 - (metrics['sql'] - sql), 0.0)
+        metrics['serialize_queries'] += metrics['queries'] - queries
+
+
+class RequestMetricsMiddleware(object):
+    """
+    This class will measure the SQL query count and time, the serialization time outside of SQL (see
+    measure_serialize), the render time, the time of building streamed content outside of SQL, and the rest of the
+    time of each request in the app (the view, filtering, pagination, and middleware),
+    add them to the in-process request metrics,
+    and (when the REQUEST_METRICS_SERVER_TIMING setting is true) return them in a Server-Timing response header.
+    The metrics of a streamed response are recorded once its content has been read, but its Server-Timing header
+    is sent before, so the header leaves out the streamed content and the SQL queries run while building it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', False)
+        self.log_interval = getattr(settings, 'REQUEST_METRICS_LOG_INTERVAL', None)
+        self.last_log = time.perf_counter()
+
+    def __call__(self, request):
+        request._metrics = {'queries': 0, 'sql': 0.0, 'serialize': 0.0, 'serialize_queries': 0,
+                            'render_start': None, 'render_end': None}
+        start = time.perf_counter()
+        with connection.execute_wrapper(self.count_queries(request._metrics)):
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        metrics = request._metrics
+        total = (end - start) * 1000
+        render = 0.0
+        if metrics['render_start'] is not None and metrics['render_end'] is not None:
+            render = (metrics['render_end'] - metrics['render_start']) * 1000
+        # the app time is whatever is not SQL, serialization, or rendering
+        timings = {'sql': metrics['sql'], 'serialize': metrics['serialize'], 'render': render, 'stream': 0.0,
+                   'total': total, 'app': max(total - render - metrics['sql'] - metrics['serialize'], 0.0)}
+
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join(
+                ['sql;dur=%.1f;desc="%d queries"' % (timings['sql'], metrics['queries']),
+                 'serialize;dur=%.1f;desc="%d queries"' % (timings['serialize'], metrics['serialize_queries'])] +
+                ['%s;dur=%.1f' % (name, timings[name]) for name in ('app', 'render', 'total')])
+        if response.streaming:
+            # the content of a streamed response is built as the server reads it, after this returns
+            response.streaming_content = self.measure_stream(request, response.streaming_content, timings)
+        else:
+            self.record(request, timings)
+        return response
+
+    def record(self, request, timings):
+        metrics = request._metrics
+        match = request.resolver_match
+        if match is not None:
+            request_metrics.record(request.method + ' ' + (match.view_name or match.url_name or request.path),
+                                   metrics['queries'], timings)
+        now = time.perf_counter()
+        if self.log_interval and now - self.last_log >= self.log_interval:
+            self.last_log = now
+            request_metrics.dump()
+
+    def measure_stream(self, request, content, timings):
+        """Yields the streamed content, timing (and counting the SQL queries of) each chunk, then records the request"""
+        metrics = request._metrics
+        content = iter(content)
+        try:
+            while True:
+                # only time building each chunk, not the server sending it
+                start = time.perf_counter()
+                try:
+                    with connection.execute_wrapper(self.count_queries(metrics)):
+                        chunk = next(content)
+                except StopIteration:
+                    break
+                finally:
+                    timings['total'] += (time.perf_counter() - start) * 1000
+                yield chunk
+        finally:
+            timings['sql'] = metrics['sql']
+            timings['stream'] = max(timings['total'] - timings['app'] - timings['serialize'] - timings['render'] -
+                                    timings['sql'], 0.0)
+            self.record(request, timings)
+
+    @staticmethod
+    def count_queries(metrics):
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                metrics['queries'] += 1
+                metrics['sql'] += (time.perf_counter() - start) * 1000
+        return wrapper
+
+    def process_template_response(self, request, response):
+        # the response is rendered right after this, so time the render with a post-render callback
+        metrics = getattr(request, '_metrics', None)
+        if metrics is not None:
+            metrics['render_start'] = time.perf_counter()
+
+            def render_end(rendered):
+                metrics['render_end'] = time.perf_counter()
+            response.add_post_render_callback(render_end)
+        return response
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import ExtractYear
+
+
+# copies of the status and fiscal year expressions as they were when the rollups were added (see models.CASE_STATUS
+# and models.CASE_FISCAL_YEAR), so that this migration does not change if they do
+CASE_STATUS = models.Case(
+    models.When(close_date__isnull=False, final_letter_date__isnull=True, then=models.Value('Closed with no Final Letter')),
+    models.When(close_date__isnull=False, then=models.Value('Final')),
+    models.When(qc_reviewer_signoff_date__isnull=False, then=models.Value('Awaiting Final Letter')),
+    models.When(analyst_signoff_date__isnull=False, then=models.Value('Awaiting QC')),
+    default=models.Value('Received'),
+    output_field=models.CharField()
+)
+CASE_FISCAL_YEAR = models.ExpressionWrapper(
+    ExtractYear('request_date') + models.Case(
+        models.When(request_date__month__gte=10, then=models.Value(1)),
+        default=models.Value(0),
+        output_field=models.IntegerField()
+    ),
+    output_field=models.IntegerField()
+)
+
+
+def populate_case_count_rollups(apps, schema_editor):
+    Case = apps.get_model('cbrsservices', 'Case')
+    CaseCountRollup = apps.get_model('cbrsservices', 'CaseCountRollup')
+    counts = Case.objects.annotate(status=CASE_STATUS, fiscal_year=CASE_FISCAL_YEAR).values(
+        'status', 'cbrs_unit', 'fiscal_year').annotate(count=models.Count('id')).order_by()
+    CaseCountRollup.objects.bulk_create([CaseCountRollup(
+        status=row['status'], cbrs_unit_id=row['cbrs_unit'], fiscal_year=row['fiscal_year'], count=row['count'])
+        for row in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0004_auto_20200121_1547'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseCountRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(help_text='An alphanumeric value of the status of the counted cases (e.g. "Final", "Awaiting QC", etc)', max_length=32)),
+                ('fiscal_year', models.IntegerField(blank=True, help_text='A numeric value of the fiscal year in which the counted cases were requested', null=True)),
+                ('count', models.IntegerField(default=0, help_text='A numeric value of the number of cases with this status, cbrs unit, and fiscal year')),
+                ('cbrs_unit', models.ForeignKey(blank=True, help_text='A foreign key integer value identifying the cbrs unit of the counted cases', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='case_count_rollups', to='cbrsservices.SystemUnit')),
+            ],
+            options={
+                'db_table': 'cbrs_casecountrollup',
+                'unique_together': {('status', 'cbrs_unit', 'fiscal_year')},
+            },
+        ),
+        migrations.RunPython(populate_case_count_rollups, migrations.RunPython.noop),
+    ]
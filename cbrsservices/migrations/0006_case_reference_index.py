@@ -0,0 +1,47 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:30
+
+import base64
+import os
+from django.db import migrations, models
+
+
+def get_new_case_reference(cases):
+    """Returns a random eight character hexadecimal reference that is not used by any of the given cases"""
+    while True:
+        case_reference = base64.b16encode(os.urandom(4)).decode()
+        if not cases.filter(case_reference=case_reference).exists():
+            return case_reference
+
+
+def populate_missing_case_references(apps, schema_editor):
+    # existing case references are kept as they are, only cases that never got one are given a new one
+    Case = apps.get_model('cbrsservices', 'Case')
+    for case in Case.objects.filter(case_reference__exact='').only('id'):
+        case.case_reference = get_new_case_reference(Case.objects.all())
+        case.save(update_fields=['case_reference'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0005_casecountrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='case',
+            name='case_reference',
+            field=models.CharField(blank=True, db_index=True, help_text='An alphanumeric value of the case reference', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='historicalcase',
+            name='case_reference',
+            field=models.CharField(blank=True, db_index=True, help_text='An alphanumeric value of the case reference', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='historicalreportcase',
+            name='case_reference',
+            field=models.CharField(blank=True, db_index=True, help_text='An alphanumeric value of the case reference', max_length=255),
+        ),
+        migrations.RunPython(populate_missing_case_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# the case values each search document field was made from when the search documents were added
+# (see models.CaseSearchDocumentManager), so that this migration does not change if they do
+DOCUMENT_VALUES = {
+    'reference': ('case_reference',),
+    'unit_name': ('cbrs_unit__system_unit_name',),
+    'address': ('property__street', 'property__unit', 'property__city'),
+    'policy_number': ('property__policy_number',),
+    'analyst': ('analyst__username', 'analyst__first_name', 'analyst__last_name'),
+}
+
+
+def populate_case_search_documents(apps, schema_editor):
+    Case = apps.get_model('cbrsservices', 'Case')
+    CaseSearchDocument = apps.get_model('cbrsservices', 'CaseSearchDocument')
+    document_values = DOCUMENT_VALUES
+    values = ('id',) + tuple(value for field_values in document_values.values() for value in field_values)
+    documents = []
+    for row in Case.objects.values(*values).iterator():
+        fields = {field: ' '.join(str(row[value]) for value in field_values if row[value]).lower()
+                  for field, field_values in document_values.items()}
+        documents.append(CaseSearchDocument(case_id=row['id'], document='\n'.join(fields.values()), **fields))
+    CaseSearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+# the trigram index lets PostgreSQL answer the freetext filter's contains (LIKE '%...%') lookups without a full scan
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('CREATE INDEX cbrs_casesearchdocument_document_trgm '
+                              'ON cbrs_casesearchdocument USING gin (document gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS cbrs_casesearchdocument_document_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0006_case_reference_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseSearchDocument',
+            fields=[
+                ('case', models.OneToOneField(help_text='A foreign key integer value identifying the case this search document describes', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='cbrsservices.Case')),
+                ('reference', models.TextField(blank=True, help_text='The lowercase case reference of the case')),
+                ('unit_name', models.TextField(blank=True, help_text='The lowercase name of the cbrs unit of the case')),
+                ('address', models.TextField(blank=True, help_text='The lowercase street, unit, and city of the property of the case')),
+                ('policy_number', models.TextField(blank=True, help_text='The lowercase policy number of the property of the case')),
+                ('analyst', models.TextField(blank=True, help_text='The lowercase username, first name, and last name of the analyst of the case')),
+                ('document', models.TextField(blank=True, help_text='All of the searchable values of the case, lowercase and separated by newlines')),
+            ],
+            options={
+                'db_table': 'cbrs_casesearchdocument',
+            },
+        ),
+        migrations.RunPython(populate_case_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
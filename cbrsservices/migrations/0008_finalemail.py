@@ -0,0 +1,35 @@
+# Generated by Django 2.2.10 on 2026-10-18 08:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cbrsservices', '0007_casesearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinalEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Sending', 'Sending'), ('Sent', 'Sent'), ('Failed', 'Failed')], db_index=True, default='Queued', help_text='An alphanumeric value of the delivery status of the final email ("Queued", "Sending", "Sent", or "Failed")', max_length=16)),
+                ('attempts', models.IntegerField(default=0, help_text='A numeric value of the number of times sending the final email has been attempted')),
+                ('next_attempt_date', models.DateTimeField(default=django.utils.timezone.now, help_text='The date and time after which the final email will be sent (or sent again)')),
+                ('last_attempt_date', models.DateTimeField(blank=True, help_text='The date and time sending the final email was last attempted', null=True)),
+                ('sent_date', models.DateTimeField(blank=True, help_text='The date and time the final email was sent', null=True)),
+                ('last_error', models.TextField(blank=True, help_text='An alphanumeric value of the error of the last failed attempt to send the final email')),
+                ('created_date', models.DateTimeField(auto_now_add=True, help_text='The date and time the final email was queued')),
+                ('case', models.ForeignKey(help_text='A foreign key integer value identifying the case whose final email this is', on_delete=django.db.models.deletion.CASCADE, related_name='final_emails', to='cbrsservices.Case')),
+                ('created_by', models.ForeignKey(blank=True, help_text='A foreign key integer value identifying the user who queued the final email', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='final_emails', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'cbrs_finalemail',
+            },
+        ),
+    ]
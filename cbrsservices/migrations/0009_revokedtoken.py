@@ -0,0 +1,30 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cbrsservices', '0008_finalemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_id', models.CharField(blank=True, help_text='An alphanumeric value identifying the revoked API token (blank to revoke every token of the user)', max_length=32)),
+                ('revoked_date', models.DateTimeField(default=django.utils.timezone.now, help_text='The date and time the API token (or tokens) were revoked')),
+                ('expires_date', models.DateTimeField(db_index=True, help_text='The date and time after which the revoked API token (or tokens) would have expired anyway')),
+                ('user', models.ForeignKey(db_constraint=False, help_text='A foreign key integer value identifying the user whose API token (or tokens) are revoked', on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'cbrs_revokedtoken',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0009_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['request_date', 'id'], name='cbrs_case_request_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['close_date', 'final_letter_date'], name='cbrs_case_close_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(close_date__isnull=True), fields=['qc_reviewer_signoff_date', 'analyst_signoff_date', 'id'], name='cbrs_case_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(analyst_signoff_date__isnull=False), fields=['analyst_signoff_date'], name='cbrs_case_analyst_signoff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(qc_reviewer_signoff_date__isnull=False), fields=['qc_reviewer_signoff_date'], name='cbrs_case_qc_signoff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(final_letter_date__isnull=False), fields=['final_letter_date'], name='cbrs_case_final_letter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(priority=True), fields=['id'], name='cbrs_case_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(condition=models.Q(on_hold=True), fields=['id'], name='cbrs_case_on_hold_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.10 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+def populate_rollup_keys(apps, schema_editor):
+    # the same format as models.get_rollup_key when the key was added
+    CaseCountRollup = apps.get_model('cbrsservices', 'CaseCountRollup')
+    for rollup in CaseCountRollup.objects.all():
+        rollup.key = '%s|%s|%s' % (rollup.status, '' if rollup.cbrs_unit_id is None else rollup.cbrs_unit_id,
+                                   '' if rollup.fiscal_year is None else rollup.fiscal_year)
+        rollup.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0010_case_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='casecountrollup',
+            name='key',
+            field=models.CharField(help_text='An alphanumeric value of the status, cbrs unit, and fiscal year of the counted cases, unique even when the cbrs unit or fiscal year is null', max_length=64, null=True),
+        ),
+        migrations.RunPython(populate_rollup_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='casecountrollup',
+            name='key',
+            field=models.CharField(help_text='An alphanumeric value of the status, cbrs unit, and fiscal year of the counted cases, unique even when the cbrs unit or fiscal year is null', max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:30
+
+import base64
+import os
+from django.db import migrations, models
+
+
+def replace_duplicate_case_references(apps, schema_editor):
+    # the first case with each case reference keeps it, every later case (and any case without one) gets a new one
+    Case = apps.get_model('cbrsservices', 'Case')
+    duplicates = Case.objects.values('case_reference').annotate(count=models.Count('id')).filter(count__gt=1)
+    used = set(Case.objects.values_list('case_reference', flat=True))
+    for case_reference in [row['case_reference'] for row in duplicates] + ['']:
+        cases = Case.objects.filter(case_reference=case_reference).order_by('id').only('id')
+        for case in (cases[1:] if case_reference else cases):
+            new_case_reference = base64.b16encode(os.urandom(4)).decode()
+            while new_case_reference in used:
+                new_case_reference = base64.b16encode(os.urandom(4)).decode()
+            used.add(new_case_reference)
+            case.case_reference = new_case_reference
+            case.save(update_fields=['case_reference'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cbrsservices', '0011_casecountrollup_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_duplicate_case_references, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='case',
+            name='case_reference',
+            field=models.CharField(blank=True, help_text='An alphanumeric value of the case reference', max_length=255, unique=True),
+        ),
+    ]
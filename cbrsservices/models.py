@@ -1,9 +1,14 @@
-from datetime import date
+import os
+import base64
+import time
+from datetime import date, timedelta
 from django.core import validators
-from django.core.mail import EmailMessage
-from django.db import models
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, ExtractYear
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.utils import timezone
 from localflavor.us.models import USStateField, USZipCodeField
 from simple_history.models import HistoricalRecords
 from cbrsservices.field_descriptions import *
@@ -62,6 +67,206 @@ class AddressModel(HistoryModel):
 ######
 
 
+CASE_STATUSES = ('Received', 'Awaiting QC', 'Awaiting Final Letter', 'Final', 'Closed with no Final Letter')
+
+# the status of a case computed by the database, in the same order of precedence as Case._get_status
+CASE_STATUS = models.Case(
+    models.When(close_date__isnull=False, final_letter_date__isnull=True, then=models.Value('Closed with no Final Letter')),
+    models.When(close_date__isnull=False, then=models.Value('Final')),
+    models.When(qc_reviewer_signoff_date__isnull=False, then=models.Value('Awaiting Final Letter')),
+    models.When(analyst_signoff_date__isnull=False, then=models.Value('Awaiting QC')),
+    default=models.Value('Received'),
+    output_field=models.CharField()
+)
+
+# the filter of the cases in each status (and of open cases), equivalent to filtering on CASE_STATUS, but on the date
+# fields themselves, so that the database can use the case indexes instead of computing the status of every case
+CASE_STATUS_FILTERS = {
+    'Closed with no Final Letter': models.Q(close_date__isnull=False, final_letter_date__isnull=True),
+    'Final': models.Q(close_date__isnull=False, final_letter_date__isnull=False),
+    'Awaiting Final Letter': models.Q(close_date__isnull=True, qc_reviewer_signoff_date__isnull=False),
+    'Awaiting QC': models.Q(close_date__isnull=True, qc_reviewer_signoff_date__isnull=True,
+                           analyst_signoff_date__isnull=False),
+    'Received': models.Q(close_date__isnull=True, qc_reviewer_signoff_date__isnull=True,
+                         analyst_signoff_date__isnull=True),
+    'Open': models.Q(close_date__isnull=True, final_letter_date__isnull=True),
+}
+
+
+# the fiscal year of the request date of a case, where each fiscal year starts on October 1 of the previous year
+CASE_FISCAL_YEAR = models.ExpressionWrapper(
+    ExtractYear('request_date') + models.Case(
+        models.When(request_date__month__gte=10, then=models.Value(1)),
+        default=models.Value(0),
+        output_field=models.IntegerField()
+    ),
+    output_field=models.IntegerField()
+)
+
+
+class DaysBetween(models.Func):
+    """
+    The whole number of days from the start date to the end date (null if either date is null),
+    computed by the database so that it can be filtered, sorted, and aggregated
+    """
+
+    arity = 2
+    template = '(%(expressions)s)'
+    arg_joiner = ' - '
+    output_field = models.IntegerField()
+
+    def __init__(self, end, start, **extra):
+        super(DaysBetween, self).__init__(end, start, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+                           arg_joiner=') - julianday(', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ',
+                           **extra_context)
+
+
+class Percentile(models.Aggregate):
+    """
+    The continuous percentile (e.g. 0.5 for the median) of the expression, interpolated between the nearest values
+    like PostgreSQL's percentile_cont. SQLite uses the 'percentile' aggregate registered by the receivers.
+    """
+
+    name = 'Percentile'
+    output_field = models.FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        self.fraction = float(fraction)
+        super(Percentile, self).__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        template = 'PERCENTILE(%(expressions)s, ' + repr(self.fraction) + ')'
+        return super(Percentile, self).as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = 'PERCENTILE_CONT(' + repr(self.fraction) + ') WITHIN GROUP (ORDER BY %(expressions)s)'
+        return super(Percentile, self).as_sql(compiler, connection, template=template, **extra_context)
+
+
+class SQLitePercentile(object):
+    """The 'percentile' aggregate function registered on SQLite connections (see Percentile)"""
+
+    def __init__(self):
+        self.values = []
+        self.fraction = None
+
+    def step(self, value, fraction):
+        self.fraction = fraction
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        position = (len(values) - 1) * self.fraction
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+# the days from the request date of a case to the date it reached each stage, and the date field of each stage
+CASE_DAYS = (
+    ('analyst_days', 'analyst_signoff_date'),
+    ('qc_reviewer_days', 'qc_reviewer_signoff_date'),
+    ('final_letter_days', 'final_letter_date'),
+    ('close_days', 'close_date'),
+)
+
+
+def get_new_case_reference(cases):
+    """Returns a random eight character hexadecimal reference that is not used by any of the given cases"""
+    return get_new_case_references(cases, 1)[0]
+
+
+def get_new_case_references(cases, count):
+    """Returns a list of distinct random eight character hexadecimal references not used by any of the given cases"""
+    case_references = set()
+    while len(case_references) < count:
+        candidates = {base64.b16encode(os.urandom(4)).decode() for i in range(count - len(case_references))}
+        candidates -= case_references
+        # check the candidates in chunks to stay under the database's limit on query parameters
+        candidates = list(candidates)
+        for start in range(0, len(candidates), 500):
+            chunk = candidates[start:start + 500]
+            used = set(cases.filter(case_reference__in=chunk).values_list('case_reference', flat=True))
+            case_references.update(candidate for candidate in chunk if candidate not in used)
+    return list(case_references)
+
+
+# the search document fields and how much a match in each adds to the search rank of a case
+CASE_SEARCH_WEIGHTS = (('reference', 16), ('policy_number', 8), ('address', 4), ('unit_name', 2), ('analyst', 1))
+
+
+class CaseQuerySet(models.QuerySet):
+    def with_status(self):
+        return self.annotate(status=CASE_STATUS)
+
+    def with_fiscal_year(self):
+        return self.annotate(fiscal_year=CASE_FISCAL_YEAR)
+
+    def with_days(self):
+        return self.annotate(**{name: DaysBetween(field, 'request_date') for name, field in CASE_DAYS})
+
+    def summarize_days(self, group_by=None):
+        """
+        Returns the count, mean, median, and 90th percentile of the days to each stage (see CASE_DAYS) in a single query,
+        optionally grouped by one of CASE_COUNT_GROUPS, in which case a list of summaries (one per group) is returned
+        """
+        queryset = self.with_days()
+        summaries = {}
+        for name, field in CASE_DAYS:
+            summaries[name + '_count'] = models.Count(name)
+            summaries[name + '_mean'] = models.Avg(name)
+            summaries[name + '_median'] = Percentile(name, 0.5)
+            summaries[name + '_p90'] = Percentile(name, 0.9)
+        if group_by is None:
+            return queryset.aggregate(**summaries)
+        group_field, group_strings = CASE_COUNT_GROUPS[group_by]
+        if group_by == 'fiscal_year':
+            queryset = queryset.with_fiscal_year()
+        queryset = queryset.values(group_field, **group_strings).annotate(**summaries)
+        return list(queryset.order_by(group_field))
+
+    def search(self, text):
+        """
+        Returns the cases whose search document contains the text (case-insensitive), annotated with a search_rank
+        that is higher when the text matches a more specific value (reference, then policy number, address, etc)
+        """
+        text = text.lower()
+        search_rank = models.Value(0, output_field=models.IntegerField())
+        for field, weight in CASE_SEARCH_WEIGHTS:
+            search_rank += models.Case(models.When(**{'search_document__' + field + '__contains': text, 'then': weight}),
+                                       default=0, output_field=models.IntegerField())
+        return self.filter(search_document__document__contains=text).annotate(search_rank=search_rank)
+
+
+class CaseManager(models.Manager):
+    def get_queryset(self):
+        return CaseQuerySet(self.model, using=self._db)
+
+    def with_status(self):
+        return self.get_queryset().with_status()
+
+    def with_fiscal_year(self):
+        return self.get_queryset().with_fiscal_year()
+
+    def with_days(self):
+        return self.get_queryset().with_days()
+
+    def summarize_days(self, group_by=None):
+        return self.get_queryset().summarize_days(group_by)
+
+    def search(self, text):
+        return self.get_queryset().search(text)
+
+
 class Case(HistoryModel):
     """
     An official case to document the CBRS determination for a property on behalf of a requester.
@@ -73,8 +278,10 @@ class Case(HistoryModel):
         return '%s' % self.id
 
     def _get_status(self):
-        """Returns the status of the record"""
-        if self.close_date and not self.final_letter_date:
+        """Returns the status of the record, preferring the value annotated by CaseQuerySet.with_status"""
+        if self._status is not None:
+            return self._status
+        elif self.close_date and not self.final_letter_date:
             return 'Closed with no Final Letter'
         elif self.close_date:
             return 'Final'
@@ -85,13 +292,41 @@ class Case(HistoryModel):
         else:
             return 'Received'
 
-    def send_final_email(self):
+    def _set_status(self, value):
+        """Stores the status annotated by the database, so it is not recomputed for each record"""
+        self._status = value
+
+    # the number of times a new case is saved with a new case reference, when another case took the one it was given
+    case_reference_attempts = 5
+
+    def save(self, *args, **kwargs):
+        # an annotated status is stale once the record changes, so fall back to computing it
+        self._status = None
+        # only new cases without a case reference are given one (by the case_pre_save receiver)
+        if self.pk is not None or self.case_reference:
+            super(Case, self).save(*args, **kwargs)
+            return
+        for attempt in range(self.case_reference_attempts):
+            try:
+                # the savepoint keeps a failed insert from breaking the caller's transaction
+                with transaction.atomic(using=kwargs.get('using', None)):
+                    super(Case, self).save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # another case took the new case reference between its check and this insert, so try another one
+                if attempt == self.case_reference_attempts - 1 or \
+                        not Case.objects.filter(case_reference=self.case_reference).exists():
+                    raise
+                self.case_reference = ''
+
+    def get_final_email(self):
+        """Returns the final email of the case, with the final letter as attachment, or None if it has no final letter"""
         if self.final_letter_date is not None:
 
             cbrs_email_address = "CBRAdeterminations@fws.gov"
             other_cbrs_email_addresses = ["CBRA@fws.gov", ]
 
-            # construct and send the final email with the final letter as attachment
+            # construct the final email with the final letter as attachment
             subject = "Coastal Barrier Resources Act Determination Case " + self.case_reference
             body = "Dear Requester,\r\n\r\n"
             body += "Attached is the Coastal Barrier Resources Act determination that you requested"
@@ -113,16 +348,25 @@ class Case(HistoryModel):
             email = EmailMessage(subject, body, from_address, to_addresses_list, bcc_addresses_list,
                                  reply_to=reply_to_list, headers=headers)
             email.attach_file(attachments[0].file.path)
+            return email
+        return None
+
+    def send_final_email(self, connection=None):
+        """Sends the final email right away (the final email outbox sends it in the background instead)"""
+        email = self.get_final_email()
+        if email is not None:
+            email.connection = connection
             email.send(fail_silently=False)
 
     # for new records, there is a custom signal receiver in the receivers.py file listening for
-    # the post_save event signal, and when the post_save's 'created' boolean is true,
-    # this custom receiver will create the case hash (public ID) and send a confirmation email
+    # the pre_save event signal, and when the case has no id yet,
+    # this custom receiver will create the case reference (public ID) so it is saved in the same insert
 
     case_number = property(_get_id)
-    case_reference = models.CharField(max_length=255, blank=True, help_text=case.case_reference)
+    case_reference = models.CharField(max_length=255, blank=True, unique=True, help_text=case.case_reference)
     duplicate = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, help_text=case.duplicate)
-    status = property(_get_status)
+    _status = None
+    status = property(_get_status, _set_status)
     request_date = models.DateField(default=date.today, null=True, blank=True, help_text=case.request_date)
     requester = models.ForeignKey('Requester', on_delete=models.PROTECT, related_name='cases', help_text=case.requester)
     property = models.ForeignKey('Property', on_delete=models.PROTECT, related_name='cases', help_text=case.property)
@@ -151,12 +395,34 @@ class Case(HistoryModel):
     invalid = models.BooleanField(default=False, help_text=case.invalid)
     hard_copy_map_reviewed = models.BooleanField(default=False, help_text=case.hard_copy_map_reviewed)
     tags = models.ManyToManyField('Tag', through='CaseTag', related_name='cases', help_text=case.tags)
+    objects = CaseManager()
 
     def __str__(self):
         return self.case_number
 
     class Meta:
         db_table = "cbrs_case"
+        # indexes matching the status, date range, and flag filters of the workbench and reports (see CaseFilter and
+        # ReportCaseFilter), which the explain_case_filters command checks against a synthetic dataset
+        indexes = [
+            # request date ranges and fiscal years, and the keyset pagination ordering by request date and id
+            models.Index(fields=['request_date', 'id'], name='cbrs_case_request_date_idx'),
+            # the closed statuses (by whether there is a final letter), and close date ranges
+            models.Index(fields=['close_date', 'final_letter_date'], name='cbrs_case_close_date_idx'),
+            # the open statuses, by how far along the workflow each open case is
+            models.Index(fields=['qc_reviewer_signoff_date', 'analyst_signoff_date', 'id'], name='cbrs_case_open_idx',
+                         condition=models.Q(close_date__isnull=True)),
+            # the date ranges of the other stages, which leave out the (many) cases that have not reached the stage
+            models.Index(fields=['analyst_signoff_date'], name='cbrs_case_analyst_signoff_idx',
+                         condition=models.Q(analyst_signoff_date__isnull=False)),
+            models.Index(fields=['qc_reviewer_signoff_date'], name='cbrs_case_qc_signoff_idx',
+                         condition=models.Q(qc_reviewer_signoff_date__isnull=False)),
+            models.Index(fields=['final_letter_date'], name='cbrs_case_final_letter_idx',
+                         condition=models.Q(final_letter_date__isnull=False)),
+            # the few priority and on hold cases
+            models.Index(fields=['id'], name='cbrs_case_priority_idx', condition=models.Q(priority=True)),
+            models.Index(fields=['id'], name='cbrs_case_on_hold_idx', condition=models.Q(on_hold=True)),
+        ]
 
 
 class CaseFile(HistoryModel):
@@ -434,52 +700,65 @@ class FieldOffice(HistoryModel):
 ######
 
 
-class ReportCaseCountsQuerySet(models.QuerySet):
-    def count_cases_by_status(self):
-        count_cases = self.count_closed().copy()
-        count_cases.update(self.count_closed_no_final_letter())
-        count_cases.update(self.count_awaiting_final_letter())
-        count_cases.update(self.count_awaiting_qc())
-        count_cases.update(self.count_received())
-        return count_cases
+# the count keys returned by the case counts report, and the status each one counts
+CASE_STATUS_COUNTS = (
+    ('count_closed', 'Final'),
+    ('count_closed_no_final_letter', 'Closed with no Final Letter'),
+    ('count_awaiting_final_letter', 'Awaiting Final Letter'),
+    ('count_awaiting_level_1_qc', 'Awaiting QC'),
+    ('count_received', 'Received'),
+)
+
+# the field each case counts report grouping is keyed by, along with any display values returned with it
+CASE_COUNT_GROUPS = {
+    'cbrs_unit': ('cbrs_unit', {'cbrs_unit_string': models.F('cbrs_unit__system_unit_number')}),
+    'analyst': ('analyst', {'analyst_string': models.F('analyst__username')}),
+    'fiscal_year': ('fiscal_year', {}),
+}
+
+
+class ReportCaseCountsQuerySet(CaseQuerySet):
+    def _status_counts(self):
+        return {key: models.Count('id', filter=models.Q(status=status)) for key, status in CASE_STATUS_COUNTS}
+
+    def count_cases_by_status(self, group_by=None):
+        """
+        Counts the cases in each status in a single query, optionally grouped by one of CASE_COUNT_GROUPS,
+        in which case a list of counts (one per group) is returned instead of a single dict of counts
+        """
+        queryset = self.with_status()
+        if group_by is None:
+            return queryset.aggregate(**self._status_counts())
+        group_field, group_strings = CASE_COUNT_GROUPS[group_by]
+        if group_by == 'fiscal_year':
+            queryset = queryset.with_fiscal_year()
+        queryset = queryset.values(group_field, **group_strings).annotate(**self._status_counts())
+        return list(queryset.order_by(group_field))
 
     def count_closed_no_final_letter(self):
-        return self.filter(close_date__isnull=False,
-                           final_letter_date__isnull=True
+        return self.filter(CASE_STATUS_FILTERS['Closed with no Final Letter']
                            ).aggregate(count_closed_no_final_letter=models.Count('id'))
 
     def count_closed(self):
-        return self.filter(close_date__isnull=False,
-                           final_letter_date__isnull=False
-                           ).aggregate(count_closed=models.Count('id'))
+        return self.filter(CASE_STATUS_FILTERS['Final']).aggregate(count_closed=models.Count('id'))
 
     def count_awaiting_final_letter(self):
-        return self.filter(qc_reviewer_signoff_date__isnull=False,
-                           close_date__isnull=True,
-                           final_letter_date__isnull=True
+        return self.filter(CASE_STATUS_FILTERS['Awaiting Final Letter']
                            ).aggregate(count_awaiting_final_letter=models.Count('id'))
 
     def count_awaiting_qc(self):
-        return self.filter(analyst_signoff_date__isnull=False,
-                           qc_reviewer_signoff_date__isnull=True,
-                           close_date__isnull=True,
-                           final_letter_date__isnull=True
-                           ).aggregate(count_awaiting_level_1_qc=models.Count('id'))
+        return self.filter(CASE_STATUS_FILTERS['Awaiting QC']).aggregate(count_awaiting_level_1_qc=models.Count('id'))
 
     def count_received(self):
-        return self.filter(analyst_signoff_date__isnull=True,
-                           qc_reviewer_signoff_date__isnull=True,
-                           close_date__isnull=True,
-                           final_letter_date__isnull=True
-                           ).aggregate(count_received=models.Count('id'))
+        return self.filter(CASE_STATUS_FILTERS['Received']).aggregate(count_received=models.Count('id'))
 
 
 class ReportCaseCountsManager(models.Manager):
     def get_queryset(self):
         return ReportCaseCountsQuerySet(self.model, using=self._db)
 
-    def count_cases_by_status(self):
-        return self.get_queryset().count_cases_by_status()
+    def count_cases_by_status(self, group_by=None):
+        return self.get_queryset().count_cases_by_status(group_by)
 
     def count_closed_no_final_letter(self):
         return self.get_queryset().count_closed_no_final_letter()
@@ -500,41 +779,86 @@ class ReportCaseCountsManager(models.Manager):
 class ReportCase(Case):
 
     def _get_analyst_days(self):
-        """Returns the number of days needed to get analyst signoff (Awaiting QC Level 1 Date - Request Date)"""
-        if self.request_date and self.analyst_signoff_date:
+        """
+        Returns the number of days needed to get analyst signoff (Awaiting QC Level 1 Date - Request Date),
+        preferring the value annotated by CaseQuerySet.with_days
+        """
+        if self._analyst_days is not None:
+            return self._analyst_days
+        elif self.request_date and self.analyst_signoff_date:
             analyst_time = self.analyst_signoff_date - self.request_date
             return analyst_time.days
         else:
             return None
 
+    def _set_analyst_days(self, value):
+        """Stores the days annotated by the database, so they are not recomputed for each record"""
+        self._analyst_days = value
+
     def _get_qc_reviewer_days(self):
-        """Returns the number of days needed to get qc reviewer signoff (Awaiting QC Level 2 Date - Request Date)"""
-        if self.request_date and self.qc_reviewer_signoff_date:
+        """
+        Returns the number of days needed to get qc reviewer signoff (Awaiting QC Level 2 Date - Request Date),
+        preferring the value annotated by CaseQuerySet.with_days
+        """
+        if self._qc_reviewer_days is not None:
+            return self._qc_reviewer_days
+        elif self.request_date and self.qc_reviewer_signoff_date:
             qc_reviewer_time = self.qc_reviewer_signoff_date - self.request_date
             return qc_reviewer_time.days
         else:
             return None
 
+    def _set_qc_reviewer_days(self, value):
+        """Stores the days annotated by the database, so they are not recomputed for each record"""
+        self._qc_reviewer_days = value
+
     def _get_final_letter_days(self):
-        """Returns the number of days needed to get the final letter (Final Letter Date - Request Date)"""
-        if self.request_date and self.final_letter_date:
+        """
+        Returns the number of days needed to get the final letter (Final Letter Date - Request Date),
+        preferring the value annotated by CaseQuerySet.with_days
+        """
+        if self._final_letter_days is not None:
+            return self._final_letter_days
+        elif self.request_date and self.final_letter_date:
             final_letter_time = self.final_letter_date - self.request_date
             return final_letter_time.days
         else:
             return None
 
+    def _set_final_letter_days(self, value):
+        """Stores the days annotated by the database, so they are not recomputed for each record"""
+        self._final_letter_days = value
+
     def _get_close_days(self):
-        """Returns the number of days needed to close the case (Close Date - Request Date)"""
-        if self.request_date and self.close_date:
+        """
+        Returns the number of days needed to close the case (Close Date - Request Date),
+        preferring the value annotated by CaseQuerySet.with_days
+        """
+        if self._close_days is not None:
+            return self._close_days
+        elif self.request_date and self.close_date:
             close_time = self.close_date - self.request_date
             return close_time.days
         else:
             return None
 
-    analyst_days = property(_get_analyst_days)
-    qc_reviewer_days = property(_get_qc_reviewer_days)
-    final_letter_days = property(_get_final_letter_days)
-    close_days = property(_get_close_days)
+    def _set_close_days(self, value):
+        """Stores the days annotated by the database, so they are not recomputed for each record"""
+        self._close_days = value
+
+    def save(self, *args, **kwargs):
+        # annotated days are stale once the record changes, so fall back to computing them
+        self._analyst_days = self._qc_reviewer_days = self._final_letter_days = self._close_days = None
+        super(ReportCase, self).save(*args, **kwargs)
+
+    _analyst_days = None
+    analyst_days = property(_get_analyst_days, _set_analyst_days)
+    _qc_reviewer_days = None
+    qc_reviewer_days = property(_get_qc_reviewer_days, _set_qc_reviewer_days)
+    _final_letter_days = None
+    final_letter_days = property(_get_final_letter_days, _set_final_letter_days)
+    _close_days = None
+    close_days = property(_get_close_days, _set_close_days)
     report_case_counts = ReportCaseCountsManager()
 
     def __str__(self):
@@ -542,3 +866,345 @@ class ReportCase(Case):
 
     class Meta:
         proxy = True
+
+
+def get_rollup_key(status, cbrs_unit, fiscal_year):
+    """
+    Returns the unique key of a rollup row, where a null cbrs_unit or fiscal_year is an empty part of the key
+    (the database's unique_together does not stop duplicate rows when one of their fields is null)
+    """
+    return '%s|%s|%s' % (status, '' if cbrs_unit is None else cbrs_unit, '' if fiscal_year is None else fiscal_year)
+
+
+class CaseCountRollupQuerySet(models.QuerySet):
+    def _status_counts(self):
+        return {key: Coalesce(models.Sum('count', filter=models.Q(status=status)), 0)
+                for key, status in CASE_STATUS_COUNTS}
+
+    def count_cases_by_status(self, group_by=None):
+        """
+        Returns the same counts as ReportCaseCountsQuerySet.count_cases_by_status, read from the rollup table,
+        optionally grouped by cbrs_unit or fiscal_year (the rollup does not track analysts)
+        """
+        if group_by is None:
+            return self.aggregate(**self._status_counts())
+        group_field, group_strings = CASE_COUNT_GROUPS[group_by]
+        queryset = self.filter(count__gt=0).values(group_field, **group_strings).annotate(**self._status_counts())
+        return list(queryset.order_by(group_field))
+
+
+class CaseCountRollupManager(models.Manager):
+    def get_queryset(self):
+        return CaseCountRollupQuerySet(self.model, using=self._db)
+
+    # the live case counts, grouped the same way as the rollup table
+    def _count_cases(self):
+        queryset = Case.objects.with_status().with_fiscal_year()
+        queryset = queryset.values('status', 'cbrs_unit', 'fiscal_year').annotate(count=models.Count('id'))
+        return {(row['status'], row['cbrs_unit'], row['fiscal_year']): row['count'] for row in queryset.order_by()}
+
+    def count_cases_by_status(self, group_by=None):
+        return self.get_queryset().count_cases_by_status(group_by)
+
+    def get_case_key(self, case_id):
+        """Returns the (status, cbrs_unit, fiscal_year) rollup key of a case as currently stored in the database"""
+        row = Case.objects.with_status().with_fiscal_year().filter(id=case_id).values(
+            'status', 'cbrs_unit', 'fiscal_year').first()
+        return (row['status'], row['cbrs_unit'], row['fiscal_year']) if row else None
+
+    def adjust(self, key, delta):
+        """Adds delta to the count of the given (status, cbrs_unit, fiscal_year) rollup key"""
+        status, cbrs_unit, fiscal_year = key
+        rollup_key = get_rollup_key(status, cbrs_unit, fiscal_year)
+        # update in place, so that concurrent adjustments of the same key add up instead of overwriting each other
+        if self.filter(key=rollup_key).update(count=models.F('count') + delta):
+            return
+        try:
+            # the savepoint keeps a losing insert from breaking the caller's transaction
+            with transaction.atomic(using=self.db):
+                self.create(key=rollup_key, status=status, cbrs_unit_id=cbrs_unit, fiscal_year=fiscal_year,
+                            count=delta)
+        except IntegrityError:
+            # another transaction created the key first
+            self.filter(key=rollup_key).update(count=models.F('count') + delta)
+
+    def add_cases(self, case_ids):
+        """Adds the given cases, which were created without firing the case receivers, to their rollup keys"""
+        queryset = Case.objects.with_status().with_fiscal_year().filter(id__in=case_ids)
+        queryset = queryset.values('status', 'cbrs_unit', 'fiscal_year').annotate(count=models.Count('id'))
+        for row in queryset.order_by():
+            self.adjust((row['status'], row['cbrs_unit'], row['fiscal_year']), row['count'])
+
+    def rebuild(self):
+        """Replaces the contents of the rollup table with a live recount of all cases"""
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create([self.model(key=get_rollup_key(status, cbrs_unit, fiscal_year), status=status,
+                                         cbrs_unit_id=cbrs_unit, fiscal_year=fiscal_year, count=count)
+                              for (status, cbrs_unit, fiscal_year), count in self._count_cases().items()])
+
+    def compare(self):
+        """
+        Returns a list of (status, cbrs_unit, fiscal_year, rollup_count, live_count) tuples
+        for every rollup key where the rollup table disagrees with a live recount of all cases
+        """
+        live_counts = self._count_cases()
+        rollup_counts = {}
+        for row in self.values('status', 'cbrs_unit', 'fiscal_year', 'count'):
+            key = (row['status'], row['cbrs_unit'], row['fiscal_year'])
+            rollup_counts[key] = rollup_counts.get(key, 0) + row['count']
+        differences = []
+        for key in set(live_counts) | set(rollup_counts):
+            if live_counts.get(key, 0) != rollup_counts.get(key, 0):
+                differences.append(key + (rollup_counts.get(key, 0), live_counts.get(key, 0)))
+        return sorted(differences, key=str)
+
+
+class CaseCountRollup(models.Model):
+    """
+    Count of cases in each status for each CBRS unit and fiscal year, kept current by the case receivers,
+    so that the case counts report does not need to scan the whole case table.
+    """
+
+    status = models.CharField(max_length=32, help_text=casecountrollup.status)
+    cbrs_unit = models.ForeignKey('SystemUnit', on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='case_count_rollups', help_text=casecountrollup.cbrs_unit)
+    fiscal_year = models.IntegerField(null=True, blank=True, help_text=casecountrollup.fiscal_year)
+    count = models.IntegerField(default=0, help_text=casecountrollup.count)
+    key = models.CharField(max_length=64, unique=True, help_text=casecountrollup.key)
+    objects = CaseCountRollupManager()
+
+    def __str__(self):
+        return str(self.status) + " - " + str(self.cbrs_unit_id) + " - " + str(self.fiscal_year)
+
+    class Meta:
+        db_table = "cbrs_casecountrollup"
+        unique_together = ("status", "cbrs_unit", "fiscal_year")
+
+
+######
+#
+#  Search
+#
+######
+
+
+class CaseSearchDocumentManager(models.Manager):
+    # the case values that make up each search document field
+    document_values = {
+        'reference': ('case_reference',),
+        'unit_name': ('cbrs_unit__system_unit_name',),
+        'address': ('property__street', 'property__unit', 'property__city'),
+        'policy_number': ('property__policy_number',),
+        'analyst': ('analyst__username', 'analyst__first_name', 'analyst__last_name'),
+    }
+    batch_size = 500
+
+    def build(self, row):
+        """Returns an unsaved search document from a dict of the case values it is made from"""
+        fields = {field: ' '.join(str(row[value]) for value in values if row[value]).lower()
+                  for field, values in self.document_values.items()}
+        return self.model(case_id=row['id'], document='\n'.join(fields.values()), **fields)
+
+    def refresh(self, case_ids):
+        """Replaces the search documents of the given cases with ones built from their current values"""
+        case_ids = list(case_ids)
+        values = ('id',) + tuple(value for values in self.document_values.values() for value in values)
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(case_ids), self.batch_size):
+                chunk = case_ids[start:start + self.batch_size]
+                self.filter(case_id__in=chunk).delete()
+                self.bulk_create([self.build(row) for row in Case.objects.filter(id__in=chunk).values(*values)])
+
+    def rebuild(self):
+        """Replaces the search documents of all cases"""
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.refresh(Case.objects.values_list('id', flat=True).order_by('id'))
+
+
+class CaseSearchDocument(models.Model):
+    """
+    Lowercase copy of the searchable values of a case and its property, cbrs unit, and analyst, kept current by the
+    receivers, so that the freetext filter searches one table instead of joining five.
+    On PostgreSQL the document column has a trigram index, which the contains lookup can use.
+    """
+
+    case = models.OneToOneField('Case', on_delete=models.CASCADE, primary_key=True, related_name='search_document',
+                                help_text=casesearchdocument.case)
+    reference = models.TextField(blank=True, help_text=casesearchdocument.reference)
+    unit_name = models.TextField(blank=True, help_text=casesearchdocument.unit_name)
+    address = models.TextField(blank=True, help_text=casesearchdocument.address)
+    policy_number = models.TextField(blank=True, help_text=casesearchdocument.policy_number)
+    analyst = models.TextField(blank=True, help_text=casesearchdocument.analyst)
+    document = models.TextField(blank=True, help_text=casesearchdocument.document)
+    objects = CaseSearchDocumentManager()
+
+    def __str__(self):
+        return str(self.case_id)
+
+    class Meta:
+        db_table = "cbrs_casesearchdocument"
+
+
+######
+#
+#  Email Outbox
+#
+######
+
+
+FINAL_EMAIL_QUEUED = 'Queued'
+FINAL_EMAIL_SENDING = 'Sending'
+FINAL_EMAIL_SENT = 'Sent'
+FINAL_EMAIL_FAILED = 'Failed'
+FINAL_EMAIL_STATUSES = (FINAL_EMAIL_QUEUED, FINAL_EMAIL_SENDING, FINAL_EMAIL_SENT, FINAL_EMAIL_FAILED)
+
+
+class FinalEmailManager(models.Manager):
+    def queue(self, case, user=None):
+        """Queues the final email of the case, unless one is already waiting to be sent, and returns it"""
+        waiting = self.filter(case=case, status__in=(FINAL_EMAIL_QUEUED, FINAL_EMAIL_SENDING)).first()
+        if waiting is not None:
+            return waiting
+        return self.create(case=case, created_by=user)
+
+    def claim(self, batch_size):
+        """
+        Marks up to batch_size emails that are due as sending, and returns them. An email that was left sending
+        for longer than the FINAL_EMAIL_SENDING_TIMEOUT setting (e.g. by a worker that died) is due again.
+        """
+        now = timezone.now()
+        timeout = getattr(settings, 'FINAL_EMAIL_SENDING_TIMEOUT', 600)
+        due = (models.Q(status=FINAL_EMAIL_QUEUED, next_attempt_date__lte=now) |
+               models.Q(status=FINAL_EMAIL_SENDING, last_attempt_date__lte=now - timedelta(seconds=timeout)))
+        with transaction.atomic(using=self.db):
+            # skip the rows locked by other workers (on databases that support it) so no email is sent twice
+            emails = list(self.select_for_update(skip_locked=True).filter(due).select_related(
+                'case__requester').order_by('next_attempt_date', 'id')[:batch_size])
+            self.filter(id__in=[email.id for email in emails]).update(
+                status=FINAL_EMAIL_SENDING, last_attempt_date=now, attempts=models.F('attempts') + 1)
+        for email in emails:
+            email.status, email.last_attempt_date, email.attempts = FINAL_EMAIL_SENDING, now, email.attempts + 1
+        return emails
+
+    def send_batch(self, batch_size=None):
+        """
+        Sends up to batch_size due emails over a single email connection, and returns the (sent, failed) counts.
+        An email that cannot be sent is retried after the FINAL_EMAIL_RETRY_DELAY setting (in seconds),
+        doubled after each attempt, until it has been attempted FINAL_EMAIL_MAX_ATTEMPTS times.
+        """
+        batch_size = batch_size or getattr(settings, 'FINAL_EMAIL_BATCH_SIZE', 50)
+        emails = self.claim(batch_size)
+        if not emails:
+            return 0, 0
+        sent = failed = 0
+        try:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+        except Exception as e:
+            # without a connection nothing in the batch can be sent, so all of it is retried later
+            for email in emails:
+                email.retry_later(e)
+            return 0, len(emails)
+        try:
+            for email in emails:
+                try:
+                    email.case.send_final_email(connection)
+                except Exception as e:
+                    email.retry_later(e)
+                    failed += 1
+                else:
+                    email.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+        return sent, failed
+
+
+class FinalEmail(models.Model):
+    """
+    Final email of a case waiting in (or sent from) the outbox, which a background worker
+    (the send_final_emails management command) sends with retries, so requests never wait on the mail server.
+    """
+
+    case = models.ForeignKey('Case', on_delete=models.CASCADE, related_name='final_emails', help_text=finalemail.case)
+    status = models.CharField(max_length=16, default=FINAL_EMAIL_QUEUED, db_index=True,
+                              choices=[(status, status) for status in FINAL_EMAIL_STATUSES],
+                              help_text=finalemail.status)
+    attempts = models.IntegerField(default=0, help_text=finalemail.attempts)
+    next_attempt_date = models.DateTimeField(default=timezone.now, help_text=finalemail.next_attempt_date)
+    last_attempt_date = models.DateTimeField(null=True, blank=True, help_text=finalemail.last_attempt_date)
+    sent_date = models.DateTimeField(null=True, blank=True, help_text=finalemail.sent_date)
+    last_error = models.TextField(blank=True, help_text=finalemail.last_error)
+    created_date = models.DateTimeField(auto_now_add=True, help_text=finalemail.created_date)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name="final_emails", help_text=finalemail.created_by)
+    objects = FinalEmailManager()
+
+    def mark_sent(self):
+        self.status, self.sent_date, self.last_error = FINAL_EMAIL_SENT, timezone.now(), ''
+        self.save(update_fields=['status', 'sent_date', 'last_error'])
+
+    def retry_later(self, error):
+        """Records the error, and queues the email again after a backoff, or fails it after the last attempt"""
+        self.last_error = '%s: %s' % (type(error).__name__, error)
+        if self.attempts >= getattr(settings, 'FINAL_EMAIL_MAX_ATTEMPTS', 5):
+            self.status = FINAL_EMAIL_FAILED
+        else:
+            delay = getattr(settings, 'FINAL_EMAIL_RETRY_DELAY', 60) * 2 ** (self.attempts - 1)
+            self.status, self.next_attempt_date = FINAL_EMAIL_QUEUED, timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['status', 'next_attempt_date', 'last_error'])
+
+    def __str__(self):
+        return str(self.case_id) + " - " + str(self.status)
+
+    class Meta:
+        db_table = "cbrs_finalemail"
+
+
+######
+#
+#  API Tokens
+#
+######
+
+
+class RevokedTokenManager(models.Manager):
+    def revoke(self, token):
+        """Revokes the API token (given as its verified payload) until it expires"""
+        self.purge()
+        max_age = getattr(settings, 'API_TOKEN_MAX_AGE', 60 * 60 * 8)
+        expires = timezone.now() + timedelta(seconds=max(token['issued'] + max_age - time.time(), 0))
+        return self.create(token_id=token['token'], user_id=token['user'], expires_date=expires)
+
+    def revoke_user(self, user_id):
+        """Revokes every API token issued to the user so far, e.g. when the user is deactivated or deleted"""
+        self.purge()
+        max_age = getattr(settings, 'API_TOKEN_MAX_AGE', 60 * 60 * 8)
+        return self.create(user_id=user_id, expires_date=timezone.now() + timedelta(seconds=max_age))
+
+    def purge(self):
+        """Deletes the revocations of tokens that have expired anyway, and returns their number"""
+        return self.filter(expires_date__lt=timezone.now()).delete()[0]
+
+
+class RevokedToken(models.Model):
+    """
+    Revoked API token (by its token id), or every API token of a user issued before the revoked date (no token id).
+    Verifying a token needs no query, so the authentication keeps these in memory (see TokenRevocationList).
+    """
+
+    token_id = models.CharField(max_length=32, blank=True, help_text=revokedtoken.token_id)
+    # the user may be deleted while their tokens are still unexpired, so this is not a database constraint
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name='+', help_text=revokedtoken.user)
+    revoked_date = models.DateTimeField(default=timezone.now, help_text=revokedtoken.revoked_date)
+    expires_date = models.DateTimeField(db_index=True, help_text=revokedtoken.expires_date)
+    objects = RevokedTokenManager()
+
+    def __str__(self):
+        return str(self.user_id) + " - " + (self.token_id or "all")
+
+    class Meta:
+        db_table = "cbrs_revokedtoken"
@@ -1,7 +1,144 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = 'page_size'
-    max_page_size = None
+    max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 1000)
+
+
+class KeysetResultsSetPagination(BasePagination):
+    """
+    Pagination that pages through records by their position in the ordering (the last id or request date and id seen)
+    instead of by offset, so deep pages cost the same as the first page and no COUNT(*) is run unless asked for.
+    Null request dates are ordered after all other request dates (before them when descending).
+    """
+
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 1000)
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # the allowed orderings, each a tuple of (field, descending) pairs that always ends with the unique id
+    orderings = {
+        'id': (('id', False),),
+        '-id': (('id', True),),
+        'request_date': (('request_date', False), ('id', False)),
+        '-request_date': (('request_date', True), ('id', True)),
+    }
+    default_ordering = 'id'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                 cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        return self.orderings.get(ordering, self.orderings[self.default_ordering])
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param, None)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = cursor['p']
+            if len(position) != len(self.ordering):
+                raise ValueError
+            position[-1] = int(position[-1])
+            return position, bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, record, reverse):
+        # records are model instances, or dicts when the page was read with values()
+        position = [record[field] if isinstance(record, dict) else getattr(record, field)
+                    for field, descending in self.ordering]
+        position = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        cursor = urlsafe_b64encode(json.dumps({'p': position, 'r': int(reverse)}).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_order_by(self, reverse):
+        # nulls are treated as greater than every value, so they come last ascending and first descending
+        order_by = []
+        for field, descending in self.ordering:
+            if descending != reverse:
+                order_by.append(F(field).desc(nulls_first=True))
+            else:
+                order_by.append(F(field).asc(nulls_last=True))
+        return order_by
+
+    def get_position_filter(self, position, reverse):
+        # records after the position in the (possibly reversed) ordering, where the last field is the unique id
+        (id_field, id_descending), id_value = self.ordering[-1], position[-1]
+        id_after = Q(**{id_field + ('__lt' if id_descending != reverse else '__gt'): id_value})
+        if len(self.ordering) == 1:
+            return id_after
+        (field, descending), value = self.ordering[0], position[0]
+        if value is None:
+            position_filter = Q(**{field + '__isnull': True}) & id_after
+            if descending != reverse:
+                position_filter |= Q(**{field + '__isnull': False})
+        else:
+            position_filter = Q(**{field: value}) & id_after
+            if descending != reverse:
+                position_filter |= Q(**{field + '__lt': value})
+            else:
+                position_filter |= Q(**{field + '__gt': value}) | Q(**{field + '__isnull': True})
+        return position_filter
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        cursor = self.decode_cursor(request)
+        position, reverse = cursor if cursor is not None else (None, False)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if position is not None:
+            # the position values of a tampered cursor may not be valid for their fields (e.g. a bad date)
+            try:
+                queryset = queryset.filter(self.get_position_filter(position, reverse))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        # fetch one extra record to find out if there is another page in this direction
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # an empty page (only reachable when records were removed since the link was made) has no links
+        self.next = None
+        self.previous = None
+        if results:
+            if has_more or reverse:
+                self.next = self.encode_cursor(results[-1], False)
+            if (has_more and reverse) or (position is not None and not reverse):
+                self.previous = self.encode_cursor(results[0], True)
+        return results
+
+    def get_paginated_response(self, data):
+        response_data = [('next', self.next), ('previous', self.previous), ('results', data)]
+        if self.count is not None:
+            response_data.insert(0, ('count', self.count))
+        return Response(dict(response_data))
@@ -0,0 +1,166 @@
+import re
+import zlib
+
+
+########################################################################################################################
+#
+#  A small PDF writer, which lays out paragraphs of styled text runs on letter-size pages using only the standard
+#  Times fonts (which every PDF reader provides, so no font files are embedded), for documents like the final letters.
+#
+########################################################################################################################
+
+
+def _widths(widths, extra):
+    """Returns a dict of the widths (in thousandths of the font size) of the characters from space to tilde,
+    plus the extra Windows-1252 characters"""
+    return dict(zip((chr(code) for code in range(32, 127)), widths), **extra)
+
+
+FONT_WIDTHS = {
+    'Times-Roman': _widths((
+        250, 333, 408, 500, 500, 833, 778, 180, 333, 333, 500, 564, 250, 333, 250, 278,
+        500, 500, 500, 500, 500, 500, 500, 500, 500, 500, 278, 278, 564, 564, 564, 444,
+        921, 722, 667, 667, 722, 611, 556, 722, 722, 333, 389, 722, 611, 889, 722, 722,
+        556, 722, 667, 556, 611, 722, 722, 944, 722, 722, 611, 333, 278, 333, 469, 500,
+        333, 444, 500, 444, 500, 444, 333, 500, 500, 278, 278, 500, 278, 778, 500, 500,
+        500, 500, 333, 389, 278, 500, 500, 722, 500, 500, 444, 480, 200, 480, 541),
+        {'‘': 333, '’': 333, '“': 444, '”': 444, '–': 500, '—': 1000, '\xa7': 500}),
+    'Times-Bold': _widths((
+        250, 333, 555, 500, 500, 1000, 833, 278, 333, 333, 500, 570, 250, 333, 250, 278,
+        500, 500, 500, 500, 500, 500, 500, 500, 500, 500, 333, 333, 570, 570, 570, 500,
+        930, 722, 667, 722, 722, 667, 611, 778, 778, 389, 500, 778, 667, 944, 722, 778,
+        611, 778, 722, 556, 667, 722, 722, 1000, 722, 722, 667, 333, 278, 333, 581, 500,
+        333, 500, 556, 444, 556, 444, 333, 500, 556, 278, 333, 556, 278, 833, 556, 500,
+        556, 556, 444, 389, 333, 556, 500, 722, 500, 500, 444, 394, 220, 394, 520),
+        {'‘': 333, '’': 333, '“': 500, '”': 500, '–': 500, '—': 1000, '\xa7': 500}),
+}
+# the ascent of the Times fonts, as a fraction of the font size
+FONT_ASCENT = 0.891
+
+
+class PDFDocument(object):
+    """
+    This class will lay out paragraphs of text runs, each with its own font, size, color, and underline,
+    wrapping words at the margins, moving to tab stops, breaking lines at newlines, and starting new pages as needed,
+    and then write the pages as a PDF file.
+    All measurements are in points (1/72 inch).
+    """
+
+    def __init__(self, page_width=612, page_height=792, top_margin=72, right_margin=72, bottom_margin=72,
+                 left_margin=72, tab_width=36, line_spacing=1.15, space_after=10):
+        self.page_width = page_width
+        self.page_height = page_height
+        self.top_margin = top_margin
+        self.bottom_margin = bottom_margin
+        self.left_margin = left_margin
+        self.text_width = page_width - left_margin - right_margin
+        self.tab_width = tab_width
+        self.line_spacing = line_spacing
+        self.space_after = space_after
+        self.fonts = {name: '/F%d' % i for i, name in enumerate(FONT_WIDTHS, start=1)}
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+        self.y = self.page_height - self.top_margin
+
+    @staticmethod
+    def get_width(text, font, size):
+        widths = FONT_WIDTHS[font]
+        return sum(widths.get(char, 500) for char in text) * size / 1000.0
+
+    def add_paragraph(self, runs):
+        """
+        Lays out a paragraph of (text, font, size, color, underline) runs, where color is an (r, g, b) tuple of
+        fractions, starting at the next line
+        """
+        line = []  # the [x, text, font, size, color, underline] segments of the current line
+        x = end = 0.0
+        wrapped = False
+        size = runs[0][2] if runs else 12
+        for text, font, size, color, underline in runs:
+            for token in re.findall('\t|\r|\n| +|[^\t\r\n ]+', text):
+                if token == '\t':
+                    x = (int(x // self.tab_width) + 1) * self.tab_width
+                elif token in ('\r', '\n'):
+                    self.add_line(line, size)
+                    line, x, wrapped = [], 0.0, False
+                    continue
+                else:
+                    width = self.get_width(token, font, size)
+                    if token.startswith(' '):
+                        # spaces are not carried over to the start of a wrapped line
+                        if wrapped and not line:
+                            continue
+                    elif line and x + width > self.text_width:
+                        self.add_line(line, size)
+                        line, x, wrapped = [], 0.0, True
+                    # continue the last segment when this token is in the same style and right after it
+                    if line and line[-1][2:] == [font, size, color, underline] and end == x:
+                        line[-1][1] += token
+                    else:
+                        line.append([x, token, font, size, color, underline])
+                    x = end = x + width
+        self.add_line(line, size)
+        self.y -= self.space_after
+
+    def add_line(self, segments, size):
+        """Writes a line of segments below the previous line, at a height fitting its largest font"""
+        size = max([segment[3] for segment in segments] + [size])
+        height = size * self.line_spacing
+        # an empty line at the bottom of a page does not start a new page
+        if not segments:
+            self.y -= height
+            return
+        if self.y - height < self.bottom_margin and self.pages[-1]:
+            self.new_page()
+        baseline = self.y - size * FONT_ASCENT
+        self.y -= height
+        commands = self.pages[-1]
+        for x, text, font, size, color, underline in segments:
+            x += self.left_margin
+            commands.append('BT %s %g Tf %g %g %g rg %.2f %.2f Td (%s) Tj ET' % (
+                self.fonts[font], size, color[0], color[1], color[2], x, baseline, self.escape(text)))
+            if underline:
+                width = self.get_width(text, font, size)
+                commands.append('%g %g %g RG %.2f w %.2f %.2f m %.2f %.2f l S' % (
+                    color[0], color[1], color[2], size * 0.05, x, baseline - size * 0.1, x + width,
+                    baseline - size * 0.1))
+
+    @staticmethod
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    def save(self):
+        """Returns the bytes of the PDF file of the pages"""
+        font_ids = {name: 3 + i for i, name in enumerate(self.fonts)}
+        first_page_id = 3 + len(self.fonts)
+        page_ids = [first_page_id + 2 * i for i in range(len(self.pages))]
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            ('<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                ' '.join('%d 0 R' % page_id for page_id in page_ids), len(page_ids))).encode('ascii'),
+        ]
+        for name in self.fonts:
+            objects.append(('<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % name
+                            ).encode('ascii'))
+        resources = '<< /Font << %s >> >>' % ' '.join(
+            '%s %d 0 R' % (self.fonts[name], font_ids[name]) for name in self.fonts)
+        for page_id, commands in zip(page_ids, self.pages):
+            objects.append(('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %g %g] /Resources %s /Contents %d 0 R >>' % (
+                self.page_width, self.page_height, resources, page_id + 1)).encode('ascii'))
+            content = zlib.compress('\n'.join(commands).encode('cp1252', 'replace'))
+            objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) + content +
+                           b'\nendstream')
+
+        pdf = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for object_id, pdf_object in enumerate(objects, start=1):
+            offsets.append(len(pdf))
+            pdf += b'%d 0 obj\n' % object_id + pdf_object + b'\nendobj\n'
+        xref = len(pdf)
+        pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+        return bytes(pdf)
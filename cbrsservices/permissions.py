@@ -1,6 +1,39 @@
+import time
 from rest_framework import permissions
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
+
+
+# the (expiry time, (is_active, is_staff)) of each user whose flags were read from the database by this process
+_user_flags = {}
+
+
+def get_user_flags(user):
+    """
+    Returns the (is_active, is_staff) flags of the authenticated user (both False for anonymous users).
+    By default these are the flags of the user object the authentication already loaded, so no query is needed,
+    but when PERMISSION_USER_FLAGS_TIMEOUT is set, they are read from the database instead,
+    at most once per that many seconds per user in each server process
+    """
+    timeout = getattr(settings, 'PERMISSION_USER_FLAGS_TIMEOUT', None)
+    if timeout is None or not user.is_authenticated:
+        return user.is_active, user.is_staff
+    now = time.monotonic()
+    cached = _user_flags.get(user.pk, None)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    # a user that no longer exists has neither flag
+    flags = User.objects.filter(pk=user.pk).values_list('is_active', 'is_staff').first() or (False, False)
+    _user_flags[user.pk] = (now + timeout, flags)
+    return flags
+
+
+def clear_user_flags(user_id=None):
+    """Drops the cached flags of the user (or of every user), so that they are read again on the next request"""
+    if user_id is None:
+        _user_flags.clear()
+    else:
+        _user_flags.pop(user_id, None)
 
 
 class IsStaff(permissions.BasePermission):
@@ -9,12 +42,8 @@ class IsStaff(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        try:
-            # returns True if user is staff, False if user is not staff
-            return User.objects.get(username=request.user).is_staff
-        except ObjectDoesNotExist:
-            # always return False if the user does not exist or is not staff
-            return False
+        # returns True if user is staff, False if user is not staff (or does not exist)
+        return get_user_flags(request.user)[1]
 
 
 class IsActive(permissions.BasePermission):
@@ -23,12 +52,8 @@ class IsActive(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        try:
-            # returns True if user is active, False if user is not active
-            return User.objects.get(username=request.user).is_active
-        except ObjectDoesNotExist:
-            # always return False if the user does not exist or is not active
-            return False
+        # returns True if user is active, False if user is not active (or does not exist)
+        return get_user_flags(request.user)[0]
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -1,25 +1,40 @@
 import os
-import hashlib
-import base64
 from django.core.mail import EmailMessage
+from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save, pre_delete, post_delete
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from cbrsservices import models
+from cbrsservices.authentication import API_TOKEN_USER_FIELDS, token_revocations
+from cbrsservices.permissions import clear_user_flags
+from cbrsservices.views import increment_response_cache_version
 
 
-def _get_hash(pk):
-    """Returns a hash of a portion of the string of the id of the record"""
-    algorithm = "sha256"
-    value = str(pk)
-    salt = "CBRS"
-    # keylength = random.randint(10000, 99999)
-    keylength = 99999
-    key = hashlib.pbkdf2_hmac(algorithm, value.encode(), salt.encode(), keylength)
-    keyhash = base64.b16encode(key).decode()[-8:]
-    return keyhash
+# listen for new SQLite connections, and add the aggregate functions that SQLite does not have
+@receiver(connection_created)
+def connection_created_receiver(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_aggregate('percentile', 2, models.SQLitePercentile)
 
 
-# listen for new case instances, then create the case hash (public ID) and send a confirmation email
+# listen for case changes, and create the case reference (public ID) for new cases that were not given one
+# or remember the case's count rollup key from before the change
+@receiver(pre_save, sender=models.Case)
+def case_pre_save(sender, **kwargs):
+    case = kwargs['instance']
+    case.rollup_key = None
+    if kwargs['raw']:
+        return
+
+    if case.id is None:
+        if not case.case_reference:
+            case.case_reference = models.get_new_case_reference(models.Case.objects.all())
+    else:
+        case.rollup_key = models.CaseCountRollup.objects.get_case_key(case.id)
+
+
+# listen for case changes, then update the case count rollup (and send a confirmation email for new cases)
 @receiver(post_save, sender=models.Case)
 def case_post_save(sender, **kwargs):
     case = kwargs['instance']
@@ -27,24 +42,34 @@ def case_post_save(sender, **kwargs):
     cbrs_email_address = "CBRAdeterminations@fws.gov"
     other_cbrs_email_addresses = ["CBRA@fws.gov", ]
 
-    if kwargs['created']:
-        # create and assign the case ID hash
-        case.case_reference = _get_hash(case.id)
-        case.save()
-
-        # # construct and send the confirmation email
-        # subject = "Coastal Barrier Resources Act Determination Request Received"
-        # body = "Dear Requester,\r\n\r\nThe U.S. Fish and Wildlife Services has received your request."
-        # body += "\r\nThe Reference Number is: " + case.case_reference
-        # from_address = local_email_address
-        # to_addresses_list = [case.requester.email, ]
-        # bcc_addresses_list = other_cbrs_email_addresses
-        # reply_to_list = [cbrs_email_address, ]
-        # headers = None  # {'Message-ID': 'foo'}
-        # # send_mail(subject, message, from_address, to_addresses_list, fail_silently=False)
-        # email = EmailMessage(subject, body, from_address, to_addresses_list, bcc_addresses_list,
-        #                      reply_to=reply_to_list, headers=headers)
-        # # email.send(fail_silently=False)
+    if kwargs['raw']:
+        return
+
+    # move the case between case count rollup keys if its status, unit, or fiscal year changed
+    old_rollup_key = getattr(case, 'rollup_key', None)
+    new_rollup_key = models.CaseCountRollup.objects.get_case_key(case.id)
+    if old_rollup_key != new_rollup_key:
+        if old_rollup_key is not None:
+            models.CaseCountRollup.objects.adjust(old_rollup_key, -1)
+        models.CaseCountRollup.objects.adjust(new_rollup_key, 1)
+
+    # rebuild the case's search document from its new values
+    models.CaseSearchDocument.objects.refresh([case.id])
+
+    # if kwargs['created']:
+    #     # construct and send the confirmation email
+    #     subject = "Coastal Barrier Resources Act Determination Request Received"
+    #     body = "Dear Requester,\r\n\r\nThe U.S. Fish and Wildlife Services has received your request."
+    #     body += "\r\nThe Reference Number is: " + case.case_reference
+    #     from_address = local_email_address
+    #     to_addresses_list = [case.requester.email, ]
+    #     bcc_addresses_list = other_cbrs_email_addresses
+    #     reply_to_list = [cbrs_email_address, ]
+    #     headers = None  # {'Message-ID': 'foo'}
+    #     # send_mail(subject, message, from_address, to_addresses_list, fail_silently=False)
+    #     email = EmailMessage(subject, body, from_address, to_addresses_list, bcc_addresses_list,
+    #                          reply_to=reply_to_list, headers=headers)
+    #     # email.send(fail_silently=False)
 
     # elif case.final_letter_date is not None:
     #
@@ -70,6 +95,84 @@ def case_post_save(sender, **kwargs):
     #     # email.send(fail_silently=False)
 
 
+# listen for case deletes, and remember the case's count rollup key before it is gone
+@receiver(pre_delete, sender=models.Case)
+def case_pre_delete(sender, **kwargs):
+    case = kwargs['instance']
+    case.rollup_key = models.CaseCountRollup.objects.get_case_key(case.id)
+
+
+# listen for case deletes, and remove the case from the case count rollup
+@receiver(post_delete, sender=models.Case)
+def case_post_delete(sender, **kwargs):
+    case = kwargs['instance']
+    if getattr(case, 'rollup_key', None) is not None:
+        models.CaseCountRollup.objects.adjust(case.rollup_key, -1)
+
+
+# listen for updated properties, system units, and users, then rebuild the search documents of the cases using them
+@receiver(post_save, sender=models.Property)
+def property_post_save(sender, **kwargs):
+    if not kwargs['raw'] and not kwargs['created']:
+        models.CaseSearchDocument.objects.refresh(
+            models.Case.objects.filter(property=kwargs['instance'].id).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=models.SystemUnit)
+def systemunit_post_save(sender, **kwargs):
+    if not kwargs['raw'] and not kwargs['created']:
+        models.CaseSearchDocument.objects.refresh(
+            models.Case.objects.filter(cbrs_unit=kwargs['instance'].id).values_list('id', flat=True))
+
+
+# listen for user changes, and remember the user's token fields from before the change (see user_post_save)
+@receiver(pre_save, sender=User)
+def user_pre_save(sender, **kwargs):
+    user = kwargs['instance']
+    user.token_fields = None
+    if kwargs['raw'] or user.pk is None:
+        return
+    if kwargs['update_fields'] is not None and not set(API_TOKEN_USER_FIELDS).intersection(kwargs['update_fields']):
+        return
+    user.token_fields = User.objects.filter(pk=user.pk).values_list(*API_TOKEN_USER_FIELDS).first()
+
+
+# listen for user changes, then revoke the user's API tokens (whether changed by the API, the admin, or a script)
+# when the flags they hold or the password changed, and rebuild the search documents of the user's cases
+@receiver(post_save, sender=User)
+def user_post_save(sender, **kwargs):
+    user = kwargs['instance']
+    token_fields = getattr(user, 'token_fields', None)
+    if token_fields is not None and token_fields != tuple(getattr(user, field) for field in API_TOKEN_USER_FIELDS):
+        revoke_user_tokens(user.pk)
+
+    # skip saves of only other user fields (e.g. last_login on every login), which the search documents and the
+    # user strings of the responses do not use
+    search_fields = {value.split('__')[1] for value in models.CaseSearchDocument.objects.document_values['analyst']}
+    if kwargs['update_fields'] is not None and not search_fields.intersection(kwargs['update_fields']):
+        return
+    if not kwargs['raw'] and not kwargs['created']:
+        models.CaseSearchDocument.objects.refresh(
+            models.Case.objects.filter(analyst=kwargs['instance'].id).values_list('id', flat=True))
+        # users have no history, so change the ETags of the responses showing them (see ConditionalGetMixin)
+        increment_response_cache_version(User)
+
+
+@receiver(post_delete, sender=User)
+def user_post_delete(sender, **kwargs):
+    revoke_user_tokens(kwargs['instance'].pk)
+
+
+def revoke_user_tokens(user_id):
+    """Revokes every API token of the user, and drops what this process remembers of them once that is committed"""
+    models.RevokedToken.objects.revoke_user(user_id)
+
+    def clear():
+        clear_user_flags(user_id)
+        token_revocations.clear()
+    transaction.on_commit(clear)
+
+
 # listen for new or updated system map instances, then toggle the 'effective' value on all system maps with same name
 @receiver(post_save, sender=models.SystemMap)
 def systemmap_post_save(sender, **kwargs):
@@ -6,8 +6,15 @@ from docx.shared import Inches
 from io import BytesIO
 from localflavor.us import us_states
 from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework_csv.renderers import CSVRenderer
+from cbrsservices.pdf import PDFDocument
+import hashlib
+import json
 import re
+import zipfile
+from xml.sax.saxutils import escape
 from docx.shared import RGBColor
 
 
@@ -19,7 +26,7 @@ class PaginatedCSVRenderer (CSVRenderer):
             data = data.get(self.results_field, [])
         return super(PaginatedCSVRenderer, self).render(data, *args, **kwargs)
 
-class WorkbenchCSVRenderer (CSVRenderer):
+class WorkbenchCSVRenderer (PaginatedCSVRenderer):
     header = ['id', 'case_reference', 'status', 'prohibition_date', 'cbrs_unit_string', 'request_date', 'final_letter_date', 'determination_string',
         'property_string', 'tags', 'duplicate', 'distance', 'analyst_string', 'analyst_signoff_date', 'qc_reviewer_string',
         'qc_reviewer_signoff_date', 'final_letter_date', 'requester_string', 'requester_organization', 'requester_email', 'requester_address',
@@ -180,6 +187,31 @@ class ReportCaseCountCSVRenderer (CSVRenderer):
     }
 
 
+class ReportCaseDaysCSVRenderer (CSVRenderer):
+    header = ['analyst_days_count', 'analyst_days_mean', 'analyst_days_median', 'analyst_days_p90',
+              'qc_reviewer_days_count', 'qc_reviewer_days_mean', 'qc_reviewer_days_median', 'qc_reviewer_days_p90',
+              'final_letter_days_count', 'final_letter_days_mean', 'final_letter_days_median', 'final_letter_days_p90',
+              'close_days_count', 'close_days_mean', 'close_days_median', 'close_days_p90']
+    labels = {
+        'analyst_days_count': 'Count Days to QC',
+        'analyst_days_mean': 'Mean Days to QC',
+        'analyst_days_median': 'Median Days to QC',
+        'analyst_days_p90': '90th Percentile Days to QC',
+        'qc_reviewer_days_count': 'Count Days to Awaiting Final Letter',
+        'qc_reviewer_days_mean': 'Mean Days to Awaiting Final Letter',
+        'qc_reviewer_days_median': 'Median Days to Awaiting Final Letter',
+        'qc_reviewer_days_p90': '90th Percentile Days to Awaiting Final Letter',
+        'final_letter_days_count': 'Count Days to Final Letter',
+        'final_letter_days_mean': 'Mean Days to Final Letter',
+        'final_letter_days_median': 'Median Days to Final Letter',
+        'final_letter_days_p90': '90th Percentile Days to Final Letter',
+        'close_days_count': 'Count Days to Close',
+        'close_days_mean': 'Mean Days to Close',
+        'close_days_median': 'Median Days to Close',
+        'close_days_p90': '90th Percentile Days to Close'
+    }
+
+
 class DOCXRenderer(renderers.BaseRenderer):
     media_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
     format = 'docx'
@@ -191,14 +223,17 @@ class DOCXRenderer(renderers.BaseRenderer):
 
 
 class FinalLetterDOCXRenderer(DOCXRenderer):
+    """
+    This class will build the final letter of a case as a new DOCX document, paragraph by paragraph
+    """
 
-    def render(self, data, media_type=settings.CONTENT_TYPE_DOCX, renderer_context=None):
-        DOC_FONT_TYPE = 'Times New Roman'
-        DOC_FONT_SMALL = Pt(8)
-        DOC_FONT_LARGE = Pt(12)
-        DOC_LINE_SPACING = 1
+    DOC_FONT_TYPE = 'Times New Roman'
+    DOC_FONT_SMALL = Pt(8)
+    DOC_FONT_LARGE = Pt(12)
+    DOC_LINE_SPACING = 1
 
-        case = data[0]
+    def get_paragraphs(self, case):
+        """Returns the paragraphs of the final letter of a case, each a list of (text, style) runs"""
 
         # case fields
         # id = str(case['id'])
@@ -230,8 +265,8 @@ class FinalLetterDOCXRenderer(DOCXRenderer):
         property_street = case['property_street'] if 'property_street' in case else ""
         property_unit = case['property_unit'] if 'property_unit' in case else ""
         property_city = case['property_city'] if 'property_city' in case else ""
-        property_state = case['property_state'] if 'property_state' in case else ""
-        property_zipcode = case['property_zipcode'] if 'property_zipcode' in case else ""
+        property_state = case.get('property_state') or ""  # may be null
+        property_zipcode = case.get('property_zipcode') or ""  # may be null
 
         if property_state != "":
             property_state = str(next(name for abbrev, name in us_states.US_STATES if abbrev == property_state))
@@ -244,8 +279,8 @@ class FinalLetterDOCXRenderer(DOCXRenderer):
         requester_street = case['requester_street'] if 'requester_street' in case else ""
         requester_unit = case['requester_unit'] if 'requester_unit' in case else ""
         requester_city = case['requester_city'] if 'requester_city' in case else ""
-        requester_state = case['requester_state'] if 'requester_state' in case else ""
-        requester_zipcode = case['requester_zipcode'] if 'requester_zipcode' in case else ""
+        requester_state = case.get('requester_state') or ""  # may be null
+        requester_zipcode = case.get('requester_zipcode') or ""  # may be null
 
         if requester_state != "":
             requester_state = str(next(name for abbrev, name in us_states.US_STATES if abbrev == requester_state))
@@ -375,11 +410,42 @@ class FinalLetterDOCXRenderer(DOCXRenderer):
         if final_letter_recipient != "":
             cc = "cc:\t" + final_letter_recipient
 
-        # assemble the content sections into a document with proper formatting
+        # find text between 'https' and '.' and underline/blue font
+        details_link = re.search('http(.*).', details)
+        if details_link is not None and details_link.group(0):
+            details = details.split(details_link.group(0))
+            details_runs = [(details[0], 'large'), (details_link.group(0), 'link')]
+        else:
+            details_runs = [(details, 'large')]
+        if bold != "":
+            details_runs.append((bold, 'bold'))
 
+        closing_link = re.search('http(.*)/.', closing)
+        if closing_link is not None and closing_link.group(0):
+            closing = closing.split(closing_link.group(0))
+            closing_runs = [(closing[0], 'large'), (closing_link.group(0), 'link'), (closing[-1], None)]
+        else:
+            closing_runs = [(closing, 'large')]
+
+        return [[(referal, 'small')], [(requester_full_address, 'large')], [(salutation, 'large')],
+                [(intro, 'large')], [(property_address, 'large')], [(legal_description, 'large')], details_runs,
+                closing_runs, [(signature, 'large')], [(cc, 'large')]]
+
+    def style_run(self, run, style):
+        if style in ('small', 'large'):
+            run.font.name = self.DOC_FONT_TYPE
+            run.font.size = self.DOC_FONT_SMALL if style == 'small' else self.DOC_FONT_LARGE
+        elif style == 'link':
+            run.font.underline = True
+            run.font.color.rgb = RGBColor(0x00, 0x00, 0xFF)
+        elif style == 'bold':
+            run.font.bold = True
+
+    def build_document(self, paragraphs):
+        """Returns the DOCX bytes of a new document of the paragraphs, with proper formatting"""
         document = Document()
         paragraph_format = document.styles['Normal'].paragraph_format
-        paragraph_format.line_spacing = DOC_LINE_SPACING
+        paragraph_format.line_spacing = self.DOC_LINE_SPACING
         sections = document.sections
         for section in sections:
             section.top_margin = Inches(1.6)
@@ -389,79 +455,151 @@ class FinalLetterDOCXRenderer(DOCXRenderer):
             section.header_distance = Inches(0.5)
             section.footer_distance = Inches(0.5)
 
-        p1 = document.add_paragraph().add_run(referal)
-        p1.font.name = DOC_FONT_TYPE
-        p1.font.size = DOC_FONT_SMALL
-
-        p2 = document.add_paragraph().add_run(requester_full_address)
-        p2.font.name = DOC_FONT_TYPE
-        p2.font.size = DOC_FONT_LARGE
-
-        p3 = document.add_paragraph().add_run(salutation)
-        p3.font.name = DOC_FONT_TYPE
-        p3.font.size = DOC_FONT_LARGE
-
-        p4 = document.add_paragraph().add_run(intro)
-        p4.font.name = DOC_FONT_TYPE
-        p4.font.size = DOC_FONT_LARGE
-
-        p5 = document.add_paragraph().add_run(property_address)
-        p5.font.name = DOC_FONT_TYPE
-        p5.font.size = DOC_FONT_LARGE
-
-        p6 = document.add_paragraph().add_run(legal_description)
-        p6.font.name = DOC_FONT_TYPE
-        p6.font.size = DOC_FONT_LARGE
+        for runs in paragraphs:
+            paragraph = document.add_paragraph()
+            for text, style in runs:
+                self.style_run(paragraph.add_run(text), style)
 
-        # find text between 'https' and '.' and underline/blue font
-        details_link = re.search('http(.*).', details)
-        p7 = document.add_paragraph()
-        if details_link is not None and details_link.group(0):
-            details = details.split(details_link.group(0))
-            p7_run = p7.add_run(details[0])
-            p7_run.font.name = DOC_FONT_TYPE
-            p7_run.font.size = DOC_FONT_LARGE
-            link = p7.add_run(details_link.group(0))
-            link.font.underline = True
-            link.font.color.rgb = RGBColor(0x00, 0x00, 0xFF)
-        else:
-            p7_run = p7.add_run(details)
-            p7_run.font.name = DOC_FONT_TYPE
-            p7_run.font.size = DOC_FONT_LARGE
-
-        if bold != "":
-            bold = p7.add_run(bold)
-            bold.font.bold = True
+        docx_buffer = BytesIO()
+        document.save(docx_buffer)
+        return docx_buffer.getvalue()
 
-        closing_link = re.search('http(.*)/.', closing)
-        p8 = document.add_paragraph()
-        if closing_link is not None and closing_link.group(0):
-            closing = closing.split(closing_link.group(0))
-            p8_run = p8.add_run(closing[0])
-            p8_run.font.name = DOC_FONT_TYPE
-            p8_run.font.size = DOC_FONT_LARGE
-            link = p8.add_run(closing_link.group(0))
-            link.font.underline = True
-            link.font.color.rgb = RGBColor(0x00, 0x00, 0xFF)
-            p8.add_run(closing[-1])
-        else:
-            p8_run = p8.add_run(closing)
-            p8_run.font.name = DOC_FONT_TYPE
-            p8_run.font.size = DOC_FONT_LARGE
+    def get_document(self, letter):
+        """Returns the DOCX bytes of the final letter of one LetterSerializer row"""
+        return self.build_document(self.get_paragraphs(letter))
 
-        p9 = document.add_paragraph().add_run(signature)
-        p9.font.name = DOC_FONT_TYPE
-        p9.font.size = DOC_FONT_LARGE
+    def render(self, data, media_type=settings.CONTENT_TYPE_DOCX, renderer_context=None):
+        self.document = BytesIO(self.get_document(data[0]))
+        return super(FinalLetterDOCXRenderer, self).render(data, media_type, renderer_context)
 
-        p10 = document.add_paragraph().add_run(cc)
-        p10.font.name = DOC_FONT_TYPE
-        p10.font.size = DOC_FONT_LARGE
 
-        # document.add_paragraph()
+class FinalLetterCacheMixin(object):
+    """
+    This class will keep the letters built by a final letter renderer in the FINAL_LETTER_CACHE cache under a hash
+    of their format and LetterSerializer row, so a repeated download is not rendered again,
+    and any change to the letter's fields gives it a new key
+    """
+
+    # part of every cached letter's key, so increase it to invalidate the cached letters when the letter text changes
+    letter_version = 1
+
+    def get_cache_key(self, letter):
+        content = json.dumps(letter, sort_keys=True, cls=DjangoJSONEncoder).encode('utf-8')
+        return 'final_letter:%s:%d:%s' % (self.format, self.letter_version, hashlib.sha256(content).hexdigest())
+
+    def get_document(self, letter):
+        cache_alias = getattr(settings, 'FINAL_LETTER_CACHE', None)
+        if cache_alias is None:
+            return super(FinalLetterCacheMixin, self).get_document(letter)
+        letter_cache = caches[cache_alias]
+        cache_key = self.get_cache_key(letter)
+        document = letter_cache.get(cache_key)
+        if document is None:
+            document = super(FinalLetterCacheMixin, self).get_document(letter)
+            letter_cache.set(cache_key, document, getattr(settings, 'FINAL_LETTER_CACHE_TIMEOUT', None))
+        return document
+
+
+class FinalLetterTemplateDOCXRenderer(FinalLetterCacheMixin, FinalLetterDOCXRenderer):
+    """
+    This class will build the final letter of a case by filling a letter template compiled once per process
+    (the document XML of a skeleton letter split at its paragraphs, the XML of each run style,
+    and the other, unchanging parts of the DOCX package already zipped), so each letter is only a string fill
+    and one zip entry write, and gives the same document as FinalLetterDOCXRenderer
+    """
+
+    template = None
+
+    @classmethod
+    def get_template(cls):
+        if cls.template is None:
+            cls.template = cls().compile_template()
+        return cls.template
+
+    def compile_template(self):
+        # the XML of the run properties of each style, read from a document with one run of each style
+        styles = ('small', 'large', 'link', 'bold', None)
+        build_document = super(FinalLetterTemplateDOCXRenderer, self).build_document
+        document = zipfile.ZipFile(BytesIO(build_document([[('@@%s@@' % style, style)] for style in styles])))
+        document_xml = document.read('word/document.xml').decode('utf-8')
+        run_properties = {}
+        for style in styles:
+            match = re.search('<w:r>(<w:rPr>(?:(?!<w:r>).)*?</w:rPr>)?<w:t>@@%s@@</w:t></w:r>' % style, document_xml)
+            run_properties[style] = match.group(1) or ''
+
+        # the document XML of a skeleton letter, split where the runs of each paragraph go
+        paragraph_count = len(self.get_paragraphs({}))
+        skeleton = zipfile.ZipFile(BytesIO(build_document(
+            [[('@@paragraph%d@@' % i, None)] for i in range(paragraph_count)])))
+        document_xml = skeleton.read('word/document.xml').decode('utf-8')
+        document_parts = re.split('<w:r><w:t>@@paragraph[0-9]+@@</w:t></w:r>', document_xml)
+
+        # the other parts of the package, zipped once
+        package_buffer = BytesIO()
+        with zipfile.ZipFile(package_buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+            for info in skeleton.infolist():
+                if info.filename != 'word/document.xml':
+                    package.writestr(info, skeleton.read(info))
+        return {'run_properties': run_properties, 'document_parts': document_parts,
+                'document_date': skeleton.getinfo('word/document.xml').date_time, 'package': package_buffer.getvalue()}
+
+    @staticmethod
+    def run_xml(text, run_properties):
+        """Returns the XML of a run of the text, with the same tabs, breaks, and text elements as python-docx"""
+        content = []
+        for part in re.split('([\t\r\n])', text):
+            if part == '\t':
+                content.append('<w:tab/>')
+            elif part in ('\r', '\n'):
+                content.append('<w:br/>')
+            elif part:
+                space = ' xml:space="preserve"' if part.strip() != part else ''
+                content.append('<w:t%s>%s</w:t>' % (space, escape(part)))
+        if not run_properties and not content:
+            return '<w:r/>'
+        return '<w:r>' + run_properties + ''.join(content) + '</w:r>'
+
+    def build_document(self, paragraphs):
+        template = self.get_template()
+        run_properties = template['run_properties']
+        document_parts = template['document_parts']
+        document_xml = [document_parts[0]]
+        for runs, document_part in zip(paragraphs, document_parts[1:]):
+            document_xml.extend(self.run_xml(text, run_properties[style]) for text, style in runs)
+            document_xml.append(document_part)
+
+        document_info = zipfile.ZipInfo('word/document.xml', template['document_date'])
+        document_info.compress_type = zipfile.ZIP_DEFLATED
+        docx_buffer = BytesIO(template['package'])
+        with zipfile.ZipFile(docx_buffer, 'a') as docx_file:
+            docx_file.writestr(document_info, ''.join(document_xml).encode('utf-8'))
+        return docx_buffer.getvalue()
+
+
+class FinalLetterPDFRenderer(FinalLetterCacheMixin, FinalLetterDOCXRenderer):
+    """
+    This class will build the final letter of a case as a PDF file, laying out the same paragraphs as the DOCX
+    final letter renderers with the small PDF writer (no DOCX conversion), in the standard Times fonts
+    """
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    # the font, size, color, and underline of each run style
+    run_styles = {
+        'small': ('Times-Roman', 8, (0, 0, 0), False),
+        'large': ('Times-Roman', 12, (0, 0, 0), False),
+        'link': ('Times-Roman', 12, (0, 0, 1), True),
+        'bold': ('Times-Bold', 12, (0, 0, 0), False),
+        None: ('Times-Roman', 12, (0, 0, 0), False),
+    }
 
-        docx_buffer = BytesIO()
-        document.save(docx_buffer)
-        docx_buffer.seek(0)
-        self.document = docx_buffer
+    def build_document(self, paragraphs):
+        """Returns the PDF bytes of the paragraphs, on pages with the same margins as the DOCX final letter"""
+        document = PDFDocument(top_margin=1.6 * 72, right_margin=72, bottom_margin=72, left_margin=72)
+        for runs in paragraphs:
+            document.add_paragraph([(text,) + self.run_styles[style] for text, style in runs])
+        return document.save()
 
-        return super(FinalLetterDOCXRenderer, self).render(data, media_type, renderer_context)
+    def render(self, data, media_type=None, renderer_context=None):
+        return super(FinalLetterPDFRenderer, self).render(data, media_type or self.media_type, renderer_context)
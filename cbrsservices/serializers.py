@@ -82,21 +82,26 @@ class CaseFileSerializer(serializers.ModelSerializer):
 class CaseSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
+        self.validate_case_rules(self.initial_data)
+        return data
+
+    @staticmethod
+    def validate_case_rules(values):
         """
         Ensure that no user is used by more than one of the following fields: Analyst, QC_Reviewer, FWS_Reviewer
         Also ensure that no date field is out of chronological order
         (dates must be in this order: request <= field office <= hq <= analyst <= qc <= fws <= final letter <= close)
         """
-        an = self.initial_data.get('analyst', None)
-        qc = self.initial_data.get('qc_reviewer', None)
-        fws = self.initial_data.get('fws_reviewer', None)
-        rdate = self.initial_data.get('request_date', None)
-        fodate = self.initial_data.get('fws_fo_received_date', None)
-        hqdate = self.initial_data.get('fws_hq_received_date', None)
-        andate = self.initial_data.get('analyst_signoff_date', None)
-        qcdate = self.initial_data.get('qc_reviewer_signoff_date', None)
-        fldate = self.initial_data.get('final_letter_date', None)
-        cdate = self.initial_data.get('close_date', None)
+        an = values.get('analyst', None)
+        qc = values.get('qc_reviewer', None)
+        fws = values.get('fws_reviewer', None)
+        rdate = values.get('request_date', None)
+        fodate = values.get('fws_fo_received_date', None)
+        hqdate = values.get('fws_hq_received_date', None)
+        andate = values.get('analyst_signoff_date', None)
+        qcdate = values.get('qc_reviewer_signoff_date', None)
+        fldate = values.get('final_letter_date', None)
+        cdate = values.get('close_date', None)
         if an is not None and qc is not None and an == qc:
             raise serializers.ValidationError("analyst cannot be the same as qc_reviewer")
         if an is not None and fws is not None and an == fws:
@@ -115,7 +120,6 @@ class CaseSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("qc_reviewer_signoff_date cannot be later than final_letter_date.")
         if fldate is not None and cdate is not None and fldate > cdate:
             raise serializers.ValidationError("final_letter_date cannot be later than close_date.")
-        return data
 
     analyst_string = serializers.StringRelatedField(source='analyst', help_text=case.analyst_string)
     qc_reviewer_string = serializers.StringRelatedField(source='qc_reviewer', help_text=case.qc_reviewer_string)
@@ -200,6 +204,17 @@ class LetterSerializer(serializers.ModelSerializer):
                   'requester_unit', 'requester_city', 'requester_state', 'requester_zipcode', )
 
 
+
+class FinalLettersSerializer(serializers.Serializer):
+    """
+    The options of a batch of final letters, where the cases are given by id, or (when left out) by the case filters
+    """
+    cases = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    attach = serializers.BooleanField(default=False)
+    email = serializers.BooleanField(default=False)
+    # the formats of letters.FINAL_LETTER_RENDERERS
+    letter_format = serializers.ChoiceField(choices=('docx', 'pdf'), default='docx')
+
 class CaseIDSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -343,9 +358,7 @@ class ReportSerializer(serializers.ModelSerializer):
 
 class ReportCasesByUnitSerializer(serializers.ModelSerializer):
     def get_street_address(self, obj):
-        prop = obj.property
-        prop_street = Property.objects.filter(id=prop.id).values_list('street', flat=True)[0]
-        prop_street_address = prop_street.split(",")[0]
+        prop_street_address = obj.property.street.split(",")[0]
         return prop_street_address
 
     cbrs_unit_string = serializers.StringRelatedField(source='cbrs_unit', help_text=systemunit.system_unit_number)
@@ -373,9 +386,7 @@ class ReportCasesByUnitSerializer(serializers.ModelSerializer):
 
 class ReportCasesForUserSerializer(serializers.ModelSerializer):
     def get_street_address(self, obj):
-        prop = obj.property
-        prop_street = Property.objects.filter(id=prop.id).values_list('street', flat=True)[0]
-        prop_street_address = prop_street.split(",")[0]
+        prop_street_address = obj.property.street.split(",")[0]
         return prop_street_address
 
     cbrs_unit_string = serializers.StringRelatedField(source='cbrs_unit', help_text=systemunit.system_unit_number)
@@ -430,6 +441,196 @@ class ReportCountOfCasesByStatusSerializer(serializers.Serializer):
     count_closed_no_final_letter = serializers.IntegerField()
 
 
+######
+#
+#  Values Serializers
+#
+######
+
+
+def _date_string(value):
+    return value.isoformat() if value else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _property_string(street, unit, city, state, zipcode):
+    # the same string as Property.__str__
+    return street + ", " + unit + ", " + city + ", " + state + " " + zipcode
+
+
+def _requester_address(street, unit, city, state):
+    # the same string as WorkbenchSerializer.get_requester_address
+    return ', '.join(part for part in (street, unit, city, state) if part is not None and part != '').replace('\n', ' ')
+
+
+class ValuesSerializer(object):
+    """
+    This class will build the same rows as a read-only model serializer straight from .values() rows,
+    using a precomputed mapper for each column instead of model instances and serializer fields for every row.
+    Subclasses list their columns, and the values serializer is only used for reading lists.
+    """
+
+    # tuples of (column name, the values() fields the column is built from, and the function that builds it,
+    # or None if the column is the value of its single field)
+    columns = ()
+    # tuples of (column name, through model, the through model's case field, and its value field)
+    # for columns that list the string values of a many-to-many relation
+    many_columns = ()
+
+    def __init__(self):
+        self.values_fields = []
+        self.mappers = []
+        for name, fields, function in self.columns:
+            for field in fields:
+                if field not in self.values_fields:
+                    self.values_fields.append(field)
+            self.mappers.append((name, self.get_mapper(fields, function)))
+        if 'id' not in self.values_fields:
+            self.values_fields.append('id')
+
+    @staticmethod
+    def get_mapper(fields, function):
+        if function is None:
+            return lambda row, field=fields[0]: row[field]
+        if len(fields) == 1:
+            return lambda row, field=fields[0]: function(row[field])
+        return lambda row: function(*[row[field] for field in fields])
+
+    def get_values(self, queryset):
+        """Returns the queryset as the values() rows this serializer is built from"""
+        return queryset.prefetch_related(None).values(*self.values_fields)
+
+    def get_many_values(self, ids):
+        """Returns a dict of each many-to-many column's string values keyed by case id, with one query per column"""
+        many_values = {}
+        for name, model, case_field, value_field in self.many_columns:
+            values = many_values[name] = {}
+            rows = model.objects.filter(**{case_field + '__in': ids}).order_by('id')
+            for case_id, value in rows.values_list(case_field, value_field):
+                values.setdefault(case_id, []).append(str(value))
+        return many_values
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        data = [{name: mapper(row) for name, mapper in self.mappers} for row in rows]
+        if self.many_columns:
+            many_values = self.get_many_values([row['id'] for row in rows])
+            for row, item in zip(rows, data):
+                for name, model, case_field, value_field in self.many_columns:
+                    item[name] = many_values[name].get(row['id'], [])
+        return data
+
+
+PROPERTY_STRING_FIELDS = ('property__street', 'property__unit', 'property__city', 'property__state',
+                          'property__zipcode')
+
+
+class WorkbenchValuesSerializer(ValuesSerializer):
+    columns = (
+        ('id', ('id',), None),
+        ('case_reference', ('case_reference',), None),
+        ('status', ('status',), None),
+        ('request_date', ('request_date',), _date_string),
+        ('property_string', PROPERTY_STRING_FIELDS, _property_string),
+        ('cbrs_unit_string', ('cbrs_unit__system_unit_number',), None),
+        ('determination_string', ('determination__determination',), None),
+        ('distance', ('distance',), _float),
+        ('analyst_string', ('analyst__username',), None),
+        ('qc_reviewer_string', ('qc_reviewer__username',), None),
+        ('priority', ('priority',), None),
+        ('on_hold', ('on_hold',), None),
+        ('invalid', ('invalid',), None),
+        ('duplicate', ('duplicate',), None),
+        # filled in from many_columns
+        ('tags', (), lambda: []),
+        ('analyst_signoff_date', ('analyst_signoff_date',), _date_string),
+        ('qc_reviewer_signoff_date', ('qc_reviewer_signoff_date',), _date_string),
+        ('final_letter_date', ('final_letter_date',), _date_string),
+        ('prohibition_date', ('prohibition_date',), _date_string),
+        ('hard_copy_map_reviewed', ('hard_copy_map_reviewed',), None),
+        ('requester_string', ('requester__first_name', 'requester__last_name'),
+         lambda first_name, last_name: first_name + " " + last_name),
+        ('requester_organization', ('requester__organization',), None),
+        ('requester_email', ('requester__email',), None),
+        ('requester_address', ('requester__street', 'requester__unit', 'requester__city', 'requester__state'),
+         _requester_address),
+    )
+    many_columns = (('tags', CaseTag, 'case', 'tag__name'),)
+
+
+class ReportValuesSerializer(ValuesSerializer):
+    columns = (
+        ('id', ('id',), None),
+        ('status', ('status',), None),
+        ('request_date', ('request_date',), _date_string),
+        ('close_date', ('close_date',), _date_string),
+        ('property_string', PROPERTY_STRING_FIELDS, _property_string),
+        ('determination_string', ('determination__determination',), None),
+    )
+
+
+class ReportDaysToResolutionValuesSerializer(ValuesSerializer):
+    # the days are annotated by the database (see CaseQuerySet.with_days)
+    columns = (
+        ('id', ('id',), None),
+        ('case_reference', ('case_reference',), None),
+        ('request_date', ('request_date',), _date_string),
+        ('final_letter_date', ('final_letter_date',), _date_string),
+        ('close_date', ('close_date',), _date_string),
+        ('close_days', ('close_days',), None),
+        ('property_string', PROPERTY_STRING_FIELDS, _property_string),
+        ('determination_string', ('determination__determination',), None),
+    )
+
+
+class ReportDaysToEachStatusValuesSerializer(ValuesSerializer):
+    # the days are annotated by the database (see CaseQuerySet.with_days)
+    columns = (
+        ('id', ('id',), None),
+        ('case_reference', ('case_reference',), None),
+        ('status', ('status',), None),
+        ('request_date', ('request_date',), _date_string),
+        ('analyst_signoff_date', ('analyst_signoff_date',), _date_string),
+        ('qc_reviewer_signoff_date', ('qc_reviewer_signoff_date',), _date_string),
+        ('final_letter_date', ('final_letter_date',), _date_string),
+        ('close_date', ('close_date',), _date_string),
+        ('close_days', ('close_days',), None),
+        ('analyst_days', ('analyst_days',), None),
+        ('qc_reviewer_days', ('qc_reviewer_days',), None),
+        ('final_letter_days', ('final_letter_days',), None),
+        ('property_string', PROPERTY_STRING_FIELDS, _property_string),
+        ('determination_string', ('determination__determination',), None),
+    )
+
+
+# the values serializers that build the same list rows as these model serializers
+VALUES_SERIALIZERS = {
+    WorkbenchSerializer: WorkbenchValuesSerializer,
+    ReportSerializer: ReportValuesSerializer,
+    ReportDaysToResolutionSerializer: ReportDaysToResolutionValuesSerializer,
+    ReportDaysToEachStatusSerializer: ReportDaysToEachStatusValuesSerializer,
+}
+
+
+######
+#
+#  Email Outbox
+#
+######
+
+
+class FinalEmailSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = FinalEmail
+        fields = ('id', 'case', 'status', 'attempts', 'next_attempt_date', 'last_attempt_date', 'sent_date',
+                  'last_error', 'created_date', 'created_by',)
+        read_only_fields = fields
+
+
 ######
 #
 #  Users
@@ -0,0 +1,115 @@
+import random
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from cbrsservices.models import *
+from cbrsservices.imports import CaseImport
+
+
+########################################################################################################################
+#
+#  Synthetic data for benchmarks and load testing. Every synthetic record is named with a 'synthetic' prefix,
+#  and the same seed always produces the same cases (apart from their randomly assigned case references).
+#
+########################################################################################################################
+
+
+def get_synthetic_lookups(units=20):
+    """
+    Returns a dict of the synthetic lookup records (units, maps, determinations, users, tags), creating any missing,
+    where each of the units has a map of its own and a prohibition date
+    """
+    unit_type, created = SystemUnitType.objects.get_or_create(unit_type='synthetic')
+    field_office, created = FieldOffice.objects.get_or_create(
+        field_office_number='synthetic', defaults={'field_office_name': 'synthetic', 'city': 'Town', 'state': 'VA'})
+    lookups = {
+        'units': [SystemUnit.objects.get_or_create(
+            system_unit_number='synthetic-%d' % i, defaults={'system_unit_name': 'Synthetic Unit %d' % i,
+                                                             'system_unit_type': unit_type,
+                                                             'field_office': field_office})[0] for i in range(units)],
+        'maps': [SystemMap.objects.get_or_create(map_number='synthetic-%d' % i, map_date=date(2010, 1, 1))[0]
+                 for i in range(units)],
+        'determinations': [Determination.objects.get_or_create(determination=determination)[0]
+                           for determination in ('In', 'Out', 'Partially In; Structure In',
+                                                 'Partially In; Structure Out', 'Partially In; No Structure')],
+        'users': [User.objects.get_or_create(username='synthetic-%d' % i, defaults={
+            'first_name': 'Synthetic', 'last_name': 'Analyst %d' % i})[0] for i in range(6)],
+        'tags': [Tag.objects.get_or_create(name='synthetic-%d' % i)[0] for i in range(8)],
+    }
+    for unit, system_map in zip(lookups['units'], lookups['maps']):
+        SystemUnitMap.objects.get_or_create(system_unit=unit, system_map=system_map)
+        SystemUnitProhibitionDate.objects.get_or_create(system_unit=unit, prohibition_date=date(1990, 11, 16))
+    return lookups
+
+
+def get_synthetic_rows(count, seed=0, lookups=None):
+    """Returns a list of count (row number, row) pairs of synthetic cases, in the format read by CaseImport"""
+    rnd = random.Random(seed)
+    lookups = lookups or get_synthetic_lookups()
+    rows = []
+    for i in range(count):
+        request_date = date(2015, 1, 1) + timedelta(days=rnd.randint(0, 365 * 5))
+        analyst, qc_reviewer = rnd.sample(lookups['users'], 2)
+        row = {
+            'request_date': request_date,
+            'cbrs_unit': rnd.choice(lookups['units']).id,
+            'map_number': rnd.choice(lookups['maps']).id,
+            'determination': rnd.choice(lookups['determinations']).id,
+            'prohibition_date': date(1990, 11, 16),
+            'cbrs_map_date': date(2010, 1, 1),
+            'distance': round(rnd.uniform(0, 500), 1),
+            'analyst': analyst.id,
+            'qc_reviewer': qc_reviewer.id,
+            'priority': rnd.random() < 0.1,
+            'property': {'street': '%d Synthetic %s' % (rnd.randint(1, 9999), rnd.choice(('St', 'Rd', 'Ave', 'Ln'))),
+                         'city': 'Synthetic City %d' % rnd.randint(0, 50), 'state': 'VA', 'zipcode': '22222',
+                         'legal_description': 'synthetic-%d-%d' % (seed, i),
+                         'policy_number': 'SYN%08d' % rnd.randint(0, 10 ** 8)},
+            # requesters repeat, so imports exercise matching existing requesters
+            'requester': {'first_name': 'Synthetic', 'last_name': 'Requester %d' % rnd.randint(0, max(count // 10, 1)),
+                          'email': 'synthetic@example.com', 'organization': 'synthetic'},
+        }
+        # move each case along the workflow by a random number of steps
+        days = request_date
+        for field in ('analyst_signoff_date', 'qc_reviewer_signoff_date', 'final_letter_date', 'close_date'):
+            if rnd.random() < 0.7:
+                break
+            days += timedelta(days=rnd.randint(1, 60))
+            row[field] = days
+        rows.append((i + 1, row))
+    return rows
+
+
+def create_synthetic_cases(count, seed=0, user=None, units=20):
+    """Creates count synthetic cases, each with one to three tags and a comment, and returns the ids of the cases"""
+    lookups = get_synthetic_lookups(units)
+    case_import = CaseImport(user)
+    result = case_import.run(get_synthetic_rows(count, seed, lookups))
+    case_ids = [case['id'] for case in result['cases']]
+
+    rnd = random.Random(seed)
+    CaseTag.objects.bulk_create([CaseTag(case_id=case_id, tag=tag, created_by=user, modified_by=user)
+                                 for case_id in case_ids for tag in rnd.sample(lookups['tags'], rnd.randint(1, 3))],
+                                batch_size=case_import.batch_size)
+    Comment.objects.bulk_create([Comment(acase_id=case_id, comment='Synthetic comment %d' % case_id,
+                                         created_by=user, modified_by=user) for case_id in case_ids],
+                                batch_size=case_import.batch_size)
+    return case_ids
+
+
+def create_synthetic_casefiles(case_ids, seed=0, user=None, per_case=2):
+    """
+    Creates up to per_case synthetic case files for each of the cases (none for some), and returns their number.
+    Only the case file records are created, the files themselves are not written to the media folder.
+    """
+    rnd = random.Random(seed)
+    casefiles = []
+    for case_id in case_ids:
+        for i in range(rnd.randint(0, per_case)):
+            from_requester = rnd.random() < 0.5
+            folder = 'casefiles/%d/requester/' % case_id if from_requester else 'casefiles/%d/' % case_id
+            filename = 'synthetic_%d.%s' % (i, rnd.choice(('pdf', 'jpg')))
+            casefiles.append(CaseFile(case_id=case_id, file=folder + filename,
+                                      from_requester=from_requester, uploader=None if from_requester else user,
+                                      created_by=user, modified_by=user))
+    CaseFile.objects.bulk_create(casefiles, batch_size=500)
+    return len(casefiles)
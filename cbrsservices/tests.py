@@ -1,3 +1,562 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+from datetime import date
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from cbrsservices.filters import CaseFilter
+from cbrsservices.middleware import request_metrics
+from cbrsservices.models import *
 
-# Create your tests here.
+
+class CaseTestData(object):
+    """
+    The users, lookups, and cases (each with tags and a comment) shared by the query count tests
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', is_staff=True)
+        cls.analyst = User.objects.create(username='analyst')
+        cls.qc_reviewer = User.objects.create(username='qc_reviewer')
+        unit_type = SystemUnitType.objects.create(unit_type='CBRS')
+        cls.unit = SystemUnit.objects.create(system_unit_number='DE-01P', system_unit_type=unit_type)
+        cls.map = SystemMap.objects.create(map_number='1', map_date=date(2010, 1, 1))
+        cls.determination = Determination.objects.create(determination='In')
+        cls.tags = [Tag.objects.create(name='tag' + str(i)) for i in range(2)]
+
+    def create_cases(self, count):
+        for i in range(Case.objects.count(), Case.objects.count() + count):
+            prop = Property.objects.create(street=str(i) + ' Main St', city='Town', state='VA', zipcode='22222')
+            requester = Requester.objects.create(first_name='First' + str(i), last_name='Last', email='a@b.com')
+            case = Case.objects.create(
+                requester=requester, property=prop, cbrs_unit=self.unit, map_number=self.map,
+                determination=self.determination, analyst=self.analyst, qc_reviewer=self.qc_reviewer,
+                request_date=date(2019, 1, 1), analyst_signoff_date=date(2019, 1, 2),
+                created_by=self.user, modified_by=self.user)
+            for tag in self.tags:
+                CaseTag.objects.create(case=case, tag=tag)
+            Comment.objects.create(comment='comment' + str(i), acase=case)
+
+
+class ReportCaseQueryCountTestCase(CaseTestData, APITestCase):
+    """
+    The report pages must be built in a fixed number of queries, no matter how many cases they contain
+    """
+
+    reports = {
+        # the ETag query, a count query, and the page query
+        '': 3,
+        'daystoresolution': 3,
+        'daystoeachstatus': 3,
+        # plus one query each for the tags, comments, and casefiles of the whole page
+        'casesbyunit': 6,
+        'allcasesforuser&user=analyst': 6,
+    }
+
+    def assertReportQueries(self):
+        for report, queries in self.reports.items():
+            for frmt in ('json', 'csv'):
+                with self.assertNumQueries(queries):
+                    response = self.client.get('/cbrsservices/reportcases/?report=' + report + '&format=' + frmt)
+                self.assertEqual(response.status_code, 200)
+
+    def test_report_queries_do_not_grow_with_cases(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(2)
+        self.assertReportQueries()
+        self.create_cases(10)
+        self.assertReportQueries()
+
+
+class CaseViewQueryCountTestCase(CaseTestData, APITestCase):
+    """
+    The case views must be built in a fixed number of queries, no matter how many cases are on the page
+    """
+
+    views = {
+        # the ETag query and the page query, plus one query each for the comments, tags, and casefiles of the page
+        '': 5,
+        # plus one query for the tags of the page
+        'workbench': 3,
+        'report': 2,
+        'caseid': 2,
+    }
+
+    def assertCaseQueries(self, page_size):
+        for view, queries in self.views.items():
+            params = {'pagination': 'keyset', 'page_size': page_size}
+            if view:
+                params['view'] = view
+            with self.assertNumQueries(queries):
+                response = self.client.get('/cbrsservices/cases/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_case_queries_do_not_grow_with_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(12)
+        self.assertCaseQueries(2)
+        self.assertCaseQueries(10)
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('mail server unavailable')
+
+
+@override_settings(FINAL_EMAIL_MAX_ATTEMPTS=2, FINAL_EMAIL_RETRY_DELAY=0)
+class FinalEmailOutboxTestCase(APITestCase):
+    """
+    Final emails are queued by the API, then sent (with retries) in batches by the outbox worker
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', is_staff=True)
+        cls.cases = []
+        for i in range(3):
+            prop = Property.objects.create(street=str(i) + ' Main St', city='Town', state='VA', zipcode='22222')
+            requester = Requester.objects.create(first_name='First' + str(i), last_name='Last', email='a@b.com')
+            cls.cases.append(Case.objects.create(requester=requester, property=prop, final_letter_date=date(2019, 1, 2),
+                                                 created_by=cls.user, modified_by=cls.user))
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        with self.settings(MEDIA_ROOT=self.media_root):
+            for case in self.cases:
+                CaseFile.objects.create(case=case, final_letter=True,
+                                        file=SimpleUploadedFile('letter.txt', b'final letter'))
+
+    def queue_emails(self):
+        self.client.force_authenticate(self.user)
+        for case in self.cases:
+            response = self.client.post('/cbrsservices/cases/' + str(case.id) + '/send_final_email/')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['status'], 'Queued')
+        # nothing is sent while the request waits
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_queued_emails_are_sent_in_one_connection(self):
+        self.queue_emails()
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                mock.patch.object(EmailBackend, 'open', autospec=True, return_value=True) as open_connection:
+            self.assertEqual(FinalEmail.objects.send_batch(), (3, 0))
+        self.assertEqual(open_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].attachments[0][1], 'final letter')
+        response = self.client.get('/cbrsservices/finalemails/?case=' + str(self.cases[0].id))
+        self.assertEqual(response.data[0]['status'], 'Sent')
+        # a sent email is not sent again
+        self.assertEqual(FinalEmail.objects.send_batch(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='cbrsservices.tests.FailingEmailBackend')
+    def test_failed_emails_are_retried_then_failed(self):
+        self.queue_emails()
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.assertEqual(FinalEmail.objects.send_batch(), (0, 3))
+            self.assertEqual(FinalEmail.objects.filter(status='Queued', attempts=1).count(), 3)
+            self.assertEqual(FinalEmail.objects.send_batch(), (0, 3))
+        final_email = FinalEmail.objects.get(case=self.cases[0])
+        self.assertEqual(final_email.status, 'Failed')
+        self.assertEqual(final_email.attempts, 2)
+        self.assertIn('mail server unavailable', final_email.last_error)
+
+
+class CaseStatusFilterTestCase(APITestCase):
+    """
+    The status filters on the case date fields must select the same cases as the status computed for each case
+    """
+
+    def test_status_filters_match_case_status(self):
+        prop = Property.objects.create(street='1 Main St', city='Town', state='VA', zipcode='22222')
+        requester = Requester.objects.create(first_name='First', last_name='Last', email='a@b.com')
+        # a case for every combination of reached and not reached stages
+        dates = [None, date(2019, 1, 2)]
+        for analyst_date in dates:
+            for qc_date in dates:
+                for final_letter_date in dates:
+                    for close_date in dates:
+                        Case.objects.create(requester=requester, property=prop, request_date=date(2019, 1, 1),
+                                            analyst_signoff_date=analyst_date, qc_reviewer_signoff_date=qc_date,
+                                            final_letter_date=final_letter_date, close_date=close_date)
+        for status in CASE_STATUSES:
+            cases = set(Case.objects.filter(CASE_STATUS_FILTERS[status]).values_list('id', flat=True))
+            self.assertTrue(cases)
+            self.assertEqual(cases, set(Case.objects.with_status().filter(status=status).values_list('id', flat=True)))
+
+
+class CaseFilterTestCase(CaseTestData, APITestCase):
+    """
+    The case URL arguments are validated up front, and compiled into one filter call that is distinct only when needed
+    """
+
+    def get_case_ids(self, params, status_code=200):
+        response = self.client.get('/cbrsservices/cases/', dict(params, view='caseid', pagination='keyset'))
+        self.assertEqual(response.status_code, status_code)
+        return sorted(case['id'] for case in response.data['results']) if status_code == 200 else None
+
+    def test_case_filters(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(3)
+        ids = sorted(Case.objects.values_list('id', flat=True))
+        Case.objects.filter(id=ids[0]).update(priority=True)
+        # comma separated lists
+        self.assertEqual(self.get_case_ids({'case_number': '%d,%d' % (ids[0], ids[2])}), [ids[0], ids[2]])
+        # boolean values
+        self.assertEqual(self.get_case_ids({'priority': 'true'}), ids[:1])
+        self.assertEqual(self.get_case_ids({'priority': 'false'}), ids[1:])
+        # a case with several matching tags is still returned once
+        tags = ','.join(str(tag.id) for tag in self.tags)
+        self.assertEqual(self.get_case_ids({'tags': tags, 'status': 'Awaiting QC'}), ids)
+        # invalid values are rejected instead of ignored
+        self.get_case_ids({'case_number': 'abc'}, 400)
+        self.get_case_ids({'status': 'Bogus'}, 400)
+
+    def test_distinct_only_for_multi_valued_joins(self):
+        queryset = Case.objects.all()
+        self.assertTrue(CaseFilter({'tags': '1,2'}, queryset=queryset).qs.query.distinct)
+        self.assertFalse(CaseFilter({'priority': 'true', 'status': 'Final', 'street': 'main'},
+                                    queryset=queryset).qs.query.distinct)
+
+
+class ReportCaseDaysTestCase(APITestCase):
+    """
+    The report cases must use the days annotated by the database, which are the same as the days computed for each case
+    """
+
+    def test_annotated_days_are_used(self):
+        prop = Property.objects.create(street='1 Main St', city='Town', state='VA', zipcode='22222')
+        requester = Requester.objects.create(first_name='First', last_name='Last', email='a@b.com')
+        ReportCase.objects.create(requester=requester, property=prop, request_date=date(2019, 1, 1),
+                                  analyst_signoff_date=date(2019, 1, 3), qc_reviewer_signoff_date=date(2019, 1, 7),
+                                  final_letter_date=date(2019, 2, 1))
+        days = {'analyst_days': 2, 'qc_reviewer_days': 6, 'final_letter_days': 31, 'close_days': None}
+        case = ReportCase.objects.with_days().get()
+        self.assertEqual({name: getattr(case, name) for name in days}, days)
+        # the annotated days are kept until the case is saved, then computed again
+        case.request_date = date(2019, 1, 2)
+        self.assertEqual({name: getattr(case, name) for name in days}, days)
+        case.save()
+        self.assertEqual({name: getattr(case, name) for name in days},
+                         {'analyst_days': 1, 'qc_reviewer_days': 5, 'final_letter_days': 30, 'close_days': None})
+
+    def test_report_values_use_annotated_days(self):
+        user = User.objects.create_user(username='staff', password='password', is_staff=True)
+        prop = Property.objects.create(street='1 Main St', city='Town', state='VA', zipcode='22222')
+        requester = Requester.objects.create(first_name='First', last_name='Last', email='a@b.com')
+        ReportCase.objects.create(requester=requester, property=prop, request_date=date(2019, 1, 1),
+                                  analyst_signoff_date=date(2019, 1, 3), qc_reviewer_signoff_date=date(2019, 1, 7),
+                                  final_letter_date=date(2019, 2, 1), close_date=date(2019, 2, 11))
+        self.client.force_authenticate(user=user)
+        reports = {
+            'daystoresolution': {'close_days': 41},
+            'daystoeachstatus': {'analyst_days': 2, 'qc_reviewer_days': 6, 'final_letter_days': 31, 'close_days': 41},
+        }
+        for report, days in reports.items():
+            response = self.client.get('/cbrsservices/reportcases/', {'report': report, 'format': 'json'})
+            self.assertEqual(response.status_code, 200)
+            result = response.data['results'][0]
+            self.assertEqual({name: result[name] for name in days}, days)
+
+
+class CaseCountRollupTestCase(CaseTestData, APITestCase):
+    """
+    The case counts report reads the rollup table, which must match a live count of the cases after every kind of write
+    """
+
+    def assertCountsMatch(self):
+        for group_by in (None, 'cbrs_unit', 'fiscal_year'):
+            params = {'group_by': group_by} if group_by else {}
+            response = self.client.get('/cbrsservices/reportcasecounts/', params)
+            self.assertEqual(response.status_code, 200)
+            live_counts = ReportCase.report_case_counts.count_cases_by_status(group_by)
+            self.assertEqual(response.data, live_counts if group_by else [live_counts])
+        out = io.StringIO()
+        call_command('check_case_count_rollups', stdout=out)
+        self.assertIn('match', out.getvalue())
+
+    def test_rollups_follow_case_writes(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(2)
+        self.assertCountsMatch()
+        case = Case.objects.first()
+        case.qc_reviewer_signoff_date = date(2019, 1, 3)
+        case.save()
+        self.assertCountsMatch()
+        case.cbrs_unit = SystemUnit.objects.create(system_unit_number='DE-02P',
+                                                   system_unit_type=self.unit.system_unit_type)
+        case.save()
+        self.assertCountsMatch()
+        case.request_date = date(2019, 10, 1)
+        case.save()
+        self.assertCountsMatch()
+        case.delete()
+        self.assertCountsMatch()
+        rows = [{'property_street': '1 Main St', 'property_city': 'Town', 'requester_first_name': 'First',
+                 'requester_last_name': 'Last', 'cbrs_unit': self.unit.id, 'request_date': request_date}
+                for request_date in ('2019-01-01', '2019-11-01')]
+        response = self.client.post('/cbrsservices/cases/import/', '\n'.join(json.dumps(row) for row in rows),
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertCountsMatch()
+
+
+class CaseReferenceTestCase(APITestCase):
+    """
+    New cases keep a case reference they were given, and are given a new one when theirs was taken in the meantime
+    """
+
+    def setUp(self):
+        self.prop = Property.objects.create(street='1 Main St', city='Town', state='VA', zipcode='22222')
+        self.requester = Requester.objects.create(first_name='First', last_name='Last', email='a@b.com')
+
+    def test_given_case_reference_is_kept(self):
+        case = Case.objects.create(requester=self.requester, property=self.prop, case_reference='GIVEN001')
+        self.assertEqual(Case.objects.get(id=case.id).case_reference, 'GIVEN001')
+
+    def test_taken_case_reference_is_replaced(self):
+        taken = Case.objects.create(requester=self.requester, property=self.prop).case_reference
+        # the first new case reference is taken by the time the case is inserted
+        new_case_references = iter([taken, 'NEW00001'])
+        with mock.patch('cbrsservices.models.get_new_case_reference', lambda cases: next(new_case_references)):
+            case = Case.objects.create(requester=self.requester, property=self.prop)
+        self.assertEqual(case.case_reference, 'NEW00001')
+        self.assertEqual(Case.objects.filter(case_reference=taken).count(), 1)
+
+
+class CaseImportTestCase(APITestCase):
+    """
+    Imported cases must keep the same user fields, and follow the same user rules, as cases created one at a time
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', is_staff=True)
+        cls.analyst = User.objects.create(username='analyst')
+        cls.fws_reviewer = User.objects.create(username='fws_reviewer')
+
+    def import_rows(self, *rows):
+        self.client.force_authenticate(self.user)
+        content = '\n'.join(json.dumps(dict(row, property_street='1 Main St', property_city='Town',
+                                            requester_first_name='First', requester_last_name='Last'))
+                            for row in rows)
+        return self.client.post('/cbrsservices/cases/import/', content, content_type='application/x-ndjson')
+
+    def test_fws_reviewer_is_imported(self):
+        response = self.import_rows({'analyst': self.analyst.id, 'fws_reviewer': self.fws_reviewer.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Case.objects.get(id=response.data['cases'][0]['id']).fws_reviewer, self.fws_reviewer)
+
+    def test_fws_reviewer_is_validated(self):
+        response = self.import_rows({'analyst': self.analyst.id, 'fws_reviewer': self.analyst.id},
+                                    {'fws_reviewer': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertIn('non_field_errors', response.data['errors'][0]['errors'])
+        self.assertIn('fws_reviewer', response.data['errors'][1]['errors'])
+        self.assertFalse(Case.objects.exists())
+
+
+class FinalLettersTestCase(CaseTestData, APITestCase):
+    """
+    Batch final letters must be rendered in the request's own process, and reject options that are not valid
+    """
+
+    def test_final_letters_are_rendered_in_process(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(2)
+        Case.objects.update(cbrs_map_date=date(2010, 1, 1), prohibition_date=date(1990, 1, 1))
+        with mock.patch('cbrsservices.letters.ProcessPoolExecutor') as pool:
+            response = self.client.post('/cbrsservices/cases/finalletters/',
+                                        {'cases': list(Case.objects.values_list('id', flat=True))}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        pool.assert_not_called()
+
+    def test_invalid_options_are_rejected(self):
+        self.client.force_authenticate(self.user)
+        for data in ([1, 2], {'cases': ['a']}, {'cases': 1}, {'cases': [1], 'letter_format': 'txt'}):
+            response = self.client.post('/cbrsservices/cases/finalletters/', data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_incomplete_cases_fail_only_their_own_letters(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(2)
+        complete, incomplete = Case.objects.order_by('id')
+        Case.objects.filter(id=complete.id).update(cbrs_map_date=date(2010, 1, 1), prohibition_date=date(1990, 1, 1))
+        url = '/cbrsservices/cases/finalletters/'
+        response = self.client.post(url, {'cases': [complete.id, incomplete.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
+            names = zip_file.namelist()
+            failed = json.loads(zip_file.read('failed_letters.json'))
+        self.assertEqual(len(names), 2)
+        self.assertEqual([failure['case'] for failure in failed], [incomplete.id])
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            response = self.client.post(url, {'cases': [complete.id, incomplete.id], 'attach': True}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([letter['case'] for letter in response.data['cases']], [complete.id])
+        self.assertEqual([failure['case'] for failure in response.data['failed']], [incomplete.id])
+
+        response = self.client.post(url, {'cases': [incomplete.id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([failure['case'] for failure in response.data['failed']], [incomplete.id])
+
+    def test_replaced_final_letters_are_recorded_in_history(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(1)
+        Case.objects.update(cbrs_map_date=date(2010, 1, 1), prohibition_date=date(1990, 1, 1))
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            for i in range(2):
+                response = self.client.post('/cbrsservices/cases/finalletters/',
+                                            {'cases': [Case.objects.get().id], 'attach': True}, format='json')
+                self.assertEqual(response.status_code, 201)
+        first, second = CaseFile.objects.order_by('id')
+        self.assertEqual((first.final_letter, second.final_letter), (False, True))
+        history = first.history.order_by('history_id')
+        self.assertEqual([record.final_letter for record in history], [True, False])
+        self.assertEqual(history.last().history_user, self.user)
+
+
+class ConditionalGetTestCase(CaseTestData, APITestCase):
+    """
+    The ETag of the case responses must change with the records they show, including the users, which have no history
+    """
+
+    def test_etag_changes_with_cases_and_users(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(1)
+        etag = self.client.get('/cbrsservices/cases/')['ETag']
+        self.assertEqual(self.client.get('/cbrsservices/cases/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # a login only saves last_login, which no response shows
+        self.analyst.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get('/cbrsservices/cases/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.analyst.username = 'renamed'
+        self.analyst.save()
+        response = self.client.get('/cbrsservices/cases/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['analyst_string'], 'renamed')
+        etag = response['ETag']
+        Case.objects.get().save()
+        self.assertEqual(self.client.get('/cbrsservices/cases/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(API_TOKEN_REVOCATION_REFRESH=0)
+class TokenRevocationTestCase(APITestCase):
+    """
+    The API tokens of a user must be revoked whenever the flags they hold or the password change, however the user is
+    saved, while a token issued right after that stays valid
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('tokenuser', password='secret')
+
+    def get_token(self, password='secret'):
+        credentials = base64.b64encode(('tokenuser:' + password).encode()).decode()
+        response = self.client.post('/cbrsservices/auth/', HTTP_AUTHORIZATION='Basic ' + credentials)
+        self.assertEqual(response.status_code, 200)
+        return response.data['token']
+
+    def get_status(self, token):
+        return self.client.get('/cbrsservices/tags/', HTTP_AUTHORIZATION='Token ' + token).status_code
+
+    def test_tokens_are_revoked_when_flags_or_password_change(self):
+        token = self.get_token()
+        self.assertEqual(self.get_status(token), 200)
+        # a login only saves last_login
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.get_status(token), 200)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.get_status(token), 403)
+        token = self.get_token()
+        self.assertEqual(self.get_status(token), 200)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(self.get_status(token), 403)
+        token = self.get_token('changed')
+        self.assertEqual(self.get_status(token), 200)
+        self.user.delete()
+        self.assertEqual(self.get_status(token), 403)
+
+
+class LookupResponseCacheTestCase(APITestCase):
+    """
+    A cached lookup table response must be answered (or revalidated) without any query
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='admin', is_staff=True)
+        Determination.objects.create(determination='In')
+
+    def test_cached_lookup_needs_no_query(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/cbrsservices/determinations/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/cbrsservices/determinations/')
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, response.data)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/cbrsservices/determinations/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def assertWriteInvalidates(self, write):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/cbrsservices/determinations/')
+        determination = Determination.objects.get()
+        self.assertIn(write(determination).status_code, (200, 201, 204))
+        fresh = self.client.get('/cbrsservices/determinations/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], response['ETag'])
+        self.assertEqual(sorted(item['determination'] for item in fresh.data),
+                         sorted(Determination.objects.values_list('determination', flat=True)))
+
+    def test_create_invalidates_cached_lookup(self):
+        self.assertWriteInvalidates(lambda determination: self.client.post(
+            '/cbrsservices/determinations/', {'determination': 'Out'}))
+
+    def test_update_invalidates_cached_lookup(self):
+        self.assertWriteInvalidates(lambda determination: self.client.patch(
+            '/cbrsservices/determinations/' + str(determination.id) + '/', {'determination': 'Out'}))
+
+    def test_delete_invalidates_cached_lookup(self):
+        self.assertWriteInvalidates(lambda determination: self.client.delete(
+            '/cbrsservices/determinations/' + str(determination.id) + '/'))
+
+
+@override_settings(REQUEST_METRICS_SERVER_TIMING=True)
+class RequestMetricsTestCase(CaseTestData, APITestCase):
+    """
+    The request metrics must time the serializers separately from the SQL queries and the rest of the view
+    """
+
+    def test_serialization_is_timed(self):
+        self.client.force_authenticate(self.user)
+        self.create_cases(2)
+        request_metrics.reset()
+        for view in ('', 'workbench', 'report'):
+            response = self.client.get('/cbrsservices/cases/?view=' + view)
+            self.assertEqual(response.status_code, 200)
+            timings = dict(timing.split(';')[:2] for timing in response['Server-Timing'].split(', '))
+            self.assertEqual(set(timings), {'sql', 'serialize', 'app', 'render', 'total'})
+        stats = request_metrics.snapshot()[0]
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreater(stats['max_ms']['serialize'], 0)
@@ -22,6 +22,7 @@ router.register(r'systemunitprohibitiondates', views.SystemUnitProhibitionDateVi
 router.register(r'systemunitmaps', views.SystemUnitMapViewSet, 'systemunitmaps')
 router.register(r'systemmaps', views.SystemMapViewSet, 'systemmaps')
 router.register(r'fieldoffices', views.FieldOfficeViewSet, 'fieldoffices')
+router.register(r'finalemails', views.FinalEmailViewSet, 'finalemails')
 router.register(r'users', views.UserViewSet, 'users')
 
 urlpatterns = [
@@ -34,5 +35,7 @@ urlpatterns = [
                                         extra_context={'schema_url': 'openapi-schema'}), name='redoc'),
     url(r'^auth/$', views.AuthView.as_view(), name='authenticate'),
     url(r'^reportcases/$', views.ReportCaseView.as_view(), name='reportcases'),
-    url(r'^reportcasecounts/$', views.ReportCaseCountView.as_view(), name='reportcasecounts')
+    url(r'^reportcasecounts/$', views.ReportCaseCountView.as_view(), name='reportcasecounts'),
+    url(r'^reportcasedays/$', views.ReportCaseDaysView.as_view(), name='reportcasedays'),
+    url(r'^requestmetrics/$', views.RequestMetricsView.as_view(), name='requestmetrics')
 ]
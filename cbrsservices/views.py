@@ -1,11 +1,22 @@
+import hashlib
+import time
 from itertools import chain
 from datetime import datetime as dt
-from django.db.models import Q
-from rest_framework import views, viewsets, generics, authentication
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Q, prefetch_related_objects
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework import views, viewsets, generics, authentication, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework_csv.renderers import CSVStreamingRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 from cbrsservices.serializers import *
 from cbrsservices.models import *
@@ -14,6 +25,9 @@ from cbrsservices.renderers import *
 from cbrsservices.paginations import *
 from cbrsservices.authentication import *
 from cbrsservices.filters import *
+from cbrsservices.imports import *
+from cbrsservices.letters import *
+from cbrsservices.middleware import request_metrics, measure_serialize
 
 
 ########################################################################################################################
@@ -40,9 +54,61 @@ from cbrsservices.filters import *
 ######
 
 
-class HistoryViewSet(viewsets.ModelViewSet):
+def get_response_cache_versions(models):
+    """Returns the current response cache version of each of the models, starting a version for any model without one"""
+    keys = ['response_cache_version:' + model._meta.label_lower for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start from the clock rather than zero, so a version that was evicted from the cache is never reused
+            cache.add(key, int(time.time() * 1000))
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def increment_response_cache_version(model):
+    """Makes every cached response built from the model unreachable, by moving to the model's next version"""
+    key = 'response_cache_version:' + model._meta.label_lower
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000))
+
+
+class MeasuredSerializer(object):
+    """
+    This class will wrap a serializer, and measure the time of building its data for the request metrics
+    (see measure_serialize), passing everything else through to the serializer
+    """
+
+    def __init__(self, serializer, request):
+        self.serializer = serializer
+        self.request = request
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        with measure_serialize(self.request):
+            return self.serializer.data
+
+
+class SerializeMetricsMixin(object):
     """
-    This class will automatically assign the User ID to the created_by and modified_by history fields when appropriate
+    This class will measure the serialization of the view's serializers separately from the rest of the view,
+    so that the request metrics show the serializers (and their lazy loads) that are slow
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super(SerializeMetricsMixin, self).get_serializer(*args, **kwargs)
+        return MeasuredSerializer(serializer, self.request)
+
+
+class HistoryViewSet(SerializeMetricsMixin, viewsets.ModelViewSet):
+    """
+    This class will automatically assign the User ID to the created_by and modified_by history fields when appropriate,
+    and invalidate the cached responses built from the model on every write
     """
 
     permission_classes = (IsActive,)
@@ -53,12 +119,286 @@ class HistoryViewSet(viewsets.ModelViewSet):
             serializer.save(created_by=self.request.user, modified_by=self.request.user)
         else:
             serializer.save()
+        increment_response_cache_version(type(serializer.instance))
 
     def perform_update(self, serializer):
         if self.basename != 'users':
             serializer.save(modified_by=self.request.user)
         else:
             serializer.save()
+        increment_response_cache_version(type(serializer.instance))
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        increment_response_cache_version(type(instance))
+
+
+class ResponseCacheMixin(object):
+    """
+    This class will cache the list and detail responses of a near-static lookup table, under a key that includes
+    the current version of each model the responses are built from (cache_models), so that a write to any of them
+    through a HistoryViewSet makes the cached responses unreachable at once.
+    The versions are kept in the default cache, so every server process must share it for writes in one process
+    to invalidate the responses cached by the others (otherwise the cache timeout bounds how stale they can be).
+    """
+
+    cache_models = ()
+
+    def get_response_cache_key(self, request):
+        versions = '.'.join(str(version) for version in get_response_cache_versions(self.cache_models))
+        path = hashlib.sha256(request.get_full_path().encode('utf-8')).hexdigest()
+        return 'response_cache:%s:%s:%s:%s' % (self.basename, versions, request.accepted_renderer.format, path)
+
+    def get_cached_response(self, request, get_response):
+        cache_key = self.get_response_cache_key(request)
+        data = cache.get(cache_key)
+        if data is not None:
+            return Response(data)
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data,
+                      getattr(settings, 'REST_FRAMEWORK_EXTENSIONS', {}).get('DEFAULT_CACHE_RESPONSE_TIMEOUT', 600))
+        return response
+
+    # the permissions were already checked by the view before these are called, so cached responses stay protected
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs))
+
+
+def get_history_versions(models):
+    """
+    Returns the latest history id of each of the models and the history date of that latest history record,
+    read in a single query that only uses the primary key index of each history table (the history date has no index),
+    which change whenever a change to one of their records (including a delete) is recorded in their history
+    """
+    quote_name = connection.ops.quote_name
+    selects = []
+    for model in models:
+        table = quote_name(model.history.model._meta.db_table)
+        selects.append('(SELECT MAX(history_id) FROM %s), (SELECT history_date FROM %s WHERE history_id = '
+                       '(SELECT MAX(history_id) FROM %s))' % (table, table, table))
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(selects))
+        row = cursor.fetchone()
+    versions = []
+    for history_id, history_date in zip(row[0::2], row[1::2]):
+        # some databases return the subquery dates as strings
+        if isinstance(history_date, str):
+            history_date = parse_datetime(history_date)
+        versions.append((history_id, history_date))
+    return versions
+
+
+# the models whose records appear in the case responses
+CASE_ETAG_MODELS = (Case, Property, Requester, CaseTag, Tag, Comment, CaseFile, Determination, SystemUnit,
+                    SystemUnitType, SystemMap)
+
+
+class ConditionalGetMixin(object):
+    """
+    This class will add a strong ETag and a Last-Modified header to list and detail responses, both derived from the
+    history of the models the responses are built from (etag_models), and will answer a request whose If-None-Match
+    (or If-Modified-Since) matches with a 304 Not Modified, before any record is read or serialized.
+    Changes that bypass the history (like queryset updates) are not seen, so they must not be made to these models.
+    Users have no history, so the ETag includes their response cache version instead (see
+    increment_response_cache_version), which only changes in every server process when they share the default cache;
+    the Last-Modified header does not change with users, so clients should revalidate with If-None-Match.
+    Views with cached responses (cache_models, see ResponseCacheMixin) derive the ETag from the response cache versions
+    alone, so that a cached response is answered without any query, and send no Last-Modified header.
+    """
+
+    # the models whose records appear in the responses (by default, the queryset model)
+    etag_models = ()
+    # the models without history whose records appear in the responses (the user strings of most serializers)
+    etag_version_models = (User,)
+
+    def get_etag_models(self):
+        return self.etag_models or (self.get_queryset().model,)
+
+    def get_conditional_headers(self, request):
+        """Returns the ETag and the Last-Modified timestamp (or None) of the response to the request"""
+        cache_models = tuple(getattr(self, 'cache_models', ()))
+        if cache_models:
+            # the same versions that every write through the API moves on (see HistoryViewSet), read from the cache
+            versions = []
+            cache_versions = get_response_cache_versions(cache_models + tuple(self.etag_version_models))
+        else:
+            versions = get_history_versions(self.get_etag_models())
+            cache_versions = get_response_cache_versions(self.etag_version_models)
+        # the same data renders differently for each format and (through the permissions) may differ for each user
+        key = '|'.join([request.get_full_path(), request.accepted_media_type, str(request.user.pk)] +
+                       [str(history_id) for history_id, history_date in versions] +
+                       [str(version) for version in cache_versions])
+        etag = '"%s"' % hashlib.sha256(key.encode('utf-8')).hexdigest()[:40]
+        history_dates = [history_date for history_id, history_date in versions if history_date is not None]
+        last_modified = None
+        if history_dates:
+            last_modified = max(history_dates)
+            if timezone.is_naive(last_modified):
+                last_modified = timezone.make_aware(last_modified)
+            last_modified = int(last_modified.timestamp())
+        return etag, last_modified
+
+    def get_conditional_response(self, request, get_response):
+        etag, last_modified = self.get_conditional_headers(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    # the permissions were already checked by the view before these are called
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+class FetchPlanMixin(object):
+    """
+    This class will load the related objects needed by the chosen serializer along with the main query,
+    so that list responses are built in a fixed number of queries regardless of how many rows are returned
+    """
+
+    # fetch plans keyed by serializer class, each a dict of optional 'select_related', 'prefetch_related',
+    # and 'only' tuples; serializers without a plan get the plain queryset
+    fetch_plans = {}
+
+    def apply_fetch_plan(self, queryset):
+        plan = self.fetch_plans.get(self.get_serializer_class(), None)
+        if plan is not None:
+            if plan.get('select_related', None):
+                queryset = queryset.select_related(*plan['select_related'])
+            if plan.get('prefetch_related', None):
+                queryset = queryset.prefetch_related(*plan['prefetch_related'])
+            if plan.get('only', None):
+                queryset = queryset.only(*plan['only'])
+        return queryset
+
+
+class StreamingCSVMixin(object):
+    """
+    This class will stream a CSV export of the whole (unpaginated) queryset when the 'stream' URL argument is true,
+    reading the rows from a server-side cursor and rendering them in chunks, instead of building the entire CSV in memory
+    """
+
+    stream_chunk_size = 2000
+
+    def is_streaming(self):
+        if self.request is None or self.request.accepted_renderer.format != 'csv':
+            return False
+        return self.request.query_params.get('stream', '').lower() == 'true'
+
+    def list(self, request, *args, **kwargs):
+        if self.is_streaming():
+            return self.stream_csv(self.filter_queryset(self.get_queryset()))
+        return super(StreamingCSVMixin, self).list(request, *args, **kwargs)
+
+    def serialize_chunk(self, chunk, serializer_class, prefetch_related):
+        # iterator() ignores prefetch_related, so prefetch each chunk separately
+        if prefetch_related:
+            prefetch_related_objects(chunk, *prefetch_related)
+        yield from self.join_lists(serializer_class(chunk, many=True, context=self.get_serializer_context()).data)
+
+    @staticmethod
+    def join_lists(items):
+        for item in items:
+            # join list of tag numbers
+            for key, value in item.items():
+                if isinstance(value, list):
+                    item[key] = ', '.join(str(v) for v in value)
+            yield item
+
+    def stream_values_rows(self, queryset, values_serializer):
+        chunk = []
+        for row in values_serializer.get_values(queryset).iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(row)
+            if len(chunk) >= self.stream_chunk_size:
+                yield from self.join_lists(values_serializer.to_representation(chunk))
+                chunk = []
+        if chunk:
+            yield from self.join_lists(values_serializer.to_representation(chunk))
+
+    def stream_rows(self, queryset, serializer_class):
+        values_serializer_class = getattr(self, 'values_serializers', {}).get(serializer_class, None)
+        if values_serializer_class is not None:
+            yield from self.stream_values_rows(queryset, values_serializer_class())
+            return
+        plan = getattr(self, 'fetch_plans', {}).get(serializer_class, {})
+        prefetch_related = plan.get('prefetch_related', ())
+        chunk = []
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) >= self.stream_chunk_size:
+                yield from self.serialize_chunk(chunk, serializer_class, prefetch_related)
+                chunk = []
+        if chunk:
+            yield from self.serialize_chunk(chunk, serializer_class, prefetch_related)
+
+    def stream_csv(self, queryset):
+        renderer = self.request.accepted_renderer
+        serializer_class = self.get_serializer_class()
+        # renderers without hard-coded headers get the sorted serializer fields, which is what the CSVRenderer
+        # would have read from the rows, since the header has to be known before the first row is streamed
+        header = renderer.header or sorted(serializer_class().fields.keys())
+        renderer_context = {'header': header, 'labels': renderer.labels}
+        rows = CSVStreamingRenderer().render(self.stream_rows(queryset, serializer_class),
+                                             renderer_context=renderer_context)
+        return StreamingHttpResponse(rows, content_type=renderer.media_type)
+
+
+class ValuesListMixin(object):
+    """
+    This class will build list responses straight from .values() rows when the chosen serializer has a values
+    serializer (see VALUES_SERIALIZERS), instead of building a model instance and serializer fields for every row
+    """
+
+    values_serializers = VALUES_SERIALIZERS
+
+    def get_values_serializer(self):
+        values_serializer_class = self.values_serializers.get(self.get_serializer_class(), None)
+        return values_serializer_class() if values_serializer_class is not None else None
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super(ValuesListMixin, self).list(request, *args, **kwargs)
+        queryset = values_serializer.get_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        with measure_serialize(request):
+            data = values_serializer.to_representation(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class KeysetPaginationMixin(object):
+    """
+    This class will page through the records by keyset (cursor) instead of the default pagination
+    when the 'pagination' URL argument is 'keyset'
+    """
+
+    # override the default paginator to use keyset pagination when requested
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination = self.request.query_params.get('pagination', None) if self.request else None
+            if pagination is not None and pagination == 'keyset':
+                self._paginator = KeysetResultsSetPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class is not None else None
+        return self._paginator
 
 
 ######
@@ -68,21 +408,106 @@ class HistoryViewSet(viewsets.ModelViewSet):
 ######
 
 
-class CaseViewSet(HistoryViewSet):
+class CaseViewSet(ConditionalGetMixin, StreamingCSVMixin, ValuesListMixin, KeysetPaginationMixin, FetchPlanMixin,
+                  HistoryViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = CaseFilter
-
+    etag_models = CASE_ETAG_MODELS
+    fetch_plans = {
+        CaseSerializer: {
+            'select_related': ('analyst', 'qc_reviewer', 'cbrs_unit', 'map_number', 'determination'),
+            'prefetch_related': ('comments', 'tags', 'casefiles'),
+        },
+        WorkbenchSerializer: {
+            'select_related': ('analyst', 'qc_reviewer', 'cbrs_unit', 'property', 'determination', 'requester'),
+            'prefetch_related': ('tags',),
+        },
+        ReportSerializer: {
+            'select_related': ('property', 'determination'),
+        },
+        LetterSerializer: {
+            'select_related': ('cbrs_unit__system_unit_type', 'map_number', 'property', 'determination', 'requester'),
+        },
+        CaseIDSerializer: {
+            'only': ('id', 'case_reference', 'duplicate'),
+        },
+    }
+
+    # queue the final email for the background worker, so the request never waits on the mail server;
+    # the returned final email can be polled at finalemails/<id>/ for its delivery status
     @action(methods=['post'], detail=True)
     def send_final_email(self, request, pk=None):
         case = self.get_object()
-        case.send_final_email()
-        return Response({'status': 'final email sent'})
-
-    # override the default renderers to use a custom DOCX renderer when requested
+        if case.final_letter_date is None:
+            return Response({'final_letter_date': ['The case has no final letter date.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        final_email = FinalEmail.objects.queue(case, request.user)
+        return Response(FinalEmailSerializer(final_email).data, status=status.HTTP_202_ACCEPTED)
+
+    # create many cases at once from an uploaded CSV or JSON lines file (or the request body itself)
+    @action(methods=['post'], detail=False, url_path='import', parser_classes=(MultiPartParser, FormParser))
+    def bulk_import(self, request):
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file', None)
+            if upload is None:
+                return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+            content, name = upload.read(), upload.name
+        else:
+            content, name = request.body, ''
+        content_format = 'csv' if 'csv' in request.content_type or name.lower().endswith('.csv') else 'jsonl'
+        dry_run = request.query_params.get('dry_run', '').lower() == 'true'
+
+        case_import = CaseImport(request.user)
+        result = case_import.run(case_import.read(content, content_format), dry_run=dry_run)
+        if dry_run:
+            response_status = status.HTTP_200_OK
+        elif result['count']:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST if result['errors'] else status.HTTP_200_OK
+        return Response(result, status=response_status)
+
+    # render the final letters of many cases at once, given as a list of case ids or by the usual case filters,
+    # and return them in a zip file, or attach them to their cases as final letters (and optionally queue their emails)
+    @action(methods=['post'], detail=False, url_path='finalletters')
+    def final_letters(self, request):
+        options = FinalLettersSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        if 'cases' in options.validated_data:
+            queryset = Case.objects.filter(id__in=options.validated_data['cases'])
+        elif any(param != 'format' for param in request.query_params):
+            queryset = Case.objects.filter(id__in=self.filter_queryset(self.get_queryset()).values('id'))
+        else:
+            return Response({'cases': ['Either a list of case ids or a case filter is required.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        email = options.validated_data['email']
+        attach = email or options.validated_data['attach']
+
+        # the letters are rendered in this process, a process pool is only worth starting in generate_final_letters
+        batch = FinalLetterBatch(request.user, letter_format=options.validated_data['letter_format'])
+        if not batch.run(queryset):
+            if batch.failures:
+                return Response({'cases': ['No final letter could be rendered.'], 'failed': batch.failures},
+                                status=status.HTTP_400_BAD_REQUEST)
+            return Response({'cases': ['No cases were found.']}, status=status.HTTP_400_BAD_REQUEST)
+        # the letters of incomplete cases are left out, and listed in the zip file or the result instead
+        if not attach:
+            response = HttpResponse(batch.zip(), content_type='application/zip')
+            response['Content-Disposition'] = "attachment; filename=final_letters_%s.zip" % dt.now().strftime(
+                "%Y-%m-%d")
+            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+            return response
+        result = batch.get_result()
+        result['casefiles'] = batch.attach()
+        if email:
+            result['final_emails'] = FinalEmailSerializer(batch.queue_emails(), many=True).data
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    # override the default renderers to use a custom DOCX or PDF renderer when requested
     def get_renderers(self):
         frmt = self.request.query_params.get('format', None) if self.request else None
-        if frmt is not None and frmt == 'docx':
-            renderer_classes = (FinalLetterDOCXRenderer,) + tuple(api_settings.DEFAULT_RENDERER_CLASSES)
+        if frmt is not None and frmt in FINAL_LETTER_RENDERERS:
+            renderer_classes = (FINAL_LETTER_RENDERERS[frmt],) + tuple(api_settings.DEFAULT_RENDERER_CLASSES)
         elif frmt is not None and frmt == 'csv':
             renderer_classes = (WorkbenchCSVRenderer,) + tuple(api_settings.DEFAULT_RENDERER_CLASSES)
         else:
@@ -97,27 +522,27 @@ class CaseViewSet(HistoryViewSet):
             return WorkbenchSerializer
         elif view is not None and view == 'report':
             return ReportSerializer
-        elif self.request is not None and self.request.accepted_renderer.format == 'docx':
+        elif self.request is not None and self.request.accepted_renderer.format in FINAL_LETTER_RENDERERS:
             return LetterSerializer
         elif view is not None and view == 'caseid':
             return CaseIDSerializer
         else:
             return CaseSerializer
 
-    # override the default finalize_response to assign a filename to DOCX files
+    # override the default finalize_response to assign a filename to DOCX and PDF files
     # see https://github.com/mjumbewu/django-rest-framework-csv/issues/15
     def finalize_response(self, request, *args, **kwargs):
         response = super(viewsets.ModelViewSet, self).finalize_response(request, *args, **kwargs)
-         # join list of tag numbers
-        for item in (item for item in response.data if isinstance(item, dict)):
-            for key, value in item.items():
-                if isinstance(item[key], list):  # TODO: can do this better
-                    item[key] = ', '.join(str(v) for v in value)
-        if request is not None and request.accepted_renderer.format == 'docx':
-            filename = 'final_letter_case_'
-            filename += self.get_queryset().first().case_reference + '_'
-            filename += dt.now().strftime("%Y") + '-' + dt.now().strftime("%m") + '-' + dt.now().strftime("%d")
-            filename += '.docx'
+        # join list of tag numbers (streamed responses already joined them while streaming, files have no data)
+        if isinstance(response, Response):
+            items = response.data.get('results', []) if isinstance(response.data, dict) else response.data
+            for item in (item for item in items if isinstance(item, dict)):
+                for key, value in item.items():
+                    if isinstance(item[key], list):  # TODO: can do this better
+                        item[key] = ', '.join(str(v) for v in value)
+        if request is not None and request.accepted_renderer.format in FINAL_LETTER_RENDERERS:
+            filename = get_final_letter_filename(self.filter_queryset(self.get_queryset()).first().case_reference,
+                                                 request.accepted_renderer.format)
             response['Content-Disposition'] = "attachment; filename=%s" % filename
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
         elif request is not None and request.accepted_renderer.format == 'csv':
@@ -127,168 +552,17 @@ class CaseViewSet(HistoryViewSet):
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return response
 
-    # override the default queryset to allow filtering by URL arguments
+    # override the default queryset to load the related objects of the requested view (see CaseFilter for the filters)
     def get_queryset(self):
-        queryset = Case.objects.all()
+        queryset = Case.objects.with_status()
         if self.request:
-            # filter by case reference, exact
-            case_reference = self.request.query_params.get('case_reference', None)
-            if case_reference is not None:
-                queryset = queryset.filter(case_reference__exact=case_reference)
-            # filter by property ID, exact
-            property = self.request.query_params.get('property', None)
-            if property is not None:
-                queryset = queryset.filter(property__exact=property)
-            # filter by requester ID, exact
-            requester = self.request.query_params.get('requester', None)
-            if requester is not None:
-                queryset = queryset.filter(requester__exact=requester)
-            # filter by status, exact
-            status = self.request.query_params.get('status', None)
-            if status is not None:
-                if status == 'Closed with no Final Letter':
-                    queryset = queryset.filter(close_date__isnull=False,
-                                               final_letter_date__isnull=True)
-                elif status == 'Final':
-                    queryset = queryset.filter(close_date__isnull=False,
-                                               final_letter_date__isnull=False)
-                elif status == 'Awaiting Final Letter':
-                    queryset = queryset.filter(qc_reviewer_signoff_date__isnull=False,
-                                               close_date__isnull=True,
-                                               final_letter_date__isnull=True)
-                elif status == 'Awaiting QC':
-                    queryset = queryset.filter(analyst_signoff_date__isnull=False,
-                                               qc_reviewer_signoff_date__isnull=True,
-                                               close_date__isnull=True,
-                                               final_letter_date__isnull=True)
-                elif status == 'Received':
-                    queryset = queryset.filter(analyst_signoff_date__isnull=True,
-                                               qc_reviewer_signoff_date__isnull=True,
-                                               close_date__isnull=True,
-                                               final_letter_date__isnull=True)
-                elif status == 'Open':
-                    queryset = queryset.filter(close_date__isnull=True,
-                                               final_letter_date__isnull=True)
-                else:
-                    pass
-            # filter by case number, exact list
-            case_number = self.request.query_params.get('case_number', None)
-            if case_number is not None:
-                case_number_list = case_number.split(',')
-                queryset = queryset.filter(id__in=case_number_list)
-            # filter by case reference, exact list
-            # TODO: I don't think this is working as expected
-            case_reference = self.request.query_params.get('case_reference', None)
-            if case_reference is not None:
-                case_reference_list = case_reference.split(',')
-                queryset = queryset.filter(case_reference__in=case_reference_list)
-            # filter by request date (after only, before only, or between both, depending on which URL params appear)
-            request_date_after = self.request.query_params.get('request_date_after', None)
-            request_date_before = self.request.query_params.get('request_date_before', None)
-            if request_date_after is not None and request_date_before is not None:
-                # the filter below using __range is date-inclusive
-                # queryset = queryset.filter(request_date__range=(request_date_after, request_date_before))
-                # the filter below is date-exclusive
-                queryset = queryset.filter(request_date__gt=request_date_after, request_date__lt=request_date_before)
-            elif request_date_after is not None:
-                queryset = queryset.filter(request_date__gt=request_date_after)
-            elif request_date_before is not None:
-                queryset = queryset.filter(request_date__lt=request_date_before)
-            # filter by distance (to only, from only, or between both, depending on which URL params appear)
-            distance_from = self.request.query_params.get('distance_from', None)
-            distance_to = self.request.query_params.get('distance_to', None)
-            if distance_from is not None and distance_to is not None:
-                # the filter below using __range is value-inclusive
-                # queryset = queryset.filter(distance__range=(distance_from, distance_to))
-                # the filter below is value-exclusive
-                queryset = queryset.filter(distance__gt=distance_from, distance__lt=distance_to)
-            elif distance_from is not None:
-                queryset = queryset.filter(distance__gt=distance_from)
-            elif distance_to is not None:
-                queryset = queryset.filter(distance__lt=distance_to)
-            # filter by analyst IDs, exact list
-            analyst = self.request.query_params.get('analyst', None)
-            if analyst is not None:
-                analyst_list = analyst.split(',')
-                queryset = queryset.filter(analyst__in=analyst_list)
-            # filter by QC reviewer IDs, exact list
-            qc_reviewer = self.request.query_params.get('qc_reviewer', None)
-            if qc_reviewer is not None:
-                qc_reviewer_list = qc_reviewer.split(',')
-                queryset = queryset.filter(qc_reviewer__in=qc_reviewer_list)
-            # filter by CBRS unit IDs, exact list
-            cbrs_unit = self.request.query_params.get('cbrs_unit', None)
-            if cbrs_unit is not None:
-                cbrs_unit_list = cbrs_unit.split(',')
-                queryset = queryset.filter(cbrs_unit__in=cbrs_unit_list)
-            # filter by street, case-insensitive contain
-            street = self.request.query_params.get('street', None)
-            if street is not None:
-                queryset = queryset.filter(property__street__icontains=street)
-            # filter by city, case-insensitive contain
-            city = self.request.query_params.get('city', None)
-            if city is not None:
-                queryset = queryset.filter(property__city__icontains=city)
-            # policy_number, exact list
-            policy_number = self.request.query_params.get('policy_number', None)
-            if policy_number is not None:
-                policy_number_list = policy_number.split(',')
-                queryset = queryset.filter(property__policy_number__in=policy_number_list)
-            # filter by tag IDs, exact list
-            tags = self.request.query_params.get('tags', None)
-            if tags is not None:
-                tag_list = tags.split(',')
-                queryset = queryset.filter(tags__in=tag_list)
-            # filter by priority, exact
-            priority = self.request.query_params.get('priority', None)
-            if priority is not None:
-                queryset = queryset.filter(priority__exact=priority)
-            # filter by on_hold, exact
-            on_hold = self.request.query_params.get('on_hold', None)
-            if on_hold is not None:
-                queryset = queryset.filter(on_hold__exact=on_hold)
-            # filter by invalid, exact
-            invalid = self.request.query_params.get('invalid', None)
-            if invalid is not None:
-                queryset = queryset.filter(invalid__exact=invalid)
-            # filter by hard_copy_map_reviewed, exact
-            hard_copy_map_reviewed = self.request.query_params.get('hard_copy_map_reviewed', None)
-            if hard_copy_map_reviewed is not None:
-                queryset = queryset.filter(hard_copy_map_reviewed__exact=hard_copy_map_reviewed)
-            # filter by duplicate, exact (also include the original case, per cooperator request)
-            duplicate = self.request.query_params.get('duplicate', None)
-            if duplicate is not None:
-                if duplicate == 'none':
-                    queryset = queryset.filter(duplicate__isnull=True)
-                else:
-                    queryset = queryset.filter(
-                        Q(id__exact=duplicate) |
-                        Q(duplicate__exact=duplicate))
-            # filter by fiscal year, exact
-            fiscal_year = self.request.query_params.get('fiscal_year', None)
-            if fiscal_year is not None:
-                fiscal_year_start = str(int(fiscal_year) - 1) + "-10-01"
-                fiscal_year_end = fiscal_year + "-09-30"
-                queryset = queryset.filter(request_date__gte=fiscal_year_start, request_date__lte=fiscal_year_end)
-            # filter by freetext, case-insensitive contain
-            freetext = self.request.query_params.get('freetext', None)
-            if freetext is not None:
-                queryset = queryset.filter(
-                    Q(analyst__username__icontains=freetext) |
-                    Q(analyst__first_name__icontains=freetext) |
-                    Q(analyst__last_name__icontains=freetext) |
-                    Q(case_reference__icontains=freetext) |
-                    #Q(case_number__icontains=freetext) |
-                    #Q(RawSQL("SELECT id FROM cbrs_case WHERE id::varchar ILIKE %s", freetext)) | #("'%'" + freetext + "'%'",))) |
-                    Q(cbrs_unit__system_unit_name__icontains=freetext) |
-                    Q(property__street__icontains=freetext) |
-                    Q(property__unit__icontains=freetext) |
-                    Q(property__city__icontains=freetext) |
-                    Q(property__policy_number__icontains=freetext))
+            # load the related objects needed by the requested view in the same handful of queries
+            queryset = self.apply_fetch_plan(queryset)
         return queryset
 
 
-class CaseFileViewSet(HistoryViewSet):
+class CaseFileViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = CaseFile.objects.all()
     serializer_class = CaseFileSerializer
     permission_classes = (permissions.IsAuthenticated,)
     parser_classes = (MultiPartParser, FormParser,)
@@ -307,112 +581,20 @@ class CaseFileViewSet(HistoryViewSet):
                         file=self.request.data.get('file'), uploader=get_user(),
                         created_by=get_user(), modified_by=get_user())
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = CaseFile.objects.all()
-        if self.request:
-            # filter by case ID, exact
-            case_id = self.request.query_params.get('case', None)
-            if case_id is not None:
-                queryset = queryset.filter(case__exact=case_id)
-        return queryset
-
 
-class PropertyViewSet(HistoryViewSet):
+class PropertyViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = Property.objects.all()
     serializer_class = PropertySerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = PropertyFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = Property.objects.all()
-        if self.request:
-            # filter by case ID, exact
-            case_id = self.request.query_params.get('case', None)
-            if case_id is not None:
-                queryset = queryset.filter(cases__exact=case_id)
-            # filter by street, exact
-            street = self.request.query_params.get('street', None)
-            if street is not None:
-                queryset = queryset.filter(street__exact=street)
-            # filter by unit, exact
-            unit = self.request.query_params.get('unit', None)
-            if unit is not None:
-                queryset = queryset.filter(unit__exact=unit)
-            # filter by city, exact
-            city = self.request.query_params.get('city', None)
-            if city is not None:
-                queryset = queryset.filter(city__exact=city)
-            # filter by state, exact
-            state = self.request.query_params.get('state', None)
-            if state is not None:
-                queryset = queryset.filter(state__exact=state)
-            # filter by zipcode, exact
-            zipcode = self.request.query_params.get('zipcode', None)
-            if zipcode is not None:
-                queryset = queryset.filter(zipcode__exact=zipcode)
-            # filter by legal_description, exact
-            legal_description = self.request.query_params.get('legal_description', None)
-            if legal_description is not None:
-                queryset = queryset.filter(legal_description__exact=legal_description)
-        return queryset
 
-
-class RequesterViewSet(HistoryViewSet):
+class RequesterViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = Requester.objects.all()
     serializer_class = RequesterSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = RequesterFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = Requester.objects.all()
-        if self.request:
-            # filter by case ID, exact
-            case_id = self.request.query_params.get('case', None)
-            if case_id is not None:
-                queryset = queryset.filter(cases__exact=case_id)
-            # filter by salutation, exact
-            salutation = self.request.query_params.get('salutation', None)
-            if salutation is not None:
-                queryset = queryset.filter(salutation__exact=salutation)
-            # filter by first_name, exact
-            first_name = self.request.query_params.get('first_name', None)
-            if first_name is not None:
-                queryset = queryset.filter(first_name__exact=first_name)
-            # filter by last_name, exact
-            last_name = self.request.query_params.get('last_name', None)
-            if last_name is not None:
-                queryset = queryset.filter(last_name__exact=last_name)
-            # filter by organization, exact
-            organization = self.request.query_params.get('organization', None)
-            if organization is not None:
-                queryset = queryset.filter(organization__exact=organization)
-            # filter by email, exact
-            email = self.request.query_params.get('email', None)
-            if email is not None:
-                queryset = queryset.filter(email__exact=email)
-            # filter by street, exact
-            street = self.request.query_params.get('street', None)
-            if street is not None:
-                queryset = queryset.filter(street__exact=street)
-            # filter by unit, exact
-            unit = self.request.query_params.get('unit', None)
-            if unit is not None:
-                queryset = queryset.filter(unit__exact=unit)
-            # filter by city, exact
-            city = self.request.query_params.get('city', None)
-            if city is not None:
-                queryset = queryset.filter(city__exact=city)
-            # filter by state, exact
-            state = self.request.query_params.get('state', None)
-            if state is not None:
-                queryset = queryset.filter(state__exact=state)
-            # filter by zipcode, exact
-            zipcode = self.request.query_params.get('zipcode', None)
-            if zipcode is not None:
-                queryset = queryset.filter(zipcode__exact=zipcode)
-        return queryset
-
 
 ######
 #
@@ -421,37 +603,20 @@ class RequesterViewSet(HistoryViewSet):
 ######
 
 
-class CaseTagViewSet(HistoryViewSet):
+class CaseTagViewSet(ConditionalGetMixin, HistoryViewSet):
+    etag_models = (CaseTag, Tag)
+    queryset = CaseTag.objects.all()
     serializer_class = CaseTagSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = CaseTagFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = CaseTag.objects.all()
-        if self.request:
-            # filter by case ID, exact
-            case_id = self.request.query_params.get('case', None)
-            if case_id is not None:
-                queryset = queryset.filter(case_id__exact=case_id)
-        return queryset
-
 
-class TagViewSet(HistoryViewSet):
+class TagViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = TagFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = Tag.objects.all()
-        if self.request:
-            # filter by tag name, exact
-            tag_name = self.request.query_params.get('name', None)
-            if tag_name is not None:
-                queryset = queryset.filter(name__exact=tag_name)
-        return queryset
-
 
 ######
 #
@@ -460,21 +625,12 @@ class TagViewSet(HistoryViewSet):
 ######
 
 
-class CommentViewSet(HistoryViewSet):
+class CommentViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = CommentFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = Comment.objects.all()
-        if self.request:
-            # filter by case ID, exact
-            case_id = self.request.query_params.get('case', None)
-            if case_id is not None:
-                queryset = queryset.filter(acase_id__exact=case_id)
-        return queryset
-
 
 ######
 #
@@ -483,157 +639,60 @@ class CommentViewSet(HistoryViewSet):
 ######
 
 
-class DeterminationViewSet(HistoryViewSet):
+class DeterminationViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (Determination,)
     queryset = Determination.objects.all()
     serializer_class = DeterminationSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = DeterminationFilter
 
 
-class SystemUnitViewSet(HistoryViewSet):
+class SystemUnitViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (SystemUnit, SystemUnitType, SystemUnitMap, SystemMap)
+    queryset = SystemUnit.objects.all()
     serializer_class = SystemUnitSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = SystemUnitFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = SystemUnit.objects.all()
-        if self.request:
-            # filter by freetext, case-insensitive contain
-            freetext = self.request.query_params.get('freetext', None)
-            if freetext is not None:
-                queryset = queryset.filter(
-                    Q(system_unit_number__icontains=freetext) |
-                    Q(system_unit_name__icontains=freetext) |
-                    Q(field_office__field_office_number__icontains=freetext) |
-                    Q(system_unit_type__unit_type__icontains=freetext) |
-                    Q(field_office__field_office_name__icontains=freetext))
-        return queryset
 
-
-class SystemUnitTypeViewSet(HistoryViewSet):
+class SystemUnitTypeViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (SystemUnitType,)
     queryset = SystemUnitType.objects.all()
     serializer_class = SystemUnitTypeSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
 
-class SystemUnitProhibitionDateViewSet(HistoryViewSet):
+class SystemUnitProhibitionDateViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (SystemUnitProhibitionDate, SystemUnit)
+    queryset = SystemUnitProhibitionDate.objects.all()
     serializer_class = SystemUnitProhibitionDateSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = SystemUnitProhibitionDateFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = SystemUnitProhibitionDate.objects.all()
-        if self.request:
-            # filter by unit ID, exact
-            unit_id = self.request.query_params.get('unit', None)
-            if unit_id is not None:
-                queryset = queryset.filter(system_unit_id__exact=unit_id)
-            # filter by freetext, case-insensitive contain
-            freetext = self.request.query_params.get('freetext', None)
-            if freetext is not None:  # trying to compare freetext to a formatted prohibition date, not working
-                if '/' in freetext:
-                    # only perform date comparisons if all date parts are integers
-                    isinteger = True
-                    date_parts = freetext.strip('/').split('/')
-                    for date_part in date_parts:
-                        if not date_part.isnumeric() or not float(date_part).is_integer():
-                            isinteger = False
-                    if isinteger:
-                        counter = len(date_parts)
-                        # month
-                        if counter == 1:
-                            month_places = len(date_parts[0])
-                            if month_places <= 2:
-                                queryset = queryset.filter(prohibition_date__month=int(date_parts[0]))
-                            else:
-                                queryset = SystemUnitProhibitionDate.objects.none()
-                        # day
-                        elif counter == 2:
-                            day_places = len(date_parts[1])
-                            if day_places <= 2:
-                                queryset = queryset.filter(
-                                    prohibition_date__month=int(date_parts[0]),
-                                    prohibition_date__day=int(date_parts[1]))
-                            else:
-                                queryset = SystemUnitProhibitionDate.objects.none()
-                        # year
-                        elif counter == 3:
-                            year_places = len(date_parts[2])
-                            year_int = int(date_parts[2])
-                            year_part = None
-                            if year_places == 1:
-                                year_part = 2000 + year_int
-                            elif year_places == 2:
-                                year_part = 1900 + year_int if 99 >= year_int >= 83 else 2000 + year_int
-                            elif year_places == 4:
-                                year_part = year_int
-                            if year_part:
-                                # cannot filter on a three digit year
-                                queryset = queryset.filter(
-                                    prohibition_date__month=int(date_parts[0]),
-                                    prohibition_date__day=int(date_parts[1]),
-                                    prohibition_date__year=year_part)
-                            else:
-                                queryset = SystemUnitProhibitionDate.objects.none()
-                        else:
-                            queryset = SystemUnitProhibitionDate.objects.none()
-                    else:
-                        queryset = SystemUnitProhibitionDate.objects.none()
-                else:
-                    queryset = queryset.filter(system_unit__system_unit_number__icontains=freetext)
-        return queryset
-
 
-class SystemUnitMapViewSet(HistoryViewSet):
+class SystemUnitMapViewSet(ConditionalGetMixin, HistoryViewSet):
+    queryset = SystemUnitMap.objects.all()
     serializer_class = SystemUnitMapSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = SystemUnitMapFilter
 
-    # override the default queryset to allow filtering by URL arguments
-    def get_queryset(self):
-        queryset = SystemUnitMap.objects.all()
-        if self.request:
-            # filter by unit ID, exact
-            unit_id = self.request.query_params.get('unit', None)
-            if unit_id is not None:
-                queryset = queryset.filter(system_unit__exact=unit_id)
-            # filter by map ID, exact
-            map_id = self.request.query_params.get('map', None)
-            if map_id is not None:
-                queryset = queryset.filter(system_map__exact=map_id)
-        return queryset
 
-
-class SystemMapViewSet(HistoryViewSet):
+class SystemMapViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (SystemMap, SystemUnitMap, SystemUnit)
     serializer_class = SystemMapSerializer
     permission_classes = (permissions.IsAuthenticated,)
     filterset_class = SystemMapFilter
 
-    # override the default queryset to allow filtering by URL arguments
+    # override the default queryset (see SystemMapFilter for the filters)
     def get_queryset(self):
         # prefetch_related only the exact, necessary fields to greatly improve the response time of the query
         queryset = SystemMap.objects.all()#.prefetch_related(
             #Prefetch('system_units', queryset=SystemUnit.objects.only('system_unit_number').all())).all()
-        if self.request:
-            # filter by unit ID, exact
-            unit_id = self.request.query_params.get('unit', None)
-            if unit_id is not None:
-                queryset = queryset.filter(system_units__exact=unit_id)
-            # filter by freetext, case-insensitive contain
-            freetext = self.request.query_params.get('freetext', None)
-            if freetext is not None:
-                queryset = queryset.filter(
-                    Q(system_units__system_unit_number__icontains=freetext) |
-                    Q(map_number__icontains=freetext) |
-                    Q(map_title__icontains=freetext) |
-                    Q(effective__icontains=freetext) |
-                    Q(map_date__icontains=freetext))
         return queryset
 
 
-class FieldOfficeViewSet(HistoryViewSet):
+class FieldOfficeViewSet(ConditionalGetMixin, ResponseCacheMixin, HistoryViewSet):
+    cache_models = (FieldOffice,)
     queryset = FieldOffice.objects.all()
     serializer_class = FieldOfficeSerializer
     permission_classes = (permissions.IsAuthenticated,)
@@ -646,11 +705,26 @@ class FieldOfficeViewSet(HistoryViewSet):
 ######
 
 
-class ReportCaseView(generics.ListAPIView):
+class ReportCaseView(ConditionalGetMixin, StreamingCSVMixin, ValuesListMixin, KeysetPaginationMixin, FetchPlanMixin,
+                     SerializeMetricsMixin, generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     pagination_class = StandardResultsSetPagination
     filename = ""
+    filter_backends = [DjangoFilterBackend]
     filterset_class = ReportCaseFilter
+    etag_models = CASE_ETAG_MODELS
+    report_fetch_plan = {
+        'select_related': ('cbrs_unit', 'property', 'determination', 'map_number', 'analyst', 'qc_reviewer',
+                           'created_by', 'modified_by'),
+        'prefetch_related': ('tags', 'comments', 'casefiles'),
+    }
+    fetch_plans = {
+        ReportSerializer: {'select_related': ('property', 'determination')},
+        ReportCasesByUnitSerializer: report_fetch_plan,
+        ReportCasesForUserSerializer: report_fetch_plan,
+        ReportDaysToResolutionSerializer: {'select_related': ('property', 'determination')},
+        ReportDaysToEachStatusSerializer: {'select_related': ('property', 'determination')},
+    }
 
     # override the default renderers to use a custom csv renderer when requested
     # note that these custom renderers have hard-coded field name headers that match the their respective serialzers
@@ -710,11 +784,12 @@ class ReportCaseView(generics.ListAPIView):
     # see https://github.com/mjumbewu/django-rest-framework-csv/issues/15
     def finalize_response(self, request, response, *args, **kwargs):
         response = super(generics.ListAPIView, self).finalize_response(request, response, *args, **kwargs)
-        # join list of tag numbers
-        for item in response.data.get('results'):
-            for key, value in item.items():
-                if isinstance(item[key], list):  # can do this better
-                        item[key] = ', '.join(str(v) for v in value)
+        # join list of tag numbers (streamed responses already joined them while streaming, files have no data)
+        if isinstance(response, Response):
+            for item in response.data.get('results', []):
+                for key, value in item.items():
+                    if isinstance(item[key], list):  # can do this better
+                            item[key] = ', '.join(str(v) for v in value)
         if request and request.accepted_renderer.format == 'csv':
             self.filename += dt.now().strftime("%Y") + '-' + dt.now().strftime("%m") + '-' + dt.now().strftime(
                 "%d") + '.csv'
@@ -722,43 +797,16 @@ class ReportCaseView(generics.ListAPIView):
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return response
 
-    # override the default queryset to allow filtering by URL arguments
+    # override the default queryset to sort by URL arguments (see ReportCaseFilter for the filters)
     def get_queryset(self):
-        queryset = ReportCase.objects.all().order_by('id')
+        queryset = self.apply_fetch_plan(ReportCase.objects.with_status().with_days().order_by('id'))
         if self.request:
-            # filter by CBRS unit IDs, exact list
-            cbrs_unit = self.request.query_params.get('cbrs_unit', None)
-            if cbrs_unit is not None:
-                cbrs_unit_list = cbrs_unit.split(',')
-                queryset = queryset.filter(cbrs_unit__in=cbrs_unit_list).order_by('id')
-            # filter by user
-            user = self.request.query_params.get('user', None)
-            if user is not None:
-                queryset = queryset.filter(
-                    Q(analyst__username__iexact=user) |
-                    Q(qc_reviewer__username__iexact=user))
-                    # Q(comments__comment__icontains=user)) # some comments mention users, but not able to get this returned
-            # filter by range for date field (after only, before only, or between, depending on which URL params appear)
-            report = self.request.query_params.get('report', None)
-            if report is not None and report == 'daystoeachstatus':
-                date_field = self.request.query_params.get('date_field', None)
-                if date_field is not None:
-                    from_date = self.request.query_params.get('from_date', None)
-                    to_date = self.request.query_params.get('to_date', None)
-                    if from_date is not None and to_date is not None:
-                        # the filter below using __range is date-inclusive
-                        # queryset = queryset.filter(report__some_date__range=(from_date, to_date))
-                        # the filter below is date-exclusive
-                        filtergt = date_field + '__gt'
-                        filterlt = date_field + '__lt'
-                        kw_args = {filtergt: from_date, filterlt: to_date}
-                        queryset = queryset.filter(**kw_args)
-                    elif from_date is not None:
-                        filtergt = date_field + '__gt'
-                        queryset = queryset.filter(**{filtergt: from_date})
-                    elif to_date is not None:
-                        filterlt = date_field + '__lt'
-                        queryset = queryset.filter(**{filterlt: to_date})
+            # sort by days to a stage (descending if prefixed with '-'), with cases that have not reached it last
+            sort_by = self.request.query_params.get('sort_by', None)
+            if sort_by is not None and sort_by.lstrip('-') in dict(CASE_DAYS):
+                days = F(sort_by.lstrip('-'))
+                days = days.desc(nulls_last=True) if sort_by.startswith('-') else days.asc(nulls_last=True)
+                queryset = queryset.order_by(days, 'id')
         return queryset
 
 
@@ -791,11 +839,105 @@ class ReportCaseCountView(views.APIView):
             response['Access-Control-Expose-Headers'] = 'Content-Disposition'
         return response
 
+    # override the default renderer context to add the grouping columns to the CSV header
+    def get_renderer_context(self):
+        context = super(ReportCaseCountView, self).get_renderer_context()
+        group_by = self.get_group_by()
+        if group_by is not None:
+            group_field, group_strings = CASE_COUNT_GROUPS[group_by]
+            context['header'] = [group_field] + list(group_strings.keys()) + ReportCaseCountCSVRenderer.header
+        return context
+
+    def get_group_by(self):
+        group_by = self.request.query_params.get('group_by', None) if self.request else None
+        return group_by if group_by in CASE_COUNT_GROUPS else None
+
+    def get(self, request):
+        # the counts are read from the case count rollup table, optionally broken down by unit or fiscal year,
+        # except for the breakdown by analyst, which the rollup does not track and so is counted from the cases
+        group_by = self.get_group_by()
+        if group_by == 'analyst':
+            self.filename += group_by + "_"
+            data = ReportCase.report_case_counts.count_cases_by_status(group_by)
+        elif group_by is not None:
+            self.filename += group_by + "_"
+            data = CaseCountRollup.objects.count_cases_by_status(group_by)
+        else:
+            data = [CaseCountRollup.objects.count_cases_by_status()]
+        return Response(data)
+
+
+class ReportCaseDaysView(views.APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+    filename = "Report_DaysToEachStatusSummary_"
+    filterset_class = ReportCaseDaysFilter
+
+    # override the default renderers to use a custom csv renderer when requested
+    def get_renderers(self):
+        frmt = self.request.query_params.get('format', None) if self.request else None
+        if frmt is not None and frmt == 'csv':
+            renderer_classes = (ReportCaseDaysCSVRenderer,) + tuple(api_settings.DEFAULT_RENDERER_CLASSES)
+        else:
+            renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES)
+        return [renderer_class() for renderer_class in renderer_classes]
+
+    # override the default finalize_response to assign a filename to CSV files
+    # see https://github.com/mjumbewu/django-rest-framework-csv/issues/15
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ReportCaseDaysView, self).finalize_response(request, response, *args, **kwargs)
+        if request and request.accepted_renderer.format == 'csv':
+            self.filename += dt.now().strftime("%Y") + '-' + dt.now().strftime("%m") + '-' + dt.now().strftime(
+                "%d") + '.csv'
+            response['Content-Disposition'] = "attachment; filename=%s" % self.filename
+            response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+    # override the default renderer context to add the grouping columns to the CSV header
+    def get_renderer_context(self):
+        context = super(ReportCaseDaysView, self).get_renderer_context()
+        group_by = self.get_group_by()
+        if group_by is not None:
+            group_field, group_strings = CASE_COUNT_GROUPS[group_by]
+            context['header'] = [group_field] + list(group_strings.keys()) + ReportCaseDaysCSVRenderer.header
+        return context
+
+    def get_group_by(self):
+        group_by = self.request.query_params.get('group_by', None) if self.request else None
+        return group_by if group_by in CASE_COUNT_GROUPS else None
+
     def get(self, request):
-        data = [ReportCase.report_case_counts.count_cases_by_status()]
+        # the count, mean, median, and 90th percentile of the days to each stage, computed in one aggregate query
+        group_by = self.get_group_by()
+        if group_by is not None:
+            self.filename += group_by + "_"
+            data = ReportCase.objects.summarize_days(group_by)
+        else:
+            data = [ReportCase.objects.summarize_days()]
         return Response(data)
 
 
+######
+#
+#  Email Outbox
+#
+######
+
+
+class FinalEmailViewSet(SerializeMetricsMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    This class will return the delivery status of the final emails queued by the send_final_email case action,
+    which are sent in the background by the send_final_emails management command
+    """
+
+    serializer_class = FinalEmailSerializer
+    permission_classes = (IsActive,)
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = FinalEmailFilter
+
+    def get_queryset(self):
+        return FinalEmail.objects.all().order_by('-id')
+
+
 ######
 #
 #  Users
@@ -808,6 +950,10 @@ class UserViewSet(HistoryViewSet):
     serializer_class = UserSerializer
     filterset_class = UserFilter
 
+    # the API tokens (and cached permission flags) of users whose flags or password change, or who are deleted,
+    # are revoked by the user receivers (see receivers.py), so that changes made outside the API revoke them too
+
+    # override the default queryset to hide the admin and public users (see UserFilter for the filters)
     def get_queryset(self):
         if self.request:
             user = self.request.user
@@ -818,45 +964,55 @@ class UserViewSet(HistoryViewSet):
         else:
             # do not return the admin and public users
             queryset = User.objects.all().exclude(id__in=[1, 2])
-            if self.request:
-                # filter by username, exact
-                username = self.request.query_params.get('username', None)
-                if username is not None:
-                    queryset = queryset.filter(username__exact=username)
-                # filter by is_active, exact
-                is_active = self.request.query_params.get('is_active', None)
-                if is_active is not None:
-                    queryset = queryset.filter(is_active__exact=is_active)
-                # filter by current and former active users
-                used_users = self.request.query_params.get('used_users', None)
-                if used_users is not None:
-                    active_users = queryset.filter(is_active__exact=True)
-                    analysts = queryset.filter(analyst__isnull=False).distinct()
-                    qc_reviewers = queryset.filter(qc_reviewer__isnull=False).distinct()
-                    fws_reviewers = queryset.filter(fws_reviewer__isnull=False).distinct()
-                    used_users_chain = list(chain(active_users, analysts, qc_reviewers, fws_reviewers))
-                    used_users_set = set(used_users_chain)
-                    used_users_ids = []
-                    for used_user in used_users_set:
-                        used_users_ids.append(used_user.id)
-                    queryset = queryset.filter(id__in=used_users_ids).extra(order_by=['-is_active', 'username'])
-                # filter by freetext, case-insensitive contain
-                freetext = self.request.query_params.get('freetext', None)
-                if freetext is not None:
-                    queryset = queryset.filter(
-                        Q(first_name__icontains=freetext) |
-                        Q(last_name__icontains=freetext) |
-                        Q(email__icontains=freetext) |
-                        Q(is_active__icontains=freetext) |
-                        Q(is_superuser__icontains=freetext) |
-                        Q(is_staff__icontains=freetext) |
-                        Q(username__icontains=freetext))
+            # list the current and former active users with the active users first
+            if self.request and self.request.query_params.get('used_users', None) is not None:
+                queryset = queryset.order_by('-is_active', 'username')
         return queryset
 
 
+class RequestMetricsView(views.APIView):
+    """
+    This class will return the request metrics (SQL query counts, timings, and latency histogram of each endpoint)
+    collected by the request metrics middleware in this server process, write them to the log when posted to,
+    and clear them when deleted. Only staff users may use it.
+    """
+
+    permission_classes = (IsStaff,)
+
+    def get(self, request):
+        return Response(request_metrics.snapshot())
+
+    def post(self, request):
+        return Response(request_metrics.dump())
+
+    def delete(self, request):
+        request_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class AuthView(views.APIView):
-    authentication_classes = (CustomBasicAuthentication,)
+    """
+    This class will return the user of the Basic credentials along with a new signed API token, which later requests
+    send instead ("Authorization: Token <token>") so that the password is hashed only once per token, and will revoke
+    the API token of the request when deleted
+    """
+
+    authentication_classes = (CustomBasicAuthentication, TokenAuthentication,)
     serializer_class = UserSerializer
 
     def post(self, request):
-        return Response(self.serializer_class(request.user).data)
+        user = request.user
+        if isinstance(request.successful_authenticator, TokenAuthentication):
+            # a token only holds the user's id, username, and flags, so read the rest of the user to refresh it
+            user = User.objects.get(pk=user.pk)
+        data = self.serializer_class(user).data
+        if user.is_authenticated:
+            data.update(issue_token(user))
+        return Response(data)
+
+    def delete(self, request):
+        if not isinstance(request.successful_authenticator, TokenAuthentication):
+            return Response({'detail': 'Only an API token can be revoked.'}, status=status.HTTP_400_BAD_REQUEST)
+        RevokedToken.objects.revoke(request.auth)
+        token_revocations.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
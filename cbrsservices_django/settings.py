@@ -101,12 +101,13 @@ INSTALLED_APPS = [
     'simple_history',
     'rest_framework',
     'corsheaders',
-    'cbrsservices',
+    'cbrsservices.apps.CbrsservicesConfig',
     'django_filters'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'cbrsservices.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -222,10 +223,51 @@ CACHES = {
     }
 }
 
+REST_FRAMEWORK = {
+    # signed API tokens (issued by the authenticate endpoint) are checked first, since they need no password hashing
+    'DEFAULT_AUTHENTICATION_CLASSES': (
+        'cbrsservices.authentication.TokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ),
+}
+
 REST_FRAMEWORK_EXTENSIONS = {
     'DEFAULT_CACHE_RESPONSE_TIMEOUT': 60 * 10,
 }
 
+# add a Server-Timing header (SQL, serialize, app, render, and total milliseconds) to every response (without the
+# content of streamed responses, which is only built after the headers are sent, and is only in the in-process metrics)
+REQUEST_METRICS_SERVER_TIMING = False
+# how often (in seconds) each server process writes its request metrics to the log, or None to only write on request
+REQUEST_METRICS_LOG_INTERVAL = None
+
+# how long (in seconds) each server process caches the active and staff flags the IsActive and IsStaff permissions
+# read from the database, or None to use the flags of the user loaded by the authentication (no extra query)
+PERMISSION_USER_FLAGS_TIMEOUT = None
+
+# how long (in seconds) an API token issued by the authenticate endpoint is valid
+API_TOKEN_MAX_AGE = 60 * 60 * 8
+# how often (in seconds) each server process reads the revoked API tokens again (revocations by other processes wait)
+API_TOKEN_REVOCATION_REFRESH = 30
+
+# the largest page_size a client may request when paging through cases or reports (by page number or keyset)
+PAGINATION_MAX_PAGE_SIZE = 1000
+
+# the cache of rendered final letters (keyed by a hash of their content), or None to render every letter
+FINAL_LETTER_CACHE = 'default'
+# how long (in seconds) a rendered final letter is cached, or None to keep it until the cache evicts it
+FINAL_LETTER_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# the final email outbox worker sends at most this many emails over each email connection
+FINAL_EMAIL_BATCH_SIZE = 50
+# how many times the worker tries to send a final email before marking it failed
+FINAL_EMAIL_MAX_ATTEMPTS = 5
+# how long (in seconds) the worker waits before retrying a failed final email, doubled after each attempt
+FINAL_EMAIL_RETRY_DELAY = 60
+# how long (in seconds) before a final email left sending by a worker that stopped is sent again
+FINAL_EMAIL_SENDING_TIMEOUT = 600
+
 # .txt - text/plain
 # .pdf - application/pdf
 # .doc - application/msword